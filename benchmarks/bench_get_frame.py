@@ -0,0 +1,203 @@
+# coding=utf-8
+
+"""Benchmarks get_frame against a mocked ndicapy, for a range of tool
+counts, reply formats, output formats and smoothing buffer sizes.
+
+Run from the repository root with::
+
+    python -m benchmarks.bench_get_frame --output results.json
+
+Results are written as JSON, one entry per configuration, so that runs
+can be compared.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from time import perf_counter_ns
+from unittest import mock
+
+from numpy import array, percentile
+
+from sksurgerynditracker.nditracker import NDITracker
+from tests.polaris_mocks import patch_polaris, MockNDIDevice, \
+        MockBXFrameSource
+
+_ROM_FILE = os.path.join(os.path.dirname(__file__), '..', 'data',
+                         '8700339.rom')
+
+#: A VER reply with firmware that makes the tracker use TX replies
+_TX_VER_REPLY = 'Freeze Tag: Polaris Spectra Rev 007\n'
+
+DEFAULT_TOOLS = (1, 2, 4, 8, 16, 32, 64)
+DEFAULT_SMOOTHING = (1, 4)
+
+
+class _Patcher:
+    """Gives unittest.mock.patch the interface of pytest-mock's mocker,
+    so the test mocks can be used outside pytest"""
+    def __init__(self, stack):
+        self._stack = stack
+
+    def patch(self, target, *args, **kwargs):
+        """Patches target until the stack is closed"""
+        return self._stack.enter_context(mock.patch(target, *args, **kwargs))
+
+
+@contextlib.contextmanager
+def mock_polaris(tools, reply_format = 'BX', **settings):
+    """
+    Connects an NDITracker to a mock polaris with a number of tools.
+
+    :param tools: the number of tools
+    :param reply_format: 'BX' or 'TX'
+    :param settings: further configuration for the tracker, with
+        underscores for spaces in the keys
+    :return: the tracker, tracking
+    """
+    configuration = {"tracker type" : "polaris",
+                     "romfiles" : [_ROM_FILE] * tools}
+    for key, value in settings.items():
+        configuration[key.replace('_', ' ')] = value
+
+    with contextlib.ExitStack() as stack:
+        patcher = _Patcher(stack)
+        bxsource = MockBXFrameSource()
+        ndidevice = MockNDIDevice()
+        patch_polaris(patcher, bxsource, ndidevice)
+        if reply_format == 'TX':
+            patcher.patch('ndicapy.ndiVER', return_value = _TX_VER_REPLY)
+            patcher.patch('ndicapy.ndiGetTXFrame',
+                          bxsource.mockndiGetBXFrame)
+            patcher.patch('ndicapy.ndiGetTXTransform',
+                          bxsource.mockndiGetBXTransform)
+        tracker = NDITracker(configuration)
+        bxsource.setdevice(ndidevice)
+        tracker.start_tracking()
+        try:
+            yield tracker
+        finally:
+            tracker.stop_tracking()
+            tracker.close()
+
+
+def time_get_frame(tracker, frames):
+    """
+    Times calls to get_frame.
+
+    :return: a dictionary of latency percentiles in microseconds and
+        frames per second
+    """
+    latencies = []
+    start = perf_counter_ns()
+    for _ in range(frames):
+        call_start = perf_counter_ns()
+        tracker.get_frame()
+        latencies.append(perf_counter_ns() - call_start)
+    total = perf_counter_ns() - start
+    latencies = array(latencies) / 1000.0
+    return {'p50 us' : float(percentile(latencies, 50)),
+            'p90 us' : float(percentile(latencies, 90)),
+            'p99 us' : float(percentile(latencies, 99)),
+            'max us' : float(latencies.max()),
+            'frames per second' : frames * 1e9 / total}
+
+
+def measure_allocations(tracker, frames):
+    """
+    Measures memory allocated by get_frame with tracemalloc.
+
+    :return: a dictionary with the peak bytes allocated during a call,
+        and the bytes retained per call
+    """
+    tracemalloc.start()
+    try:
+        tracker.get_frame()
+        baseline, _peak = tracemalloc.get_traced_memory()
+        peak_bytes = 0
+        for _ in range(frames):
+            before, _peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            tracker.get_frame()
+            _current, peak = tracemalloc.get_traced_memory()
+            peak_bytes = max(peak_bytes, peak - before)
+        current, _peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'peak bytes per frame' : peak_bytes,
+            'retained bytes per frame' : (current - baseline) / frames}
+
+
+def run(tools = DEFAULT_TOOLS, reply_formats = ('BX', 'TX'),
+        quaternions = (False, True), smoothing = DEFAULT_SMOOTHING,
+        frames = 1000, warmup = 50, allocation_frames = 50):
+    """
+    Benchmarks every combination of the arguments.
+
+    :return: a list of result dictionaries, one per configuration
+    """
+    # pylint: disable=too-many-positional-arguments
+    results = []
+    for tool_count in tools:
+        for reply_format in reply_formats:
+            for use_quaternions in quaternions:
+                for buffer_size in smoothing:
+                    with mock_polaris(tool_count, reply_format,
+                                      use_quaternions = use_quaternions,
+                                      smoothing_buffer = buffer_size) \
+                            as tracker:
+                        for _ in range(warmup):
+                            tracker.get_frame()
+                        result = {'tools' : tool_count,
+                                  'reply format' : reply_format,
+                                  'quaternions' : use_quaternions,
+                                  'smoothing buffer' : buffer_size}
+                        result.update(time_get_frame(tracker, frames))
+                        result.update(measure_allocations(
+                            tracker, allocation_frames))
+                    results.append(result)
+    return results
+
+
+def main(args = None):
+    """
+    Runs the benchmarks and writes the results as JSON.
+    """
+    parser = argparse.ArgumentParser(
+        description = __doc__.split('\n', maxsplit = 1)[0])
+    parser.add_argument('--tools', type = int, nargs = '+',
+                        default = list(DEFAULT_TOOLS))
+    parser.add_argument('--reply-formats', nargs = '+', default = ['BX', 'TX'],
+                        choices = ['BX', 'TX'])
+    parser.add_argument('--smoothing', type = int, nargs = '+',
+                        default = list(DEFAULT_SMOOTHING))
+    parser.add_argument('--frames', type = int, default = 1000,
+                        help = 'timed calls per configuration')
+    parser.add_argument('--warmup', type = int, default = 50)
+    parser.add_argument('--allocation-frames', type = int, default = 50)
+    parser.add_argument('--output', default = None,
+                        help = 'JSON file to write, defaults to stdout')
+    options = parser.parse_args(args)
+
+    results = {'benchmark' : 'get_frame',
+               'python' : sys.version,
+               'platform' : platform.platform(),
+               'frames' : options.frames,
+               'results' : run(options.tools, options.reply_formats,
+                               (False, True), options.smoothing,
+                               options.frames, options.warmup,
+                               options.allocation_frames)}
+    if options.output is None:
+        json.dump(results, sys.stdout, indent = 2)
+    else:
+        with open(options.output, 'w', encoding = 'utf-8') as output:
+            json.dump(results, output, indent = 2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -46,6 +46,7 @@ setup(
         exclude=[
             'docs',
             'tests',
+            'benchmarks',
         ]
     ),
 
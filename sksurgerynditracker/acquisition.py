@@ -0,0 +1,328 @@
+#  -*- coding: utf-8 -*-
+
+"""Background acquisition of tracking frames from NDI trackers"""
+
+import logging
+import threading
+from time import perf_counter, sleep
+
+from sksurgerynditracker.clock_model import ClockModel, DEFAULT_FRAME_RATE
+
+#: How much earlier, in seconds, a scheduled poll that gets a new frame
+#: makes the next poll
+DUE_STEP = 0.0002
+
+#: The share of scheduled polls that return the last frame again
+DUPLICATE_SHARE = 0.1
+
+#: The weight of each new round trip time in the running average
+_ROUND_TRIP_WEIGHT = 0.1
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class LatestFrameSlot:
+    """
+    Holds the most recently acquired frame. An acquisition thread
+    publishes frames into the slot and readers take the newest frame
+    without waiting for a round trip to the device.
+    """
+    def __init__(self, listeners = None):
+        """
+        :param listeners: an optional list of callables taking no
+            arguments, called on the publishing thread after each frame
+            is published or acquisition fails. The list is not copied,
+            so listeners added to it later are also called. An exception
+            raised by a listener is logged, it does not stop acquisition.
+        """
+        self._condition = threading.Condition()
+        self._frame = None
+        self._publish_time = None
+        self._sequence = 0
+        self._error = None
+        self._listeners = listeners if listeners is not None else []
+
+    def publish(self, frame):
+        """
+        Replaces the frame held in the slot and wakes any waiting readers.
+
+        :param frame: the newly acquired frame
+        """
+        with self._condition:
+            self._frame = frame
+            self._publish_time = perf_counter()
+            self._sequence += 1
+            self._condition.notify_all()
+        self._notify_listeners()
+
+    def fail(self, error):
+        """
+        Records an error raised during acquisition, readers will see it
+        raised on their next read.
+
+        :param error: the exception raised by the acquisition thread
+        """
+        with self._condition:
+            self._error = error
+            self._condition.notify_all()
+        self._notify_listeners()
+
+    def get(self):
+        """
+        Returns the newest frame without blocking.
+
+        :return: frame, age of the frame in seconds, sequence number.
+            frame and age are None if nothing has been published yet.
+        :raises: the exception passed to fail, if acquisition failed
+        """
+        with self._condition:
+            if self._error is not None:
+                raise self._error
+            if self._frame is None:
+                return None, None, 0
+            return (self._frame, perf_counter() - self._publish_time,
+                    self._sequence)
+
+    def wait_for_frame(self, sequence = 0, timeout = None):
+        """
+        Blocks until a frame newer than sequence is published,
+        or acquisition fails.
+
+        :param sequence: the sequence number of the last frame seen
+        :param timeout: maximum time to wait in seconds, None waits forever
+        :return: frame, age of the frame in seconds, sequence number
+        :raises: TimeoutError if no new frame arrives before the timeout
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self._sequence > sequence or
+                    self._error is not None, timeout):
+                raise TimeoutError('Timed out waiting for a tracking frame')
+        return self.get()
+
+    def _notify_listeners(self):
+        for listener in list(self._listeners):
+            try:
+                listener()
+            except Exception: #pylint: disable=broad-except
+                _LOGGER.exception('Frame listener %r failed', listener)
+
+
+class PollScheduler:
+    """
+    Times the polls of an acquisition thread to land just after each new
+    frame is ready on the device. Polling faster than the device's frame
+    rate returns the same frame again, costing a round trip for no new
+    data. The scheduler learns the frame period by fitting a ClockModel
+    to the frame numbers polled, and waits before each poll until the
+    next frame is due.
+
+    When the next frame is due is tracked from the result of each poll.
+    Getting the new frame at the first poll moves the due time earlier
+    by DUE_STEP, getting the same frame again moves it later, and the
+    poll is repeated then. The steps are such that about one poll in
+    DUPLICATE_SHARE returns the same frame, keeping the due time close
+    behind when frames become ready.
+    """
+    def __init__(self, frame_number, frame_rate = DEFAULT_FRAME_RATE):
+        """
+        :param frame_number: a callable taking what a poll returned and
+            returning the device's frame number
+        :param frame_rate: the nominal frame rate of the device in Hz,
+            used until the frame period is learnt
+        """
+        self.clock = ClockModel(frame_rate)
+        self.round_trip = None
+        self.polls = 0
+        self.duplicates = 0
+        self.duplicates_avoided = 0
+        self._frame_number = frame_number
+        self._last_frame = None
+        self._sent = None
+        #when to poll for the frame after the last, and whether the
+        #frame after the last has been polled for already
+        self._due = None
+        self._repeated = False
+
+    def delay(self):
+        """
+        :return: the time in seconds to wait before the next poll, zero
+            until polls have found when a frame became ready
+        """
+        if self._due is None:
+            return 0.0
+        return min(max(self._due - perf_counter(), 0.0), self.clock.period)
+
+    def wait(self, stop_event = None):
+        """
+        Waits until the next poll is due and notes the time it is sent.
+        Each round trip the wait takes is counted as a duplicate frame
+        avoided, as polling straight away would return the last frame.
+
+        :param stop_event: an optional threading.Event that ends the
+            wait early when set
+        :return: the time waited, in seconds
+        """
+        delay = self.delay()
+        if delay > 0.0:
+            if stop_event is None:
+                sleep(delay)
+            else:
+                stop_event.wait(delay)
+            if self.round_trip:
+                self.duplicates_avoided += int(delay / self.round_trip)
+        self._sent = perf_counter()
+        return delay
+
+    def record(self, polled):
+        """
+        Notes the frame returned by a poll, sent after the last wait.
+
+        :param polled: what the poll returned, passed to frame_number
+        """
+        received = perf_counter()
+        self.polls += 1
+        if self._sent is None:
+            self._sent = received
+        round_trip = received - self._sent
+        if self.round_trip is None:
+            self.round_trip = round_trip
+        self.round_trip += _ROUND_TRIP_WEIGHT * (round_trip - self.round_trip)
+
+        frame_number = self._frame_number(polled)
+        if frame_number == self._last_frame:
+            self.duplicates += 1
+            if self._due is not None:
+                self._due += (DUE_STEP * (1.0 - DUPLICATE_SHARE) /
+                              DUPLICATE_SHARE)
+            self._repeated = True
+            return
+
+        if self._due is not None and frame_number < self._last_frame:
+            #the device restarted its frame numbers
+            self._due = None
+        if self._due is not None:
+            if not self._repeated:
+                self._due -= DUE_STEP
+            self._due += (frame_number - self._last_frame) * self.clock.period
+        elif self._repeated:
+            #the frame became ready between the last two polls
+            self._due = self._sent + self.clock.period
+        self._last_frame = frame_number
+        self._repeated = False
+        self.clock.update(frame_number, received)
+
+    def stats(self):
+        """
+        :return: a dictionary of the number of 'polls', the 'duplicates'
+            polled, the 'duplicates avoided' by waiting, the fitted
+            'frame rate' in Hz and the mean 'round trip' in seconds
+        """
+        return {'polls' : self.polls,
+                'duplicates' : self.duplicates,
+                'duplicates avoided' : self.duplicates_avoided,
+                'frame rate' : self.clock.frame_rate,
+                'round trip' : self.round_trip}
+
+
+class AcquisitionThread(threading.Thread):
+    """
+    A daemon thread that calls an acquisition function continuously
+    and publishes each result into a LatestFrameSlot.
+    """
+    def __init__(self, acquire, slot = None, scheduler = None):
+        """
+        :param acquire: a callable taking no arguments that returns a
+            frame, it is called repeatedly on the acquisition thread.
+        :param slot: the slot to publish into, defaults to a new
+            LatestFrameSlot
+        :param scheduler: an optional PollScheduler timing each call of
+            acquire, by default acquire is called again straight away
+        """
+        super().__init__(name = 'NDIAcquisitionThread', daemon = True)
+        self._acquire = acquire
+        self._stop_event = threading.Event()
+        self.slot = slot
+        self.scheduler = scheduler
+        if self.slot is None:
+            self.slot = LatestFrameSlot()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if self.scheduler is not None:
+                self.scheduler.wait(self._stop_event)
+            try:
+                frame = self._acquire()
+            except Exception as error: #pylint: disable=broad-except
+                self.slot.fail(error)
+                return
+            if self.scheduler is not None:
+                self.scheduler.record(frame)
+            self.slot.publish(frame)
+
+    def stop(self, timeout = None):
+        """
+        Asks the thread to stop and waits for the acquisition in
+        progress to complete.
+
+        :param timeout: maximum time to wait for the thread in seconds
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+class BackgroundAcquisition:
+    """
+    Background acquisition for a tracker: runs an AcquisitionThread
+    while tracking, and holds the frame listeners and the optional
+    PollScheduler, which outlive each thread.
+    """
+    def __init__(self, enabled = True, scheduler = None):
+        """
+        :param enabled: whether to acquire in the background at all
+        :param scheduler: an optional PollScheduler timing each poll
+        """
+        self.enabled = enabled
+        self.scheduler = scheduler
+        self.listeners = []
+        self._thread = None
+
+    def start(self, acquire):
+        """
+        Starts an acquisition thread, if enabled.
+
+        :param acquire: the acquisition function, see AcquisitionThread
+        """
+        if not self.enabled:
+            return
+        self._thread = AcquisitionThread(
+            acquire, LatestFrameSlot(self.listeners), self.scheduler)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the acquisition thread, if running.
+        """
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+
+    def is_running(self):
+        """
+        :return: true if an acquisition thread is running
+        """
+        return self._thread is not None
+
+    def read(self):
+        """
+        Returns the newest frame published by the acquisition thread,
+        waiting for the first one if necessary, and its age.
+
+        :return: frame, age of the frame in seconds
+        :raises: any exception raised on the acquisition thread
+        """
+        frame, age, sequence = self._thread.slot.get()
+        if frame is None:
+            frame, age, sequence = self._thread.slot.wait_for_frame(sequence)
+        return frame, age
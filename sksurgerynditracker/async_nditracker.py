@@ -0,0 +1,184 @@
+#  -*- coding: utf-8 -*-
+
+"""An asyncio front end for NDITracker"""
+
+import asyncio
+
+from sksurgerynditracker.nditracker import NDITracker
+
+
+class AsyncNDITracker:
+    """
+    Wraps an NDITracker for use from an asyncio event loop.
+
+    While tracking, frames are acquired by the tracker's background
+    acquisition thread. The thread wakes the event loop when a new frame
+    is published, so get_frame and frames read the newest frame without
+    handing any work to another thread. Only one off commands, such as
+    connecting and starting or stopping tracking, run in an executor.
+
+    Example::
+
+        tracker = AsyncNDITracker(configuration)
+        await tracker.connect()
+        await tracker.start_tracking()
+        async for frame in tracker.frames():
+            port_handles, time_stamps, frame_numbers, tracking, \\
+                    quality = frame
+        await tracker.close()
+    """
+    def __init__(self, configuration, executor = None):
+        """
+        :param configuration: the NDITracker configuration dictionary,
+            background acquisition is always turned on
+        :param executor: the executor to run blocking commands in,
+            defaults to the event loop's default executor
+        """
+        self._configuration = dict(configuration)
+        self._configuration["background acquisition"] = True
+        self._executor = executor
+        self._tracker = None
+        self._loop = None
+        self._new_frame = None
+        self._frames_seen = 0
+
+    @property
+    def tracker(self):
+        """
+        The wrapped NDITracker, None until connect has completed
+        """
+        return self._tracker
+
+    async def connect(self):
+        """
+        Connects to the tracker and enables the tools, without blocking
+        the event loop.
+
+        :raises: as NDITracker
+        """
+        if self._tracker is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._new_frame = asyncio.Event()
+        tracker = await self._run_blocking(NDITracker, self._configuration)
+        tracker.add_frame_listener(self._on_frame)
+        self._tracker = tracker
+
+    async def start_tracking(self):
+        """
+        Tells the tracker to start tracking and starts background
+        acquisition.
+
+        :raises: ValueError if not connected, or as NDITracker
+        """
+        tracker = self._connected_tracker()
+        self._frames_seen = 0
+        await self._run_blocking(tracker.start_tracking)
+
+    async def stop_tracking(self):
+        """
+        Stops background acquisition and tells the tracker to stop
+        tracking.
+
+        :raises: ValueError if not connected, or as NDITracker
+        """
+        try:
+            await self._run_blocking(self._connected_tracker().stop_tracking)
+        finally:
+            self._wake_waiters()
+
+    async def get_frame(self):
+        """
+        Gets the newest frame, waiting for the first frame after tracking
+        has started. When not tracking the tracker is polled in an
+        executor.
+
+        :return: as NDITracker.get_frame
+        :raises: ValueError if not connected, or any error raised on
+            the acquisition thread
+        """
+        tracker = self._connected_tracker()
+        if not tracker.is_acquiring():
+            return await self._run_blocking(tracker.get_frame)
+        if self._frames_seen == 0:
+            await self._wait_for_frame(0)
+        return tracker.get_latest_frame()[0]
+
+    async def frames(self):
+        """
+        An asynchronous iterator of frames while tracking. Each frame is
+        yielded once, if frames are published faster than they are
+        consumed the older ones are skipped. Iteration ends when
+        tracking stops.
+
+        :return: frames, as NDITracker.get_frame
+        :raises: ValueError if not connected, or any error raised on
+            the acquisition thread
+        """
+        tracker = self._connected_tracker()
+        frames_seen = 0
+        while tracker.is_acquiring():
+            frames_seen = await self._wait_for_frame(frames_seen)
+            if not tracker.is_acquiring():
+                return
+            yield tracker.get_latest_frame()[0]
+
+    async def close(self):
+        """
+        Stops tracking if necessary and closes the connection.
+        """
+        if self._tracker is None:
+            return
+        tracker = self._tracker
+        tracker.remove_frame_listener(self._on_frame)
+        try:
+            await self._run_blocking(tracker.close)
+        finally:
+            self._tracker = None
+            self._wake_waiters()
+
+    def get_tool_descriptions(self):
+        """ Returns the port handles and tool descriptions
+
+        :raises: ValueError if not connected
+        """
+        return self._connected_tracker().get_tool_descriptions()
+
+    async def _run_blocking(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, function, *args)
+
+    def _connected_tracker(self):
+        if self._tracker is None:
+            raise ValueError('AsyncNDITracker is not connected')
+        return self._tracker
+
+    async def _wait_for_frame(self, frames_seen):
+        """Waits until more than frames_seen frames have been published,
+        or acquisition stops, and returns the number published"""
+        while (self._frames_seen <= frames_seen and
+               self._tracker is not None and
+               self._tracker.is_acquiring()):
+            await self._new_frame.wait()
+        return self._frames_seen
+
+    def _on_frame(self):
+        """Called on the acquisition thread for each new frame, does
+        nothing once the event loop has closed"""
+        if self._loop.is_closed():
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._notify_frame)
+        except RuntimeError:
+            #the loop closed after the check
+            pass
+
+    def _notify_frame(self):
+        self._frames_seen += 1
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        """Wakes everything waiting on the current event, later waiters
+        wait on a new one"""
+        self._new_frame.set()
+        self._new_frame = asyncio.Event()
@@ -0,0 +1,233 @@
+#  -*- coding: utf-8 -*-
+
+"""Synchronisation of the tracker's clock to the host's clock.
+
+NDI trackers number their frames, counting at a constant rate (60 Hz for
+optical trackers) on the device's own clock. Time stamping a frame with
+the host clock when its reply arrives adds the transport and polling
+latency to it, which varies from frame to frame. A ClockModel fits a
+line to the frame numbers and receive times of recent frames, so each
+frame gets the time it was acquired on the host clock, from its frame
+number, with the jitter removed::
+
+    model = ClockModel(frame_rate = 60.0)
+    acquired, latency = model.update(frame_number, perf_counter())
+
+The slope of the line is the device's frame period in host seconds,
+fitted by least squares after rejecting outliers, and follows any drift
+between the clocks as old frames leave the window. As a reply can not
+arrive before its frame was acquired, the line is placed along the lower
+edge of the receive times, those that arrived most quickly.
+"""
+
+from time import perf_counter, time
+
+from numpy import abs as absolute, empty, median, partition
+
+#: The nominal frame rate of optical trackers, in Hz
+DEFAULT_FRAME_RATE = 60.0
+
+#: The number of frames fitted by default, 20 seconds at 60 Hz
+DEFAULT_WINDOW = 1200
+
+#: Frames fitted before the slope is fitted, rather than taken from the
+#: nominal frame rate
+MIN_FIT_FRAMES = 10
+
+#: Frames between refits of the model, which extrapolates its line in
+#: between, as refitting a full window takes a few hundred microseconds
+REFIT_INTERVAL = 15
+
+#: The percentile of the residuals the line is placed at, the lower edge
+#: of the receive times, allowing for a few early outliers
+ENVELOPE_PERCENTILE = 5.0
+
+#: Scales the median absolute deviation to a standard deviation
+_MAD_SCALE = 1.4826
+
+#: The smallest deviation in seconds outliers are measured against, so
+#: that rounding does not make outliers of perfectly regular frames
+_MIN_DEVIATION = 1e-6
+
+
+def _fit_slope(frame_offsets, time_offsets):
+    """Least squares fit of the slope of time against frame number
+
+    :return: the slope, or None if all the frame numbers are equal
+    """
+    frame_offsets = frame_offsets - frame_offsets.mean()
+    spread = (frame_offsets ** 2).sum()
+    if spread == 0.0:
+        return None
+    return (frame_offsets * (time_offsets - time_offsets.mean())).sum() / spread
+
+
+def _lower_percentile(values, percent):
+    """The value percent of the way through the sorted values, rounding
+    down to the nearest value rather than interpolating"""
+    index = int(percent / 100.0 * (len(values) - 1))
+    return partition(values, index)[index]
+
+
+def _deviations(residuals):
+    return absolute(residuals - median(residuals))
+
+
+class ClockModel:
+    """
+    An online model of the time each tracker frame was acquired on the
+    host clock, fitted to the frame numbers and receive times of the
+    most recent frames.
+    """
+    def __init__(self, frame_rate = DEFAULT_FRAME_RATE,
+                 window = DEFAULT_WINDOW, outlier_threshold = 3.0,
+                 transport_latency = 0.0):
+        """
+        :param frame_rate: the nominal rate in Hz the device's frame
+            number counts at, used until enough frames are fitted
+        :param window: the number of most recent frames fitted
+        :param outlier_threshold: frames whose receive time is further
+            than this many standard deviations from the line are left
+            out of the fit
+        :param transport_latency: the time in seconds from a frame being
+            acquired to the quickest reply arriving, which the host can
+            not measure. Defaults to 0, acquisition times are when the
+            frame could first have been received
+
+        :raises: ValueError if the frame rate is not positive or the
+            window holds fewer than two frames
+        """
+        if frame_rate <= 0.0:
+            raise ValueError('The frame rate must be positive')
+        if window < 2:
+            raise ValueError('A clock model needs a window of at least '
+                             'two frames')
+        self.nominal_period = 1.0 / frame_rate
+        self.outlier_threshold = outlier_threshold
+        self.transport_latency = transport_latency
+        #frame number and receive time of each frame in the window
+        self._samples = empty((window, 2))
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets every frame, as when the frame number jumps backwards
+        because the device restarted.
+        """
+        self._count = 0
+        self._origin = None
+        self.period = self.nominal_period
+        self.jitter = None
+        self.latency = None
+        self.outliers = 0
+
+    @property
+    def frames(self):
+        """
+        The number of frames in the window
+        """
+        return min(self._count, len(self._samples))
+
+    @property
+    def frame_rate(self):
+        """
+        The fitted rate of the device's frame number, in Hz of the host
+        clock
+        """
+        return 1.0 / self.period
+
+    @property
+    def drift(self):
+        """
+        How much faster the device's clock runs than the host's, in
+        parts per million, zero at the nominal frame rate
+        """
+        return (self.nominal_period / self.period - 1.0) * 1e6
+
+    def update(self, frame_number, receive_time):
+        """
+        Adds a frame, refitting the model every REFIT_INTERVAL frames.
+        A frame number already added, as when polling faster than the
+        frame rate, is not added again, as its first receive time was
+        the closest to its acquisition. A frame number lower than the
+        last resets the model.
+
+        :param frame_number: the device's frame number
+        :param receive_time: when the frame was received, in seconds on
+            the host clock, such as time.perf_counter
+        :return: when the frame was acquired on the host clock, and the
+            latency from then until receive_time, in seconds
+        """
+        last_frame = None
+        if self._count > 0:
+            last_frame = self._samples[(self._count - 1) % len(self._samples),
+                                       0]
+            if frame_number < last_frame:
+                self.reset()
+        if frame_number != last_frame:
+            self._samples[self._count % len(self._samples)] = (frame_number,
+                                                               receive_time)
+            self._count += 1
+            if self._count <= MIN_FIT_FRAMES or \
+                    self._count % REFIT_INTERVAL == 0:
+                self._fit(frame_number, receive_time)
+        acquired = self.acquisition_time(frame_number)
+        self.latency = receive_time - acquired
+        return acquired, self.latency
+
+    def acquisition_time(self, frame_number):
+        """
+        :param frame_number: a frame number of the device
+        :return: when the model puts the frame's acquisition on the host
+            clock, in seconds
+        :raises: ValueError if no frames have been added
+        """
+        if self._origin is None:
+            raise ValueError('The clock model has no frames')
+        origin_frame, origin_time = self._origin
+        return (origin_time + (frame_number - origin_frame) * self.period
+                - self.transport_latency)
+
+    def correct(self, frames, receive_time, timestamp):
+        """
+        Adds a decoded frame from a tracker and returns the time it was
+        acquired, on the clock of time.time, as NDITracker time stamps.
+
+        :param frames: the decoded frames in a FRAME_DTYPE array, the
+            newest of their frame numbers is the frame's
+        :param receive_time: when the frame was received, on the clock
+            of time.perf_counter
+        :param timestamp: the time stamp to keep when the frames hold no
+            frame number, as with no tools
+        :return: the corrected time stamp
+        """
+        if len(frames) == 0 or frames['frame_number'].max() <= 0:
+            return timestamp
+        acquired, _latency = self.update(int(frames['frame_number'].max()),
+                                         receive_time)
+        return acquired + time() - perf_counter()
+
+    def _fit(self, newest_frame, newest_time):
+        """Fits the line to the frames in the window, relative to the
+        newest frame to keep the precision of large frame numbers"""
+        samples = self._samples[0:self.frames]
+        frame_offsets = samples[:, 0] - newest_frame
+        time_offsets = samples[:, 1] - newest_time
+        keep = slice(None)
+        self.outliers = 0
+        slope = None
+        if len(samples) >= MIN_FIT_FRAMES:
+            slope = _fit_slope(frame_offsets, time_offsets)
+        if slope is not None:
+            deviations = _deviations(time_offsets - slope * frame_offsets)
+            keep = deviations <= (self.outlier_threshold * _MAD_SCALE *
+                                  max(median(deviations), _MIN_DEVIATION))
+            self.outliers = len(samples) - int(keep.sum())
+            slope = _fit_slope(frame_offsets[keep], time_offsets[keep])
+        if slope is not None and slope > 0.0:
+            self.period = slope
+        residuals = (time_offsets - self.period * frame_offsets)[keep]
+        self._origin = (newest_frame, newest_time +
+                        _lower_percentile(residuals,
+                                          ENVELOPE_PERCENTILE))
+        self.jitter = _MAD_SCALE * median(_deviations(residuals))
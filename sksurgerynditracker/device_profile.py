@@ -0,0 +1,134 @@
+#  -*- coding: utf-8 -*-
+
+"""What a connected NDI device can do, read once when connecting"""
+
+#: Firmware revisions whose BX replies can't be used, so TX is used
+TX_ONLY_FIRMWARE = (' AURORA Rev 007', ' AURORA Rev 008',
+                    ' Polaris Vega 008',
+                    ' Polaris Spectra Rev 006', ' Polaris Spectra Rev 007')
+
+#: Frame rates, in Hz, each type of tracker can be set to
+FRAME_RATES = {'aurora' : (40.0,),
+               'polaris' : (20.0, 30.0, 60.0),
+               'vega' : (60.0,),
+               'dummy' : ()}
+
+#: Reply options, for the BX and TX commands, that the frame decoding
+#: uses. 0x0001 for transforms, 0x0800 to include all port handles
+REPLY_OPTIONS = (0x0001, 0x0800)
+
+_UNKNOWN_FIRMWARE = 'unknown 00.0'
+
+
+class DeviceProfile:
+    """
+    The capabilities of a connected NDI device: its firmware revision,
+    whether it supports binary (BX) and text (TX) replies, its frame
+    rates and the reply options used. Connect time decisions are made
+    from the profile rather than by querying the device again.
+    """
+    # pylint: disable=too-many-positional-arguments
+    def __init__(self, tracker_type, firmware = _UNKNOWN_FIRMWARE,
+                 serial_number = None, supports_bx = None,
+                 supports_tx = True, frame_rates = None,
+                 reply_options = REPLY_OPTIONS, reply_format = None):
+        """
+        :param tracker_type: vega, polaris, aurora or dummy
+        :param firmware: the firmware revision, from the 'Freeze Tag'
+            line of the VER reply
+        :param serial_number: the device serial number, if known
+        :param supports_bx: whether BX replies can be used, defaults to
+            false for firmware in TX_ONLY_FIRMWARE, else true
+        :param supports_tx: whether TX replies can be used
+        :param frame_rates: the frame rates in Hz, defaults to the rates
+            in FRAME_RATES for the tracker type
+        :param reply_options: the reply options used for BX and TX
+        :param reply_format: 'BX' or 'TX', the format chosen by
+            calibrating the reply format, None if not calibrated
+        """
+        self.tracker_type = tracker_type
+        self.firmware = firmware
+        self.serial_number = serial_number
+        if supports_bx is None:
+            supports_bx = firmware not in TX_ONLY_FIRMWARE
+        self.supports_bx = supports_bx
+        self.supports_tx = supports_tx
+        if frame_rates is None:
+            frame_rates = FRAME_RATES.get(tracker_type, ())
+        self.frame_rates = tuple(frame_rates)
+        self.reply_options = tuple(reply_options)
+        self.reply_format = reply_format
+
+    @classmethod
+    def from_version_reply(cls, tracker_type, reply):
+        """
+        Builds a profile from the reply to a VER command.
+
+        :param tracker_type: vega, polaris, aurora or dummy
+        :param reply: the string returned by ndicapy.ndiVER
+        :return: a new DeviceProfile
+        """
+        firmware = _UNKNOWN_FIRMWARE
+        serial_number = None
+        for line in reply.split('\n'):
+            if line.startswith('Freeze Tag:'):
+                firmware = line.split(':')[1]
+            if line.startswith('NDI S/N:'):
+                serial_number = line.split(':')[1].strip()
+        return cls(tracker_type, firmware, serial_number)
+
+    @classmethod
+    def from_dict(cls, profile):
+        """
+        Builds a profile from a dictionary written by to_dict.
+
+        :param profile: the dictionary
+        :return: a new DeviceProfile
+        :raises: KeyError if the dictionary has no tracker type
+        """
+        return cls(profile['tracker type'],
+                   profile.get('firmware', _UNKNOWN_FIRMWARE),
+                   profile.get('serial number'),
+                   profile.get('supports bx'),
+                   profile.get('supports tx', True),
+                   profile.get('frame rates'),
+                   profile.get('reply options', REPLY_OPTIONS),
+                   profile.get('reply format'))
+
+    def to_dict(self):
+        """
+        :return: the profile as a dictionary that can be written as JSON
+        """
+        return {'tracker type' : self.tracker_type,
+                'firmware' : self.firmware,
+                'serial number' : self.serial_number,
+                'supports bx' : self.supports_bx,
+                'supports tx' : self.supports_tx,
+                'frame rates' : list(self.frame_rates),
+                'reply options' : list(self.reply_options),
+                'reply format' : self.reply_format}
+
+    @property
+    def capture_string(self):
+        """
+        The command to capture a frame with, in the format chosen by
+        calibration, else BX where it is supported
+        """
+        reply_format = self.reply_format
+        if reply_format is None:
+            reply_format = 'BX' if self.supports_bx else 'TX'
+        return f'{reply_format}:{self._options():04X}'
+
+    @property
+    def stream_command(self):
+        """
+        The BX command, with the profile's reply options, for a Vega to
+        stream replies to, see VegaStream. Only usable if supports_bx
+        """
+        return f'BX {self._options():04X}'
+
+    def _options(self):
+        options = 0
+        for option in self.reply_options:
+            options |= option
+        return options
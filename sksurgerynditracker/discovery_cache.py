@@ -0,0 +1,193 @@
+#  -*- coding: utf-8 -*-
+
+"""An on disk cache of how NDI devices were last found and configured"""
+
+import json
+import os
+from time import time
+
+from sksurgerynditracker.device_profile import DeviceProfile
+
+_CACHE_VERSION = 1
+
+
+def serial_port_key(port):
+    """
+    Gets the key to cache a serial device under, the USB serial number
+    where there is one, else the port's device name.
+
+    :param port: a pyserial ListPortInfo
+    :return: the key as a string
+    """
+    serial_number = getattr(port, 'serial_number', None)
+    if serial_number:
+        return f'usb:{serial_number}'
+    return f'port:{port.device}'
+
+
+def network_key(ip_address, port):
+    """
+    Gets the key to cache a network device under.
+
+    :param ip_address: the device's ip address
+    :param port: the device's port
+    :return: the key as a string
+    """
+    return f'ip:{ip_address}:{port}'
+
+
+class DiscoveryCache:
+    """
+    Remembers, in a JSON file, the port each device was last found on
+    with its device capability profile, so that reconnecting
+    can try the last known good answer before searching.
+
+    The cache is only an optimisation, a file that is missing, can't be
+    read or can't be written is treated as an empty cache.
+    """
+    def __init__(self, path):
+        """
+        :param path: the path of the cache file, it is created when the
+            first entry is stored
+        """
+        self.path = path
+        self._entries = self._load()
+
+    def get(self, key):
+        """
+        :param key: the key of the device, see serial_port_key and
+            network_key
+        :return: the dictionary stored for the device, or None
+        """
+        return self._entries.get(key)
+
+    def put(self, key, entry):
+        """
+        Stores an entry and writes the cache file.
+
+        :param key: the key of the device
+        :param entry: a dictionary that can be written as JSON, e.g.
+            with the port and device profile
+        """
+        entry = dict(entry)
+        entry['last connected'] = time()
+        self._entries[key] = entry
+        self._save()
+
+    def remove(self, key):
+        """
+        Removes an entry, if present, and writes the cache file.
+
+        :param key: the key of the device
+        """
+        if self._entries.pop(key, None) is not None:
+            self._save()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding = 'utf-8') as cache_file:
+                contents = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(contents, dict) or \
+                contents.get('version') != _CACHE_VERSION:
+            return {}
+        return dict(contents.get('devices', {}))
+
+    def _save(self):
+        """Writes to a temporary file and renames it, so that other
+        processes never read a partly written cache"""
+        temporary_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(temporary_path, 'w', encoding = 'utf-8') as cache_file:
+                json.dump({'version' : _CACHE_VERSION,
+                           'devices' : self._entries},
+                          cache_file, indent = 2)
+            os.replace(temporary_path, self.path)
+        except OSError:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+
+
+class DeviceDiscovery:
+    """
+    How a tracker's device was found and what it can do: the cache key
+    and port it was found on, the cache entry it was found through, how
+    long it took to connect and its DeviceProfile. When there is a
+    DiscoveryCache the profile is remembered in it.
+    """
+    def __init__(self, tracker_type, cache = None):
+        """
+        :param tracker_type: the type of tracker, entries cached for
+            other types are ignored
+        :param cache: an optional DiscoveryCache
+        """
+        self.tracker_type = tracker_type
+        self.cache = cache
+        self.key = None
+        self.port = None
+        self.entry = None
+        self.connect_latency = None
+        self.profile = None
+
+    def cached_entry(self, key):
+        """
+        :param key: the key of a device
+        :return: the entry cached for the device, if it is a device of
+            this tracker type, else None
+        """
+        if self.cache is None:
+            return None
+        entry = self.cache.get(key)
+        if entry is None or entry.get('tracker type') != self.tracker_type:
+            return None
+        return entry
+
+    def found(self, key, port, entry = None):
+        """
+        Notes where the device was found.
+
+        :param key: the key of the device, see serial_port_key and
+            network_key
+        :param port: the serial port name or network port
+        :param entry: the cache entry the device was found through
+        """
+        self.key = key
+        self.port = port
+        self.entry = entry
+
+    def read_profile(self, read_version):
+        """
+        Gets the device's capability profile, from the cache entry if
+        the device was found through one, else from its VER reply.
+        Dummy and replay trackers get a default profile.
+
+        :param read_version: a callable returning the device's VER reply
+        :return: the DeviceProfile, also held in profile
+        """
+        self.profile = None
+        if self.entry is not None and 'profile' in self.entry:
+            try:
+                self.profile = DeviceProfile.from_dict(self.entry['profile'])
+            except (KeyError, TypeError):
+                pass
+        if self.profile is None:
+            if self.tracker_type in ('dummy', 'replay'):
+                self.profile = DeviceProfile(self.tracker_type)
+            else:
+                self.profile = DeviceProfile.from_version_reply(
+                    self.tracker_type, read_version())
+        return self.profile
+
+    def remember(self):
+        """
+        Stores how the device was found and its profile in the cache,
+        if there is one and the device was found on a port.
+        """
+        if self.cache is None or self.key is None:
+            return
+        self.cache.put(self.key, {'tracker type' : self.tracker_type,
+                                  'port' : self.port,
+                                  'profile' : self.profile.to_dict()})
@@ -0,0 +1,2 @@
+# coding=utf-8
+"""Emulated NDI devices, for testing and benchmarking without hardware"""
@@ -0,0 +1,419 @@
+#  -*- coding: utf-8 -*-
+
+"""An emulated NDI device, answering NDI API commands as a tracker would.
+
+The device knows nothing of how commands reach it, transports such as
+emulator.network pass it each command and send back the reply.
+"""
+
+import threading
+from math import cos, pi, sin
+from time import perf_counter
+
+from numpy import zeros
+
+from sksurgerynditracker.frame_decoding import FRAME_DTYPE, STATUS_VALID, \
+        STATUS_MISSING
+from sksurgerynditracker.ndi_protocol import crc16, encode_reply, \
+        pack_bx_reply
+
+#: Error codes sent as ERRORxx replies, from the NDI API guide
+ERROR_INVALID_COMMAND = 0x01
+ERROR_INVALID_CRC = 0x04
+ERROR_PARAMETERS = 0x07
+ERROR_INVALID_PORT_HANDLE = 0x08
+ERROR_INVALID_MODE = 0x0C
+ERROR_NOT_INITIALISED = 0x0E
+ERROR_NO_HANDLES = 0x2D
+
+#: Port status bits, as reported by PHSR, TX and BX
+PORT_OCCUPIED = 0x001
+PORT_INITIALISED = 0x010
+PORT_ENABLED = 0x020
+
+_MAX_PORT_HANDLES = 48
+
+#: Baud rates by the code used for them in COMM commands
+BAUD_RATES = {'0' : 9600, '1' : 14400, '2' : 19200, '3' : 38400,
+              '4' : 57600, '5' : 115200, '6' : 921600, '7' : 1228739,
+              'A' : 230400}
+
+_COMMANDS = ('INIT', 'COMM', 'VER', 'PHSR', 'PHRQ', 'PHF', 'PVWR', 'PINIT',
+             'PENA', 'TSTART', 'TSTOP', 'BX', 'TX')
+
+
+class Stationary:
+    """
+    Motion for a tool that doesn't move.
+    """
+    def __init__(self, translation = (0.0, 0.0, -1000.0),
+                 quaternion = (1.0, 0.0, 0.0, 0.0)):
+        """
+        :param translation: the tool's position in mm
+        :param quaternion: the tool's rotation (qw, qx, qy, qz)
+        """
+        self.pose = (tuple(quaternion), tuple(translation))
+
+    def __call__(self, _time):
+        return self.pose
+
+
+class Circular:
+    """
+    Motion for a tool moving in a circle in the x y plane, turning
+    about z so that it always faces the same way relative to the
+    centre.
+    """
+    def __init__(self, radius = 50.0, period = 2.0,
+                 centre = (0.0, 0.0, -1000.0)):
+        """
+        :param radius: the radius of the circle in mm
+        :param period: the time in seconds to go round once
+        :param centre: the centre of the circle in mm
+        """
+        self.radius = radius
+        self.period = period
+        self.centre = tuple(centre)
+
+    def __call__(self, time):
+        angle = 2.0 * pi * time / self.period
+        return ((cos(angle / 2.0), 0.0, 0.0, sin(angle / 2.0)),
+                (self.centre[0] + self.radius * cos(angle),
+                 self.centre[1] + self.radius * sin(angle), self.centre[2]))
+
+
+class Hidden:
+    """
+    Hides a tool, so it is reported missing, for part of its motion.
+    """
+    def __init__(self, motion, start, end):
+        """
+        :param motion: the motion of the tool when visible
+        :param start: the time in seconds the tool is hidden at
+        :param end: the time in seconds the tool is visible again
+        """
+        self.motion = motion
+        self.start = start
+        self.end = end
+
+    def __call__(self, time):
+        if self.start <= time < self.end:
+            return None
+        return self.motion(time)
+
+
+class EmulatedTool:
+    """
+    A tool seen by an emulated device.
+    """
+    def __init__(self, motion = None, error = 0.1, wired = False):
+        """
+        :param motion: a function of the time in seconds since the
+            device was created, returning the tool's pose as ((qw, qx,
+            qy, qz), (x, y, z)), or None when the tool can't be seen,
+            such as Stationary, Circular or Hidden. Defaults to
+            Stationary(). It must be picklable to use the device in an
+            EmulatorProcess
+        :param error: the RMS error to report
+        :param wired: true for a tool plugged into the device, as on an
+            Aurora, which has a port handle as soon as the device is
+            initialised. Other tools are given a port handle by PHRQ,
+            in order
+        """
+        self.motion = motion if motion is not None else Stationary()
+        self.error = error
+        self.wired = wired
+
+
+class _PortHandle:
+    """The state of one port handle"""
+    def __init__(self, tool):
+        self.tool = tool
+        self.status = PORT_OCCUPIED if tool is not None and tool.wired \
+                else 0
+        self.srom = bytearray()
+        self.freed = False
+
+
+class EmulatedDevice: #pylint: disable=too-many-instance-attributes
+    """
+    The state of an emulated NDI tracker: its port handles, tools and
+    whether it is tracking, changed by the commands passed to execute.
+
+    Supports INIT, COMM, VER, PHSR, PHRQ, PHF, PVWR, PINIT, PENA,
+    TSTART, TSTOP, BX and TX (with reply option 0x0001), which is what
+    NDITracker uses. Frames are numbered at the frame rate from when the
+    device was created, a BX or TX reply holds the newest frame.
+    """
+    # pylint: disable=too-many-positional-arguments
+    def __init__(self, tools = None, frame_rate = 60.0,
+                 firmware = ' Polaris Vega 009',
+                 serial_number = 'P9-00000', clock = perf_counter):
+        """
+        :param tools: a list of EmulatedTool, defaults to one stationary
+            wireless tool
+        :param frame_rate: the frame rate in Hz
+        :param firmware: the firmware revision to report in the
+            'Freeze Tag' line of VER replies, see device_profile
+        :param serial_number: the serial number to report
+        :param clock: a function returning the time in seconds
+        """
+        self.tools = list(tools) if tools is not None else [EmulatedTool()]
+        self.frame_rate = frame_rate
+        self.firmware = firmware
+        self.serial_number = serial_number
+        #: the baud rate set by COMM, for serial transports
+        self.baud_rate = 9600
+        self._clock = clock
+        self._epoch = clock()
+        self._lock = threading.Lock()
+        self._handles = {}
+        self._tracking = False
+        self._init('')
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def is_tracking(self):
+        """
+        :return: true between TSTART and TSTOP
+        """
+        return self._tracking
+
+    def frame_number(self):
+        """
+        :return: the number of the newest frame
+        """
+        return int((self._clock() - self._epoch) * self.frame_rate)
+
+    def time_until_frame(self, frame_number):
+        """
+        :param frame_number: a frame number
+        :return: the time in seconds until the frame is captured, 0 if
+            it already has been
+        """
+        return max(self._epoch + frame_number / self.frame_rate
+                   - self._clock(), 0.0)
+
+    def plug(self, tool):
+        """
+        Plugs in a wired tool, which gets a port handle waiting to be
+        initialised.
+
+        :param tool: the EmulatedTool, with wired true
+        :return: the port handle
+        """
+        with self._lock:
+            self.tools.append(tool)
+            return self._allocate(tool)
+
+    def unplug(self, port_handle):
+        """
+        Unplugs the tool on a port handle, which is then reported as
+        needing to be freed.
+
+        :param port_handle: the port handle
+        :raises: KeyError if there is no such port handle
+        """
+        with self._lock:
+            handle = self._handles[port_handle]
+            self.tools.remove(handle.tool)
+            handle.tool = None
+            handle.status = 0
+            handle.freed = True
+
+    def execute(self, command):
+        """
+        Runs a command, as sent by ndicapy.
+
+        :param command: the command as bytes, with its CRC, if any, and
+            with or without the carriage return
+        :return: the reply as bytes, ready to send
+        """
+        text = command.rstrip(b'\r').decode('ascii', errors = 'replace')
+        name = text
+        for index, character in enumerate(text):
+            if not character.isalnum():
+                name = text[0:index]
+                break
+        arguments = text[len(name) + 1:]
+        if text[len(name):len(name) + 1] == ':':
+            arguments = arguments[0:-4]
+            if f'{crc16(text[0:-4].encode("ascii")):04X}' != \
+                    text[-4:].upper():
+                return encode_reply(_error(ERROR_INVALID_CRC))
+
+        handler = getattr(self, f'_{name.lower()}', None) \
+                if name in _COMMANDS else None
+        if handler is None:
+            return encode_reply(_error(ERROR_INVALID_COMMAND))
+        with self._lock:
+            reply = handler(arguments)
+        if isinstance(reply, str):
+            return encode_reply(reply)
+        return reply
+
+    def _allocate(self, tool):
+        for port_handle in range(1, _MAX_PORT_HANDLES + 1):
+            if port_handle not in self._handles:
+                self._handles[port_handle] = _PortHandle(tool)
+                return port_handle
+        return None
+
+    def _handle(self, arguments):
+        """The port handle named by the first two characters of arguments,
+        or None"""
+        try:
+            return self._handles.get(int(arguments[0:2], 16))
+        except ValueError:
+            return None
+
+    def _init(self, _arguments):
+        self._tracking = False
+        self._handles = {}
+        for tool in self.tools:
+            if tool.wired:
+                self._allocate(tool)
+        return 'OKAY'
+
+    def _comm(self, arguments):
+        baud_rate = BAUD_RATES.get(arguments[0:1])
+        if baud_rate is None:
+            return _error(ERROR_PARAMETERS)
+        self.baud_rate = baud_rate
+        return 'OKAY'
+
+    def _ver(self, _arguments):
+        return (f'Emulated NDI Device\nNDI S/N: {self.serial_number}\n'
+                f'Freeze Tag:{self.firmware}\n'
+                'Freeze Date: 01/01/2024\n')
+
+    def _phsr(self, arguments):
+        option = arguments[0:2] or '00'
+        selected = []
+        for port_handle, handle in sorted(self._handles.items()):
+            status = handle.status
+            if option == '01':
+                chosen = handle.freed
+            elif option == '02':
+                chosen = status & PORT_OCCUPIED and \
+                        not status & PORT_INITIALISED
+            elif option == '03':
+                chosen = status & PORT_INITIALISED and \
+                        not status & PORT_ENABLED
+            elif option == '04':
+                chosen = status & PORT_ENABLED
+            else:
+                chosen = True
+            if chosen:
+                selected.append(f'{port_handle:02X}{status:03X}')
+        return f'{len(selected):02X}' + ''.join(selected)
+
+    def _phrq(self, _arguments):
+        assigned = [handle.tool for handle in self._handles.values()]
+        tool = next((tool for tool in self.tools
+                     if not tool.wired and tool not in assigned), None)
+        port_handle = self._allocate(tool)
+        if port_handle is None:
+            return _error(ERROR_NO_HANDLES)
+        return f'{port_handle:02X}'
+
+    def _phf(self, arguments):
+        handle = self._handle(arguments)
+        if handle is None:
+            return _error(ERROR_INVALID_PORT_HANDLE)
+        del self._handles[int(arguments[0:2], 16)]
+        return 'OKAY'
+
+    def _pvwr(self, arguments):
+        handle = self._handle(arguments)
+        if handle is None:
+            return _error(ERROR_INVALID_PORT_HANDLE)
+        if len(arguments) != 2 + 4 + 128:
+            return _error(ERROR_PARAMETERS)
+        address = int(arguments[2:6], 16)
+        data = bytes.fromhex(arguments[6:])
+        if len(handle.srom) < address + len(data):
+            handle.srom.extend(bytes(address + len(data) - len(handle.srom)))
+        handle.srom[address:address + len(data)] = data
+        handle.status |= PORT_OCCUPIED
+        return 'OKAY'
+
+    def _pinit(self, arguments):
+        handle = self._handle(arguments)
+        if handle is None or not handle.status & PORT_OCCUPIED:
+            return _error(ERROR_INVALID_PORT_HANDLE)
+        handle.status |= PORT_INITIALISED
+        return 'OKAY'
+
+    def _pena(self, arguments):
+        handle = self._handle(arguments)
+        if handle is None:
+            return _error(ERROR_INVALID_PORT_HANDLE)
+        if not handle.status & PORT_INITIALISED:
+            return _error(ERROR_NOT_INITIALISED)
+        handle.status |= PORT_ENABLED
+        return 'OKAY'
+
+    def _tstart(self, _arguments):
+        self._tracking = True
+        return 'OKAY'
+
+    def _tstop(self, _arguments):
+        self._tracking = False
+        return 'OKAY'
+
+    def _frames(self):
+        """The newest frame, for the enabled port handles"""
+        enabled = [(port_handle, handle) for port_handle, handle
+                   in sorted(self._handles.items())
+                   if handle.status & PORT_ENABLED]
+        frames = zeros(len(enabled), dtype = FRAME_DTYPE)
+        frame_number = self.frame_number()
+        time = frame_number / self.frame_rate
+        for row, (port_handle, handle) in enumerate(enabled):
+            frames[row]['port_handle'] = port_handle
+            frames[row]['frame_number'] = frame_number
+            pose = handle.tool.motion(time) if handle.tool else None
+            if pose is None:
+                frames[row]['status'] = STATUS_MISSING
+                continue
+            frames[row]['status'] = STATUS_VALID
+            frames[row]['quaternion'] = pose[0]
+            frames[row]['translation'] = pose[1]
+            frames[row]['error'] = handle.tool.error
+        return frames
+
+    def _bx(self, _arguments):
+        if not self._tracking:
+            return _error(ERROR_INVALID_MODE)
+        return pack_bx_reply(self._frames())
+
+    def _tx(self, _arguments):
+        if not self._tracking:
+            return _error(ERROR_INVALID_MODE)
+        frames = self._frames()
+        reply = f'{len(frames):02X}'
+        for frame in frames:
+            reply += f'{int(frame["port_handle"]):02X}'
+            if frame['status'] == STATUS_VALID:
+                reply += ''.join(f'{round(value * 10000):+06d}'
+                                 for value in frame['quaternion'])
+                reply += ''.join(f'{round(value * 100):+07d}'
+                                 for value in frame['translation'])
+                reply += f'{round(float(frame["error"]) * 10000):+06d}'
+            else:
+                reply += 'MISSING'
+            status = self._handles[int(frame['port_handle'])].status
+            reply += f'{status:08X}{int(frame["frame_number"]):08X}\n'
+        return reply + '0000'
+
+
+def _error(code):
+    return f'ERROR{code:02X}'
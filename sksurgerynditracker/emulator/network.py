@@ -0,0 +1,226 @@
+#  -*- coding: utf-8 -*-
+
+"""A TCP server making an EmulatedDevice look like a network tracker,
+such as a Vega, to ndicapy.ndiOpenNetwork.
+
+Run it on its own to load test or benchmark against, e.g.::
+
+    python -m sksurgerynditracker.emulator.network --port 8765 --tools 4
+"""
+
+import argparse
+import shlex
+import socket
+import threading
+from time import sleep
+
+from sksurgerynditracker.ndi_protocol import encode_reply
+from sksurgerynditracker.emulator.device import EmulatedDevice, \
+        EmulatedTool, Circular
+
+
+class NetworkEmulator: #pylint: disable=too-many-instance-attributes
+    """
+    Serves an EmulatedDevice over TCP, answering each command on the
+    connection it came in on. Any number of connections can be open at
+    once, as NDITracker opens one to check the device is reachable,
+    then one through ndicapy, and one more when streaming.
+
+    Besides the device's commands, STREAM --cmd="<command>" --id=<id>
+    starts sending the reply to the command on the connection once a
+    frame, until USTREAM --id=<id>, as a Vega does.
+    """
+    def __init__(self, device = None, host = '127.0.0.1', port = 0,
+                 latency = 0.0):
+        """
+        :param device: the EmulatedDevice, defaults to one with a single
+            stationary tool
+        :param host: the address to listen on
+        :param port: the port to listen on, 0 to pick a free port
+        :param latency: the time in seconds to wait before sending each
+            reply to a command
+        """
+        self.device = device if device is not None else EmulatedDevice()
+        self.latency = latency
+        self._address = (host, port)
+        self._listener = None
+        self._thread = None
+        self._running = False
+        self._connections = []
+        self._threads = []
+        self._lock = None
+        self.commands_received = 0
+
+    @property
+    def address(self):
+        """
+        The (host, port) the emulator is listening on, once started
+        """
+        return self._address
+
+    def start(self):
+        """
+        Starts listening for connections.
+
+        :return: the (host, port) listened on
+        """
+        self._lock = threading.Lock()
+        self._listener = socket.create_server(self._address)
+        self._address = self._listener.getsockname()[0:2]
+        self._running = True
+        self._thread = threading.Thread(target = self._accept,
+                                        name = 'NDINetworkEmulator',
+                                        daemon = True)
+        self._thread.start()
+        return self._address
+
+    def stop(self):
+        """
+        Stops listening and closes all connections.
+        """
+        if self._listener is None:
+            return
+        self._running = False
+        _shutdown(self._listener)
+        self._listener.close()
+        self._thread.join()
+        with self._lock:
+            connections = list(self._connections)
+            threads = list(self._threads)
+        for connection in connections:
+            _shutdown(connection)
+        for thread in threads:
+            thread.join()
+        self._listener = None
+
+    def _accept(self):
+        while self._running:
+            try:
+                connection, _address = self._listener.accept()
+            except OSError:
+                return
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            thread = threading.Thread(target = self._serve,
+                                      args = (connection,),
+                                      name = 'NDINetworkEmulatorClient',
+                                      daemon = True)
+            with self._lock:
+                self._connections.append(connection)
+                self._threads.append(thread)
+            thread.start()
+
+    def _serve(self, connection):
+        """Answers commands on one connection until it closes"""
+        streams = {}
+        send_lock = threading.Lock()
+        buffer = bytearray()
+        try:
+            while self._running:
+                data = connection.recv(4096)
+                if not data:
+                    break
+                buffer += data
+                while b'\r' in buffer:
+                    end = buffer.index(b'\r') + 1
+                    command = bytes(buffer[0:end])
+                    del buffer[0:end]
+                    self.commands_received += 1
+                    reply = self._answer(command, connection, send_lock,
+                                         streams)
+                    if self.latency > 0:
+                        sleep(self.latency)
+                    with send_lock:
+                        connection.sendall(reply)
+        except OSError:
+            pass
+        finally:
+            for stop in streams.values():
+                stop.set()
+            with self._lock:
+                self._connections.remove(connection)
+            connection.close()
+
+    def _answer(self, command, connection, send_lock, streams):
+        """Gets the reply to a command, starting or stopping streams"""
+        text = command.rstrip(b'\r').decode('ascii', errors = 'replace')
+        name, _, arguments = text.partition(' ')
+        if name not in ('STREAM', 'USTREAM'):
+            return self.device.execute(command)
+
+        options = dict(option.lstrip('-').partition('=')[0::2]
+                       for option in shlex.split(arguments))
+        stream_id = options.get('id', '')
+        if name == 'USTREAM':
+            stop = streams.pop(stream_id, None)
+            if stop is not None:
+                stop.set()
+            return encode_reply('OKAY')
+
+        if 'cmd' not in options or stream_id in streams:
+            return encode_reply('ERROR07')
+        stop = threading.Event()
+        streams[stream_id] = stop
+        threading.Thread(target = self._stream,
+                         args = (options['cmd'].encode('ascii') + b'\r',
+                                 connection, send_lock, stop),
+                         name = 'NDINetworkEmulatorStream',
+                         daemon = True).start()
+        return encode_reply('OKAY')
+
+    def _stream(self, command, connection, send_lock, stop):
+        """Sends the reply to command once a frame until stop is set"""
+        frame_number = self.device.frame_number()
+        while not stop.is_set() and self._running:
+            frame_number = max(frame_number,
+                               self.device.frame_number()) + 1
+            stop.wait(self.device.time_until_frame(frame_number))
+            if stop.is_set():
+                return
+            try:
+                with send_lock:
+                    connection.sendall(self.device.execute(command))
+            except OSError:
+                return
+
+
+def _shutdown(connection):
+    try:
+        connection.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def main(args = None):
+    """
+    Runs a network emulator until interrupted.
+    """
+    parser = argparse.ArgumentParser(
+        description = 'Emulates a network NDI tracker')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8765)
+    parser.add_argument('--tools', type = int, default = 1,
+                        help = 'the number of tools, moving in circles')
+    parser.add_argument('--frame-rate', type = float, default = 60.0)
+    parser.add_argument('--latency', type = float, default = 0.0,
+                        help = 'seconds to wait before each reply')
+    parser.add_argument('--firmware', default = ' Polaris Vega 009')
+    options = parser.parse_args(args)
+
+    tools = [EmulatedTool(Circular(radius = 50.0 + 10.0 * index))
+             for index in range(options.tools)]
+    emulator = NetworkEmulator(
+        EmulatedDevice(tools, options.frame_rate, options.firmware),
+        options.host, options.port, options.latency)
+    host, port = emulator.start()
+    print(f'Emulating an NDI tracker on {host}:{port}, '
+          'interrupt to stop')
+    try:
+        while True:
+            sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    emulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#  -*- coding: utf-8 -*-
+
+"""Running emulated devices in a child process"""
+
+import multiprocessing
+
+
+def _run_emulator(emulator, connection):
+    """Runs in a child process, calling the device's methods as the
+    parent asks, until the parent sends None or closes the connection"""
+    connection.send(emulator.start())
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        name, arguments = message
+        try:
+            result = getattr(emulator.device, name)(*arguments)
+        except Exception as error: #pylint: disable=broad-except
+            result = error
+        connection.send(result)
+    emulator.stop()
+
+
+class EmulatorProcess:
+    """
+    Runs an emulator, such as a NetworkEmulator or SerialEmulator, in
+    a child process.
+
+    ndicapy holds the GIL through some calls that wait for the device,
+    such as ndiProbe and ndiPVWRFromFile, so an emulator in the same
+    process as ndicapy can never answer them. NDITracker should be
+    driven by an emulator in its own process.
+    """
+    def __init__(self, emulator):
+        """
+        :param emulator: the emulator to run, not yet started. It must
+            be picklable, see EmulatedTool
+        """
+        self.emulator = emulator
+        self._process = None
+        self._connection = None
+        self._address = None
+
+    @property
+    def address(self):
+        """
+        Where the emulator can be connected to once started, as
+        returned by its start method
+        """
+        return self._address
+
+    def start(self, timeout = 10.0):
+        """
+        Starts the child process and waits for the emulator to start.
+
+        :param timeout: the longest time to wait in seconds
+        :return: where the emulator can be connected to
+        :raises: IOError if the emulator does not start in time
+        """
+        context = multiprocessing.get_context()
+        self._connection, child_connection = context.Pipe()
+        self._process = context.Process(
+            target = _run_emulator,
+            args = (self.emulator, child_connection), daemon = True)
+        self._process.start()
+        child_connection.close()
+        if not self._connection.poll(timeout):
+            self.stop()
+            raise IOError('The NDI emulator process did not start')
+        self._address = self._connection.recv()
+        return self._address
+
+    def call(self, name, *arguments):
+        """
+        Calls a method of the emulated device in the child process,
+        e.g. call('plug', EmulatedTool(wired = True)).
+
+        :param name: the name of the EmulatedDevice method
+        :param arguments: the arguments, which must be picklable
+        :return: the method's return value
+        :raises: the exception raised by the method
+        """
+        self._connection.send((name, arguments))
+        result = self._connection.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def stop(self, timeout = 5.0):
+        """
+        Stops the emulator and its process.
+
+        :param timeout: the longest time to wait for the process to end
+            before it is terminated
+        """
+        if self._process is None:
+            return
+        try:
+            self._connection.send(None)
+        except OSError:
+            pass
+        self._connection.close()
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._process = None
@@ -0,0 +1,181 @@
+#  -*- coding: utf-8 -*-
+
+"""A pseudo terminal making an EmulatedDevice look like a serial
+tracker, such as a Polaris or Aurora, to ndicapy.ndiProbe and ndiOpen.
+
+POSIX only. Point the tracker's serial port at the emulator's name::
+
+    emulator = EmulatorProcess(SerialEmulator(device))
+    name = emulator.start()
+    tracker = NDITracker({"tracker type" : "aurora",
+                          "serial port" : name})
+"""
+
+import os
+import select
+import termios
+import threading
+from time import perf_counter, sleep
+
+from sksurgerynditracker.emulator.device import EmulatedDevice
+
+#: The number of bits sent for each byte, 8 data bits with one start
+#: and one stop bit
+BITS_PER_BYTE = 10
+
+_TERMIOS_BAUD_RATES = {getattr(termios, f'B{rate}') : rate
+                       for rate in (9600, 19200, 38400, 57600, 115200,
+                                    230400, 921600)
+                       if hasattr(termios, f'B{rate}')}
+
+_HANG_UP = select.POLLHUP | select.POLLERR
+
+
+class SerialEmulator: #pylint: disable=too-many-instance-attributes
+    """
+    Serves an EmulatedDevice on a pseudo terminal. Bytes take as long
+    to arrive as they would at the baud rate the device is set to, so
+    throughput matches a real serial link.
+
+    The device starts at 9600 baud and changes when it is sent COMM.
+    Commands sent while the host's port is set to a different baud
+    rate are garbled on a real link, so they are ignored, and the host
+    times out.
+
+    A pseudo terminal can't carry a serial break, which ndicapy sends
+    to reset a device that doesn't answer. Instead, the device goes
+    back to 9600 baud whenever the host closes the port, as a real
+    device would after ndicapy reset it on reconnecting.
+    """
+    def __init__(self, device = None, latency = 0.0, byte_delay = 0.0,
+                 paced = True):
+        """
+        :param device: the EmulatedDevice, defaults to one with a single
+            stationary tool
+        :param latency: the time in seconds to wait before sending each
+            reply, on top of the time taken to send the command
+        :param byte_delay: extra time in seconds between bytes, e.g. to
+            emulate a slow USB serial adapter
+        :param paced: if false, bytes are not slowed to the baud rate
+        """
+        self.device = device if device is not None else EmulatedDevice()
+        self.latency = latency
+        self.byte_delay = byte_delay
+        self.paced = paced
+        self._master = None
+        self._name = None
+        self._thread = None
+        self._running = False
+        self.commands_received = 0
+        self.commands_ignored = 0
+
+    @property
+    def address(self):
+        """
+        The name of the pseudo terminal to connect to, once started
+        """
+        return self._name
+
+    def start(self):
+        """
+        Creates the pseudo terminal and starts answering commands.
+
+        :return: the name of the pseudo terminal
+        """
+        self._master, slave = os.openpty()
+        self._name = os.ttyname(slave)
+        os.close(slave)
+        self._running = True
+        self._thread = threading.Thread(target = self._serve,
+                                        name = 'NDISerialEmulator',
+                                        daemon = True)
+        self._thread.start()
+        return self._name
+
+    def stop(self):
+        """
+        Stops answering commands and closes the pseudo terminal.
+        """
+        if self._thread is None:
+            return
+        self._running = False
+        self._thread.join()
+        self._thread = None
+        os.close(self._master)
+
+    def byte_time(self, baud_rate = None):
+        """
+        :param baud_rate: the baud rate, defaults to the device's
+        :return: the time in seconds each byte takes to arrive
+        """
+        if baud_rate is None:
+            baud_rate = self.device.baud_rate
+        byte_time = self.byte_delay
+        if self.paced:
+            byte_time += BITS_PER_BYTE / baud_rate
+        return byte_time
+
+    def _host_baud_rate(self):
+        """The baud rate the host has set its end to, or None if it is
+        not one a device can use"""
+        attributes = termios.tcgetattr(self._master)
+        return _TERMIOS_BAUD_RATES.get(attributes[5])
+
+    def _serve(self):
+        poller = select.poll()
+        poller.register(self._master, select.POLLIN)
+        buffer = bytearray()
+        connected = False
+        while self._running:
+            events = poller.poll(100)
+            if not events:
+                continue
+            if events[0][1] & _HANG_UP:
+                if connected:
+                    self.device.baud_rate = 9600
+                    connected = False
+                buffer.clear()
+                sleep(0.01)
+                continue
+            connected = True
+            try:
+                buffer += os.read(self._master, 4096)
+            except OSError:
+                continue
+            while b'\r' in buffer:
+                end = buffer.index(b'\r') + 1
+                command = bytes(buffer[0:end])
+                del buffer[0:end]
+                self._answer(command)
+
+    def _answer(self, command):
+        """Replies to a command, at the device's baud rate"""
+        self.commands_received += 1
+        baud_rate = self.device.baud_rate
+        host_baud_rate = self._host_baud_rate()
+        if host_baud_rate is not None and host_baud_rate != baud_rate:
+            self.commands_ignored += 1
+            return
+        byte_time = self.byte_time(baud_rate)
+        sleep(len(command) * byte_time + self.latency)
+        self._send(self.device.execute(command), byte_time)
+
+    def _send(self, data, byte_time):
+        """Writes data a little at a time, each part no sooner than it
+        would have arrived"""
+        if byte_time <= 0.0:
+            chunk = len(data)
+        else:
+            chunk = max(int(0.001 / byte_time), 1)
+        due = perf_counter()
+        for start in range(0, len(data), chunk):
+            part = data[start:start + chunk]
+            due += len(part) * byte_time
+            delay = due - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            try:
+                while part:
+                    part = part[os.write(self._master, part):]
+            except OSError:
+                return
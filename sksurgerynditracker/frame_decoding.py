@@ -0,0 +1,283 @@
+#  -*- coding: utf-8 -*-
+
+"""Decoding of NDI tracking replies into NumPy arrays"""
+
+from numpy import arange, array, copyto, dtype, empty, full, identity, int32, \
+        int64, isnan, uint8, nan, sqrt, zeros
+
+#: Layout of one decoded tool in a tracking frame. quaternion is
+#: (qw, qx, qy, qz), translation is (x, y, z) and error is the RMS
+#: error reported by the device, used as the tracking quality.
+FRAME_DTYPE = dtype([
+    ('port_handle', int32),
+    ('frame_number', int64),
+    ('quaternion', 'f8', (4,)),
+    ('translation', 'f8', (3,)),
+    ('error', 'f8'),
+    ('status', uint8)])
+
+#: Tool status values held in the status field of FRAME_DTYPE
+STATUS_VALID = 1
+STATUS_MISSING = 2
+STATUS_DISABLED = 4
+
+_STATUS_FROM_REPLY = {"MISSING" : STATUS_MISSING,
+                      "DISABLED" : STATUS_DISABLED}
+
+#: The pose written for tools that are not visible in stacked output
+IDENTITY_QUATERNION_POSE = array([1., 0., 0., 0., 0., 0., 0.])
+IDENTITY_MATRIX_POSE = identity(4)
+
+
+class FrameDecoder:
+    """
+    Decodes the reply to a BX or TX command for every tool into a single,
+    preallocated, NumPy structured array with dtype FRAME_DTYPE.
+    """
+    def __init__(self, tool_descriptors):
+        """
+        :param tool_descriptors: list of tool descriptor dictionaries,
+            each with a "port handle" and a "c_str port handle"
+        """
+        self.port_handles = [descriptor.get("port handle")
+                             for descriptor in tool_descriptors]
+        self._c_str_port_handles = [descriptor.get("c_str port handle")
+                                    for descriptor in tool_descriptors]
+        self.frames = zeros(len(tool_descriptors), dtype = FRAME_DTYPE)
+        #tools without a port handle (e.g. on a dummy tracker) get -1
+        self.frames['port_handle'] = [-1 if port_handle is None
+                                      else port_handle
+                                      for port_handle in self.port_handles]
+        self._transforms = empty((len(tool_descriptors), 8))
+        self._status = self.frames['status']
+        self._frame_numbers = self.frames['frame_number']
+        self.reset()
+
+    def reset(self):
+        """
+        Marks all tools as missing, with NaN poses and tracking quality.
+        """
+        self.frames['frame_number'] = 0
+        self.frames['quaternion'] = nan
+        self.frames['translation'] = nan
+        self.frames['error'] = nan
+        self.frames['status'] = STATUS_MISSING
+
+    def decode(self, device, get_frame, get_transform):
+        """
+        Reads the frame number and transform of every tool from the last
+        reply received by the device, and stores them in self.frames.
+
+        :param device: the ndicapy device the reply was sent to
+        :param get_frame: function returning the frame number of a tool,
+            ndicapy.ndiGetBXFrame or ndicapy.ndiGetTXFrame
+        :param get_transform: function returning the transform of a tool,
+            ndicapy.ndiGetBXTransform or ndicapy.ndiGetTXTransform
+
+        :return: self.frames
+        """
+        transforms = self._transforms
+        for index, port_handle in enumerate(self._c_str_port_handles):
+            self._frame_numbers[index] = get_frame(device, port_handle)
+            qtransform = get_transform(device, port_handle)
+            if isinstance(qtransform, str):
+                self._status[index] = _STATUS_FROM_REPLY.get(
+                    qtransform, STATUS_MISSING)
+                transforms[index] = nan
+            else:
+                self._status[index] = STATUS_VALID
+                transforms[index] = qtransform
+
+        self.frames['quaternion'] = transforms[:, 0:4]
+        self.frames['translation'] = transforms[:, 4:7]
+        self.frames['error'] = transforms[:, 7]
+        return self.frames
+
+
+class FrameBuffer:
+    """
+    Caller owned output arrays for NDITracker.get_frame_into, with one
+    row per tool. Allocate once and pass to every call.
+    """
+    def __init__(self, number_of_tools):
+        """
+        :param number_of_tools: the number of tools being tracked, as
+            returned by NDITracker.get_tool_descriptions
+        """
+        self.port_handles = zeros(number_of_tools, dtype = int32)
+        self.time_stamps = zeros(number_of_tools)
+        self.frame_numbers = zeros(number_of_tools, dtype = int64)
+        self.poses = full((number_of_tools, 7), nan)
+        self.tracking_quality = full(number_of_tools, nan)
+        self.status = zeros(number_of_tools, dtype = uint8)
+        self._rotations = self.poses[:, 0:4]
+        self._translations = self.poses[:, 4:7]
+
+    def fill(self, frames, timestamp):
+        """
+        Copies decoded frames into the buffer without allocating.
+
+        :param frames: an array of FRAME_DTYPE, one element per tool
+        :param timestamp: the host time stamp of the frames
+        """
+        copyto(self.port_handles, frames['port_handle'])
+        self.time_stamps.fill(timestamp)
+        copyto(self.frame_numbers, frames['frame_number'])
+        copyto(self._rotations, frames['quaternion'])
+        copyto(self._translations, frames['translation'])
+        copyto(self.tracking_quality, frames['error'])
+        copyto(self.status, frames['status'])
+
+
+def stack_tracking(tracking, use_quaternions = False):
+    """
+    Stacks a list of per tool tracking arrays, as returned by get_frame,
+    into one contiguous array with a visibility mask.
+
+    :param tracking: list of 4x4 tracking matrices, or of 1x7 quaternion
+        and translation arrays
+    :param use_quaternions: true if tracking holds quaternions
+
+    :return: stacked, an (n_tools, 4, 4) or (n_tools, 7) array, with
+        rows for tools that are not visible set to the identity pose.
+        visible, an (n_tools,) boolean array, false where the tool's
+        tracking contained NaN
+    """
+    pose_shape = (7,) if use_quaternions else (4, 4)
+    stacked = empty((len(tracking),) + pose_shape)
+    for index, pose in enumerate(tracking):
+        stacked[index] = pose.reshape(pose_shape)
+
+    visible = ~isnan(stacked).any(axis = tuple(range(1, stacked.ndim)))
+    if use_quaternions:
+        stacked[~visible] = IDENTITY_QUATERNION_POSE
+    else:
+        stacked[~visible] = IDENTITY_MATRIX_POSE
+    return stacked, visible
+
+
+def stack_frame(frame, use_quaternions = False):
+    """
+    Stacks the tracking of a frame, as returned by get_frame, with
+    stack_tracking.
+
+    :return: the frame with tracking stacked, followed by the visible mask
+    """
+    stacked, visible = stack_tracking(frame[3], use_quaternions)
+    return frame[0:3] + (stacked, frame[4], visible)
+
+
+def quaternions_to_matrices(quaternions, translations, missing_pose = None):
+    """
+    Converts the rotation quaternions and translations of every tool to
+    4x4 matrices at once, giving the same matrices as converting each
+    tool with sksurgerycore's quaternion_to_matrix.
+
+    :param quaternions: (n_tools, 4) array of (qw, qx, qy, qz)
+    :param translations: (n_tools, 3) array of (x, y, z)
+    :param missing_pose: the 4x4 pose written for tools whose quaternion
+        or translation contains NaN, e.g. IDENTITY_MATRIX_POSE. If None
+        their rotation and translation are NaN, as in get_frame
+
+    :return: matrices, an (n_tools, 4, 4) array.
+        visible, an (n_tools,) boolean array, false where the tool's
+        quaternion or translation contained NaN
+    """
+    visible = ~(isnan(quaternions).any(axis = 1) |
+                isnan(translations).any(axis = 1))
+    products = 2.0 * quaternions[:, :, None] * quaternions[:, None, :]
+    matrices = empty((len(quaternions), 4, 4))
+    matrices[:, 0, 0] = 1.0 - products[:, 2, 2] - products[:, 3, 3]
+    matrices[:, 0, 1] = products[:, 1, 2] - products[:, 3, 0]
+    matrices[:, 0, 2] = products[:, 1, 3] + products[:, 2, 0]
+    matrices[:, 1, 0] = products[:, 1, 2] + products[:, 3, 0]
+    matrices[:, 1, 1] = 1.0 - products[:, 1, 1] - products[:, 3, 3]
+    matrices[:, 1, 2] = products[:, 2, 3] - products[:, 1, 0]
+    matrices[:, 2, 0] = products[:, 1, 3] - products[:, 2, 0]
+    matrices[:, 2, 1] = products[:, 2, 3] + products[:, 1, 0]
+    matrices[:, 2, 2] = 1.0 - products[:, 1, 1] - products[:, 2, 2]
+    matrices[:, 0:3, 3] = translations
+    matrices[:, 3, :] = IDENTITY_MATRIX_POSE[3]
+
+    if missing_pose is None:
+        matrices[~visible, 0:3, :] = nan
+    else:
+        matrices[~visible] = missing_pose
+    return matrices, visible
+
+
+def matrices_to_quaternions(matrices):
+    """
+    Converts the rotations of many 4x4 or 3x3 matrices to quaternions at
+    once, the inverse of quaternions_to_matrices.
+
+    :param matrices: (n_tools, 4, 4) or (n_tools, 3, 3) array
+    :return: (n_tools, 4) array of (qw, qx, qy, qz), with qw >= 0, and
+        NaN for matrices containing NaN
+    """
+    rotations = matrices[:, 0:3, 0:3]
+    trace = rotations[:, [0, 1, 2], [0, 1, 2]].sum(axis = 1)
+    #products[:, j, k] is 4 * q_j * q_k, the largest diagonal element
+    #gives the best conditioned row to take the quaternion from
+    products = empty((len(rotations), 4, 4))
+    products[:, 0, 0] = 1.0 + trace
+    for index in range(3):
+        products[:, index + 1, index + 1] = \
+                1.0 + 2.0 * rotations[:, index, index] - trace
+    products[:, 0, 1] = rotations[:, 2, 1] - rotations[:, 1, 2]
+    products[:, 0, 2] = rotations[:, 0, 2] - rotations[:, 2, 0]
+    products[:, 0, 3] = rotations[:, 1, 0] - rotations[:, 0, 1]
+    products[:, 1, 2] = rotations[:, 0, 1] + rotations[:, 1, 0]
+    products[:, 1, 3] = rotations[:, 0, 2] + rotations[:, 2, 0]
+    products[:, 2, 3] = rotations[:, 1, 2] + rotations[:, 2, 1]
+    for row, column in ((0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3)):
+        products[:, column, row] = products[:, row, column]
+
+    best = products[:, [0, 1, 2, 3], [0, 1, 2, 3]].argmax(axis = 1)
+    chosen = products[arange(len(rotations)), best]
+    quaternions = chosen / (2.0 * sqrt(chosen[arange(len(rotations)),
+                                              best]))[:, None]
+    quaternions[quaternions[:, 0] < 0] *= -1.0
+    return quaternions
+
+
+def unsmoothed_frame(port_handles, timestamp, frames, use_quaternions = False,
+                     stacked = False):
+    """
+    Converts decoded frames to a frame as returned by get_frame, for
+    every tool at once, without passing them through the smoothing
+    buffers. With a smoothing buffer of one frame the result is the same.
+
+    :param port_handles: list of port handles, one per tool
+    :param timestamp: the host time stamp of the frames
+    :param frames: an array of FRAME_DTYPE, one element per tool
+    :param use_quaternions: true to return quaternion tracking
+    :param stacked: true to return tracking as one array, followed by
+        the visible mask, as stack_tracking does
+
+    :return: frame, as returned by get_frame
+    """
+    quaternions = frames['quaternion']
+    translations = frames['translation']
+    if use_quaternions:
+        tracking = empty((len(frames), 7))
+        tracking[:, 0:4] = quaternions
+        tracking[:, 4:7] = translations
+        visible = ~isnan(tracking).any(axis = 1)
+        if stacked:
+            tracking[~visible] = IDENTITY_QUATERNION_POSE
+        else:
+            tracking = list(tracking.reshape(len(frames), 1, 7))
+    else:
+        tracking, visible = quaternions_to_matrices(
+            quaternions, translations,
+            IDENTITY_MATRIX_POSE if stacked else None)
+        if not stacked:
+            tracking = list(tracking)
+
+    frame = (list(port_handles), [timestamp] * len(frames),
+             frames['frame_number'].astype(float).tolist(), tracking,
+             frames['error'].tolist())
+    if stacked:
+        return frame + (visible,)
+    return frame
@@ -0,0 +1,192 @@
+#  -*- coding: utf-8 -*-
+
+"""Encoding and decoding of NDI API messages, for connections that
+do not go through ndicapy"""
+
+import struct
+from numpy import nan
+
+from sksurgerynditracker.frame_decoding import STATUS_VALID, \
+        STATUS_MISSING, STATUS_DISABLED
+
+#: The first two bytes of a binary (BX) reply, little endian 0xA5C4
+BX_START_SEQUENCE = b'\xc4\xa5'
+
+#: Length of a BX header, start sequence, reply length and header CRC
+BX_HEADER_LENGTH = 6
+
+#: BX reply option for transforms and status, all that is decoded here
+BX_TRANSFORMS = 0x0001
+
+_BX_HEADER = struct.Struct('<2sHH')
+_BX_TRANSFORM = struct.Struct('<8f')
+_BX_STATUS_AND_FRAME = struct.Struct('<II')
+
+
+def _crc16_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+_CRC16_TABLE = _crc16_table()
+
+
+def crc16(data, crc = 0):
+    """
+    Calculates the CRC used by NDI devices, a CRC16 with polynomial
+    x^16 + x^15 + x^2 + 1.
+
+    :param data: bytes to calculate the CRC of
+    :param crc: a running CRC to continue from
+    :return: the CRC as an int
+    """
+    for byte in data:
+        crc = (crc >> 8) ^ _CRC16_TABLE[(crc ^ byte) & 0xff]
+    return crc
+
+
+def encode_command(command):
+    """
+    Encodes a command for sending to an NDI device. As ndicapy does,
+    a CRC is appended when the command name is followed by a colon.
+
+    :param command: the command string, e.g. 'BX:0801' or 'USTREAM'
+    :return: the encoded command as bytes, terminated by a carriage return
+    """
+    name = command.split(':', 1)[0]
+    encoded = command.encode('ascii')
+    if len(name) < len(command) and name.isalnum():
+        encoded += f'{crc16(encoded):04X}'.encode('ascii')
+    return encoded + b'\r'
+
+
+def encode_reply(reply):
+    """
+    Encodes an ASCII reply as an NDI device sends it, with a CRC and
+    a carriage return.
+
+    :param reply: the reply string, e.g. 'OKAY'
+    :return: the encoded reply as bytes
+    """
+    encoded = reply.encode('ascii')
+    return encoded + f'{crc16(encoded):04X}\r'.encode('ascii')
+
+
+def decode_reply(reply):
+    """
+    Checks the CRC of an ASCII reply and removes it.
+
+    :param reply: the reply as bytes, with or without the carriage return
+    :return: the reply string without CRC
+    :raises: IOError if the CRC does not match
+    """
+    reply = reply.rstrip(b'\r')
+    text, reply_crc = reply[:-4], reply[-4:]
+    if f'{crc16(text):04X}'.encode('ascii') != reply_crc.upper():
+        raise IOError(f'Bad CRC in reply {reply!r}')
+    return text.decode('ascii')
+
+
+def bx_reply_length(header):
+    """
+    Gets the total length of a binary reply from its header.
+
+    :param header: at least the first BX_HEADER_LENGTH bytes of the reply
+    :return: the length of the whole reply in bytes, including the header
+        and the trailing CRC
+    :raises: IOError if the header is not a valid BX header
+    """
+    start, length, header_crc = _BX_HEADER.unpack_from(header)
+    if start != BX_START_SEQUENCE:
+        raise IOError('BX reply does not start with 0xA5C4')
+    if crc16(header[0:4]) != header_crc:
+        raise IOError('Bad CRC in BX reply header')
+    return BX_HEADER_LENGTH + length + 2
+
+
+def parse_bx_reply(reply, frames):
+    """
+    Decodes a BX reply sent with reply option 0x0001 (optionally with
+    0x0800) into a FRAME_DTYPE array.
+
+    :param reply: the complete binary reply, as bytes
+    :param frames: a FRAME_DTYPE array, one element per tool, with the
+        port_handle field set. It is updated in place; tools absent
+        from the reply are marked missing.
+    :return: frames, and the system status from the reply
+    :raises: IOError if the reply is truncated or its CRC is wrong
+    """
+    total_length = bx_reply_length(reply)
+    if len(reply) < total_length:
+        raise IOError('BX reply is truncated')
+    body_crc, = struct.unpack_from('<H', reply, total_length - 2)
+    if crc16(reply[BX_HEADER_LENGTH:total_length - 2]) != body_crc:
+        raise IOError('Bad CRC in BX reply')
+
+    frames['status'] = STATUS_MISSING
+    frames['quaternion'] = nan
+    frames['translation'] = nan
+    frames['error'] = nan
+    rows = {int(port_handle) : row for row, port_handle
+            in enumerate(frames['port_handle'])}
+
+    offset = BX_HEADER_LENGTH
+    handle_count = reply[offset]
+    offset += 1
+    for _ in range(handle_count):
+        port_handle, handle_status = reply[offset], reply[offset + 1]
+        offset += 2
+        row = rows.get(port_handle)
+        if handle_status == STATUS_DISABLED:
+            if row is not None:
+                frames['status'][row] = STATUS_DISABLED
+            continue
+        transform = None
+        if handle_status == STATUS_VALID:
+            transform = _BX_TRANSFORM.unpack_from(reply, offset)
+            offset += _BX_TRANSFORM.size
+        _port_status, frame_number = \
+                _BX_STATUS_AND_FRAME.unpack_from(reply, offset)
+        offset += _BX_STATUS_AND_FRAME.size
+        if row is None:
+            continue
+        frames['frame_number'][row] = frame_number
+        if transform is not None:
+            frames['status'][row] = STATUS_VALID
+            frames['quaternion'][row] = transform[0:4]
+            frames['translation'][row] = transform[4:7]
+            frames['error'][row] = transform[7]
+
+    system_status, = struct.unpack_from('<H', reply, offset)
+    return frames, system_status
+
+
+def pack_bx_reply(frames, system_status = 0):
+    """
+    Encodes a FRAME_DTYPE array as a BX reply with reply option 0x0001,
+    as an NDI device would send it.
+
+    :param frames: a FRAME_DTYPE array, one element per tool
+    :param system_status: the system status to report
+    :return: the binary reply as bytes
+    """
+    body = bytearray([len(frames)])
+    for frame in frames:
+        status = int(frame['status'])
+        body += bytes([int(frame['port_handle']), status])
+        if status == STATUS_DISABLED:
+            continue
+        if status == STATUS_VALID:
+            body += _BX_TRANSFORM.pack(*frame['quaternion'],
+                                       *frame['translation'],
+                                       frame['error'])
+        body += _BX_STATUS_AND_FRAME.pack(0, int(frame['frame_number']))
+    body += struct.pack('<H', system_status)
+
+    header = struct.pack('<2sH', BX_START_SEQUENCE, len(body))
+    header += struct.pack('<H', crc16(header))
+    return header + bytes(body) + struct.pack('<H', crc16(body))
@@ -6,17 +6,32 @@ import sys
 import os
 import contextlib
 
-from platform import system
-from subprocess import call
-from time import time
+from socket import create_connection
+from time import perf_counter
 from serial.tools import list_ports #pylint: disable=import-error
 
 from six import int2byte
-from numpy import full, nan, reshape
 from sksurgerycore.baseclasses.tracker import SKSBaseTracker
 import ndicapy
 from sksurgerynditracker.serial_utils.com_ports import \
-        fix_com_port_greater_than_9
+        fix_com_port_greater_than_9, rank_serial_ports
+from sksurgerynditracker.serial_utils.port_probing import \
+        probe_serial_ports
+from sksurgerynditracker.acquisition import BackgroundAcquisition, \
+        PollScheduler
+from sksurgerynditracker.frame_decoding import FrameDecoder, \
+        stack_frame, unsmoothed_frame
+from sksurgerynditracker.vega_stream import VegaStream
+from sksurgerynditracker.reply_format import ReplyFormat
+from sksurgerynditracker.polling import FramePoller
+from sksurgerynditracker.recording import SessionRecorder
+from sksurgerynditracker.replay import SessionPlayer, PACING_MODES, \
+        PACING_REALTIME
+from sksurgerynditracker.discovery_cache import DiscoveryCache, \
+        DeviceDiscovery, network_key, serial_port_key
+from sksurgerynditracker.clock_model import ClockModel, DEFAULT_FRAME_RATE
+from sksurgerynditracker.timing import StageTimer, STAGE_BUFFER, \
+        STAGE_SMOOTH
 
 @contextlib.contextmanager
 def _open_logging(verbose):
@@ -64,17 +79,26 @@ def _get_serial_port_name(configuration):
         ports_to_probe = min(ports_to_probe, len(serial_ports))
 
         if serial_port is None:
-            for port_no in range(ports_to_probe):
-                name = serial_ports[port_no].device
-                name = fix_com_port_greater_than_9(name)
-
-                result = ndicapy.ndiProbe(name)
-                print("Probing port: ", port_no, " got name: ", name,
-                      " Result: ", result, file=fileout)
-                if result == ndicapy.NDI_OKAY:
+            candidates = rank_serial_ports(
+                serial_ports,
+                configuration.get("serial port allow list", None),
+                configuration.get("serial port deny list", None))
+            candidates = candidates[0:ports_to_probe]
+            ports_to_probe = len(candidates)
+            for rank in sorted({rank for rank, _port in candidates}):
+                names = [fix_com_port_greater_than_9(port.device)
+                         for port_rank, port in candidates
+                         if port_rank == rank]
+                name, timings = probe_serial_ports(
+                    names, configuration.get("probe timeout", 5.0),
+                    configuration.get("probe workers", 1))
+                for port_name, result, seconds in timings:
+                    print("Probing port: ", port_name, " rank: ", rank,
+                          " Result: ", result, f" in {seconds:.3f} s",
+                          file=fileout)
+                if name is not None:
                     break
-            else:
-                # If we did not break from the for loop:
+            if name is None:
                 raise IOError('Could not find any NDI device in '
                     f'{ports_to_probe} serial port candidates checked. '
                     + serial_connection_errmsg)
@@ -105,11 +129,43 @@ def _get_serial_port_name(configuration):
         return name
 
 
+def _check_reachable(ip_address, port, timeout):
+    """
+    Checks that a network device is accepting connections, by opening
+    and closing a TCP connection to it.
+
+    :return: the time taken to connect, in seconds
+    :raises: IOError if the connection fails or times out
+    """
+    start = perf_counter()
+    try:
+        with create_connection((ip_address, port), timeout = timeout):
+            latency = perf_counter() - start
+    except OSError as error:
+        raise IOError(f'Could not find a device at {ip_address}:{port}, '
+                      f'{error}') from error
+    return latency
+
+
+def _frame_rate(setting):
+    """
+    :return: the frame rate in Hz of a setting that is either true, for
+        the default frame rate, or a frame rate
+    """
+    return DEFAULT_FRAME_RATE if setting is True else setting
+
+
+def _newest_frame_number(record):
+    """
+    :return: the newest frame number of a record from _acquire_frame
+    """
+    return max(record[1]['frame_number'], default = 0)
+
+
 class NDITracker(SKSBaseTracker):
     """
-    Class for communication with NDI trackers.
-    Should support Polaris, Aurora,
-    and Vega. Currently only tested with wireless tools on Vega
+    Class for communication with NDI trackers. Should support Polaris,
+    Aurora, and Vega. Currently only tested with wireless tools on Vega
     """
     def __init__(self, configuration):
         """
@@ -117,7 +173,7 @@ class NDITracker(SKSBaseTracker):
 
         :param configuration: A dictionary containing details of the tracker.
 
-            tracker type: vega polaris aurora dummy
+            tracker type: vega polaris aurora dummy replay
 
             ip address:
 
@@ -129,26 +185,120 @@ class NDITracker(SKSBaseTracker):
 
             ports to probe:
 
+            serial port allow list: USB ids of serial ports to probe
+                first, as strings 'vvvv' or 'vvvv:pppp' in hexadecimal.
+                Ports named for NDI, then ports on FTDI and CP210x USB
+                adapters, are probed before other ports anyway
+
+            serial port deny list: USB ids of serial ports never to probe
+
+            probe timeout: the maximum time in seconds to wait for each
+                serial port to answer a probe, defaults to 5. Only
+                enforced with probe workers greater than 1, as probes in
+                this process can not be interrupted, so a port that
+                never answers blocks the search without them
+
+            probe workers: the number of serial ports to probe at once,
+                each in a child process, defaults to 1. Only used from
+                the main thread, and scripts using it must create the
+                tracker under an if __name__ == "__main__": guard
+
             use quaternions: default is false
 
             smoothing buffer: specify a buffer over which to average the
                 tracking, defaults to 1
 
+            background acquisition: if true, a dedicated thread polls the
+                device while tracking and get_frame returns the newest
+                frame without waiting for the device, defaults to false
+
+            poll scheduling: background acquisition only, true, or the
+                device's frame rate in Hz, to time each poll to land just
+                after a new frame is ready rather than polling again
+                straight away, see get_poll_stats. Defaults to false
+
+            stacked output: if true, get_frame returns tracking as a
+                single (n_tools, 4, 4) array, or (n_tools, 7) when using
+                quaternions, followed by a boolean visibility mask,
+                defaults to false
+
+            vega streaming: vega only, if true the Vega streams tracking
+                replies while tracking, rather than being polled for each
+                frame, defaults to false. Streams BX replies, so needs
+                firmware supporting them, and can not be used with
+                calibrate reply format
+
+            stream queue size: the number of streamed frames to hold,
+                older frames are dropped, defaults to 8
+
+            connect timeout: vega only, the time in seconds to wait
+                for the device to accept a connection, defaults to 2
+
+            calibrate reply format: if true, the first time tracking
+                starts frames are captured with both BX and TX replies,
+                and the faster one that decodes consistently is used
+                from then on. Defaults to false, the reply format is
+                chosen from the firmware version
+
+            calibration frames: the number of frames to capture with
+                each reply format when calibrating, defaults to 5
+
+            replay file: replay only, the session file to play back,
+                as written with recording file
+
+            replay pacing: replay only, 'realtime' to play frames with
+                their recorded timing, 'frame number' to play them at
+                replay frame rate by tracker frame number, or 'fast'.
+                Defaults to 'realtime'
+
+            replay frame rate: replay only, the frame rate in Hz for
+                'frame number' pacing, defaults to 60
+
+            replay loop: replay only, if true the session repeats,
+                else IOError is raised at its end. Defaults to false
+
+            recording file: the path of a file to record every frame
+                of tracking data to, see recording.SessionRecorder.
+                Defaults to None, no recording
+
+            discovery cache: the path of a JSON file in which to remember
+                the port each device was found on, with its capability
+                profile. When set, reconnecting tries the remembered
+                serial port before searching, and reuses the remembered
+                profile. Defaults to None, no cache
+
+            timing stats: if true, time each stage of getting a frame,
+                see get_timing_stats. Defaults to false
+
+            clock model: true, or the device's frame rate in Hz, to time
+                stamp frames from their frame numbers, see get_clock_model.
+                Defaults to false
+
         :raises Exception: IOError, KeyError, OSError
         """
         self._device = None
         self._tool_descriptors = []
         self._tracker_type = None
         self._state = None
+        self._poller = None
 
-        self._get_frame = None
-        self._get_transform = None
-        self._capture_string = None
+        scheduler = None
+        if configuration.get("poll scheduling", False):
+            scheduler = PollScheduler(_newest_frame_number,
+                _frame_rate(configuration.get("poll scheduling")))
+        self._acquisition = BackgroundAcquisition(
+            configuration.get("background acquisition", False), scheduler)
+        self._stacked_output = configuration.get("stacked output", False)
 
         self._configure(configuration)
+        cache = None
+        if configuration.get("discovery cache", None) is not None:
+            cache = DiscoveryCache(configuration.get("discovery cache"))
+        self._discovery = DeviceDiscovery(self._tracker_type, cache)
 
         super().__init__(configuration, tracked_objects = None)
 
+        player = None
         if self._tracker_type == "vega":
             self._connect_vega(configuration)
 
@@ -161,69 +311,162 @@ class NDITracker(SKSBaseTracker):
         if self._tracker_type == "dummy":
             self._device = True
 
+        if self._tracker_type == "replay":
+            player = self._connect_replay(configuration)
+
         self._initialise_ports()
         self._enable_tools()
-        self._get_firmware_version()
-        self._set_use_bx_transforms()
+        self._discovery.read_profile(
+            lambda: ndicapy.ndiVER(self._device, 0))
+        self._poller = self._create_poller(configuration, player)
+        self._discovery.remember()
         self._state = 'ready'
 
-    def _set_use_bx_transforms(self):
-        """
-        We'd like to use BX transforms as this sends binary
-        tracking data, so should be faster, however for
-        certain devices we can't do this. Here we check the
-        firmware version and set _use_bx_transforms to suit.
+    def _create_poller(self, configuration, player):
         """
-        self._get_frame = getattr(ndicapy, 'ndiGetBXFrame')
-        self._get_transform = getattr(ndicapy, 'ndiGetBXTransform')
-        self._capture_string = 'BX:0801'
+        Creates the FramePoller getting each frame of tracking data,
+        with the reply format of the device profile.
 
-        firmware = self._get_firmware_version()
-        if firmware in (' AURORA Rev 007', ' AURORA Rev 008',
-                        ' Polaris Vega 008',
-                        ' Polaris Spectra Rev 006', ' Polaris Spectra Rev 007'):
-            self._get_frame = getattr(ndicapy, 'ndiGetTXFrame')
-            self._get_transform = getattr(ndicapy, 'ndiGetTXTransform')
-            self._capture_string = 'TX:0801'
-
-    def _get_firmware_version(self):
+        :param player: the SessionPlayer of a replay tracker, else None
+        :return: a FramePoller
         """
-        Gets the device's firmware version, and sets
-        self._device_firmware_version
+        device = None
+        calibration_frames = None
+        if self._tracker_type not in ("dummy", "replay"):
+            device = self._device
+            if configuration.get("calibrate reply format", False):
+                calibration_frames = configuration.get("calibration frames",
+                                                       5)
+        decoder = FrameDecoder(self._tool_descriptors)
+        if self._tracker_type == "dummy":
+            decoder.frames['error'] = 0.0
+        poller = FramePoller(
+            device, decoder,
+            ReplyFormat(self._discovery.profile.capture_string,
+                        calibration_frames),
+            player = player)
+
+        if configuration.get("vega streaming", False):
+            if not self._discovery.profile.supports_bx:
+                raise ValueError("vega streaming needs BX replies, which "
+                                 "this Vega's firmware does not support")
+            poller.stream = VegaStream(configuration.get("ip address"),
+                                       configuration.get("port"),
+                                       decoder.frames,
+                                       configuration.get("stream queue size",
+                                                         8),
+                                       self._discovery.profile.stream_command)
+        if configuration.get("timing stats", False):
+            poller.timing = StageTimer()
+        if configuration.get("clock model", False):
+            poller.clock = ClockModel(
+                _frame_rate(configuration.get("clock model")))
+        if configuration.get("recording file", None) is not None:
+            port_handles, descriptions = self.get_tool_descriptions()
+            poller.recorder = SessionRecorder(
+                configuration.get("recording file"), port_handles,
+                descriptions, {'tracker type' : self._tracker_type})
+            poller.recorder.start()
+        return poller
+
+    def _calibrate_reply_format(self):
         """
-
-        device_firmware_version = 'unknown 00.0'
-
-        if self._tracker_type != 'dummy':
-            device_info = ndicapy.ndiVER(self._device, 0).split('\n')
-            for line in device_info:
-                if line.startswith('Freeze Tag:'):
-                    device_firmware_version = line.split(':')[1]
-        return device_firmware_version
+        Chooses between BX and TX replies by measuring them. The device
+        profile records the choice only when it rests on a format failing
+        or on replies that agreed, not when they disagreed or could not
+        be compared.
+        """
+        calibration = self._poller.calibrate_reply_format()
+        if calibration['consistent'] or calibration['BX'] is None or \
+                calibration['TX'] is None:
+            profile = self._discovery.profile
+            profile.supports_bx = calibration['BX'] is not None
+            profile.supports_tx = calibration['TX'] is not None
+            profile.reply_format = calibration['capture string'][0:2]
+            self._discovery.remember()
 
     def _connect_vega(self, configuration):
         self._connect_network(configuration)
         self._read_sroms_from_file()
 
     def _connect_polaris(self, configuration):
-        name = _get_serial_port_name(configuration)
+        name = self._find_serial_port(configuration)
         self._connect_serial(name)
         self._read_sroms_from_file()
 
     def _connect_aurora(self, configuration):
-        name = _get_serial_port_name(configuration)
+        name = self._find_serial_port(configuration)
         self._connect_serial(name)
         self._find_wired_ports()
 
+    def _find_serial_port(self, configuration):
+        """
+        Finds the serial port of the device, trying the port remembered
+        in the discovery cache before searching all ports.
+
+        :return: the name of the port
+        :raises: IOError if port not found or port probe fails
+        """
+        name = self._find_cached_serial_port(configuration)
+        if name is not None:
+            return name
+
+        name = _get_serial_port_name(configuration)
+        if self._discovery.cache is not None:
+            key = f'port:{name}'
+            for port in list_ports.comports():
+                if fix_com_port_greater_than_9(port.device) == name:
+                    key = serial_port_key(port)
+            self._discovery.found(key, name)
+        return name
+
+    def _find_cached_serial_port(self, configuration):
+        """
+        Probes the serial ports of devices in the discovery cache.
+
+        :return: the name of a port that answered, or None
+        """
+        if self._discovery.cache is None or \
+                configuration.get("serial port", None) is not None:
+            return None
+
+        keys_tried = set()
+        with _open_logging(configuration.get('verbose', False)) as fileout:
+            for port in list_ports.comports():
+                key = serial_port_key(port)
+                entry = self._discovery.cached_entry(key)
+                if entry is None or key in keys_tried:
+                    continue
+                keys_tried.add(key)
+                name = fix_com_port_greater_than_9(port.device)
+                found, timings = probe_serial_ports(
+                    [name], configuration.get("probe timeout", 5.0),
+                    configuration.get("probe workers", 1))
+                for port_name, result, seconds in timings:
+                    print("Probing cached port: ", port_name,
+                          " Result: ", result, f" in {seconds:.3f} s",
+                          file=fileout)
+                if found is not None:
+                    self._discovery.found(key, name, entry)
+                    return name
+                self._discovery.cache.remove(key)
+        return None
+
     def _connect_network(self, configuration):
-        #try and ping first to save time with timeouts
-        param = '-n' if system().lower() == 'windows' else '-c'
+        #check the port is open first to save time with timeouts
         ip_address = configuration.get("ip address")
         port = configuration.get("port")
-        if call(['ping', param, '1', ip_address]) == 0:
-            self._device = ndicapy.ndiOpenNetwork(ip_address, port)
-        else:
-            raise IOError(f'Could not find a device at {ip_address}')
+        key = network_key(ip_address, port)
+        entry = self._discovery.cached_entry(key)
+        self._discovery.found(key, port, entry)
+        try:
+            self._discovery.connect_latency = _check_reachable(
+                ip_address, port, configuration.get("connect timeout", 2.0))
+        except IOError:
+            if entry is not None:
+                self._discovery.cache.remove(key)
+            raise
+        self._device = ndicapy.ndiOpenNetwork(ip_address, port)
         if not self._device:
             raise IOError('Could not connect to network NDI device'
                           f'at {ip_address}')
@@ -259,15 +502,26 @@ class NDITracker(SKSBaseTracker):
             raise KeyError("Configuration must contain 'Tracker type'")
 
         tracker_type = configuration.get("tracker type")
-        if tracker_type in ("vega", "polaris", "aurora", "dummy"):
+        if tracker_type in ("vega", "polaris", "aurora", "dummy", "replay"):
             self._tracker_type = tracker_type
         else:
             raise ValueError(
                 "Supported trackers are 'vega', 'aurora', 'polaris', "
-                "and 'dummy'")
+                "'dummy' and 'replay'")
 
         if self._tracker_type == "vega":
             self._check_config_vega(configuration)
+        elif configuration.get("vega streaming", False):
+            raise ValueError("vega streaming is only supported by 'vega' "
+                             "trackers")
+        if configuration.get("vega streaming", False) and \
+                configuration.get("calibrate reply format", False):
+            raise ValueError("vega streaming always streams BX replies, so "
+                             "can not be used with calibrate reply format")
+        if configuration.get("poll scheduling", False) and \
+                not configuration.get("background acquisition", False):
+            raise ValueError("poll scheduling is only supported with "
+                             "background acquisition")
 
         if self._tracker_type == "polaris":
             self._check_config_polaris(configuration)
@@ -278,6 +532,9 @@ class NDITracker(SKSBaseTracker):
         if self._tracker_type == "dummy":
             self._check_config_dummy(configuration)
 
+        if self._tracker_type == "replay":
+            self._check_config_replay(configuration)
+
     def _check_config_vega(self, configuration):
         """
         Internal function to check configuration of a polaris vega
@@ -318,6 +575,35 @@ class NDITracker(SKSBaseTracker):
                     raise FileNotFoundError(f"ROM file '{romfile}' not found.")
                 self._tool_descriptors.append({"description" : romfile})
 
+    def _check_config_replay(self, configuration):
+        """
+        Internal function to check configuration of a replay tracker
+        """
+        if not "replay file" in configuration:
+            raise KeyError("Configuration for replay must contain"
+                           "'replay file'")
+        if configuration.get("replay pacing",
+                             PACING_REALTIME) not in PACING_MODES:
+            raise ValueError(f"replay pacing must be one of {PACING_MODES}")
+
+    def _connect_replay(self, configuration):
+        """
+        Opens the session file to replay.
+
+        :return: the SessionPlayer
+        """
+        player = SessionPlayer(
+            configuration.get("replay file"),
+            configuration.get("replay pacing", PACING_REALTIME),
+            configuration.get("replay frame rate", 60.0),
+            configuration.get("replay loop", False))
+        for port_handle, description in zip(player.port_handles,
+                                            player.descriptions):
+            self._tool_descriptors.append({"description" : description,
+                                           "port handle" : port_handle})
+        self._device = True
+        return player
+
     def close(self):
         """
         Closes the connection to the NDI Tracker and
@@ -339,6 +625,7 @@ class NDITracker(SKSBaseTracker):
 
         self._device = None
         self._state = None
+        self._poller.close()
 
     def _read_sroms_from_file(self):
         if not self._device:
@@ -379,7 +666,7 @@ class NDITracker(SKSBaseTracker):
         if not self._device:
             raise ValueError('init ports called with no NDI device')
 
-        if not self._tracker_type == "dummy":
+        if self._tracker_type not in ("dummy", "replay"):
             ndicapy.ndiCommand(self._device, 'PHSR:02')
             for tool in self._tool_descriptors:
                 ndicapy.ndiCommand(self._device,
@@ -413,7 +700,7 @@ class NDITracker(SKSBaseTracker):
         if not self._device:
             raise ValueError('enable tools called with no NDI device')
 
-        if not self._tracker_type == "dummy":
+        if self._tracker_type not in ("dummy", "replay"):
             ndicapy.ndiCommand(self._device, "PHSR:03")
             number_of_tools = ndicapy.ndiGetPHSRNumberOfHandles(self._device)
             for tool_index in range(number_of_tools):
@@ -453,6 +740,11 @@ class NDITracker(SKSBaseTracker):
 
             tracking_quality : list the tracking quality, one per tool.
 
+            visible : only returned when stacked output is configured,
+            in which case tracking is one (n_tools, 4, 4) or (n_tools, 7)
+            array. An (n_tools,) boolean array, false for tools that are
+            not visible, whose rows of tracking hold the identity pose.
+
         Note: The time stamp is based on the host computer clock. Read the
         following extract from NDI's API Guide for advice on what to use:
         "Use the frame number, and not the host computer clock, to identify when
@@ -461,50 +753,190 @@ class NDITracker(SKSBaseTracker):
         replies from the system assumes that the duration of time between raw
         data collection and when the reply is received by the host computer is
         constant. This is not necessarily the case."
+
+        If background acquisition is enabled and the tracker is tracking,
+        the newest frame acquired by the background thread is returned.
         """
-        port_handles = []
-        time_stamps = []
-        frame_numbers = []
-        tracking_rots = []
-        tracking_trans = []
-        tracking_quality = []
-
-        timestamp = time()
-        if not self._tracker_type == "dummy":
-            ndicapy.ndiCommand(self._device, self._capture_string)
-            for descriptor in self._tool_descriptors:
-                port_handles.append(descriptor.get("port handle"))
-                time_stamps.append(timestamp)
-                frame_numbers.append(self._get_frame(
-                    self._device,
-                    descriptor.get("c_str port handle")))
-                qtransform = self._get_transform(
-                    self._device,
-                    descriptor.get("c_str port handle"))
-                if not qtransform == "MISSING" and not qtransform == "DISABLED":
-                    tracking_quality.append(qtransform[7])
-                    transform = reshape(qtransform[0:7], [1, 7])
-                else:
-                    tracking_quality.append(nan)
-                    transform = full((1, 7), nan)
+        frame, _age = self.get_latest_frame()
+        return frame
+
+    def get_latest_frame(self):
+        """Gets the newest frame of tracking data together with its age.
+
+        With background acquisition running this returns immediately with
+        the newest frame published by the acquisition thread, waiting only
+        if no frame has been acquired yet. Otherwise the device is polled
+        and the age is zero.
+
+        :return: frame, as returned by get_frame, and the time in seconds
+            since the frame was acquired.
+
+        :raises: any exception raised while acquiring the frame
+        """
+        if self._acquisition.is_running():
+            (_timestamp, _frames, frame), age = self._acquisition.read()
+            return frame, age
+
+        timestamp, frames = self._poll_frame()
+        return self._smooth_frame(timestamp, frames), 0.0
+
+    def get_device_profile(self):
+        """
+        :return: the DeviceProfile of the connected device, with its
+            firmware revision, reply formats and frame rates
+        """
+        return self._discovery.profile
+
+    def get_reply_calibration(self):
+        """
+        :return: the result of calibrating the reply format, a dictionary
+            with the mean capture time in seconds of 'BX' and 'TX'
+            (None for a format that failed), whether they were
+            'consistent' and the chosen 'capture string'. None if the
+            reply format has not been calibrated
+        """
+        return self._poller.reply.calibration
+
+    def get_connect_latency(self):
+        """
+        :return: the time in seconds a network device took to accept a
+            TCP connection when connecting, or None for other devices
+        """
+        return self._discovery.connect_latency
+
+    def get_timing_stats(self, reset = False):
+        """
+        Gets the time spent in each stage of getting a frame, see
+        sksurgerynditracker.timing.STAGES.
+
+        :param reset: if true, the counts are cleared after reading
+        :return: a dictionary of TimingHistogram.stats by stage, or None
+            unless timing stats were enabled in the configuration
+        """
+        timing = self._poller.timing
+        if timing is None:
+            return None
+        stats = timing.stats()
+        if reset:
+            timing.reset()
+        return stats
+
+    def get_clock_model(self):
+        """
+        :return: the ClockModel correcting time stamps, with the latency
+            of the newest frame, or None unless configured
+        """
+        return self._poller.clock
+
+    def get_poll_stats(self):
+        """
+        Gets how many polls of the device the poll scheduler made, and
+        how many duplicate frames it avoided polling.
+
+        :return: a dictionary of PollScheduler.stats, or None unless
+            poll scheduling was enabled in the configuration
+        """
+        if self._acquisition.scheduler is None:
+            return None
+        return self._acquisition.scheduler.stats()
 
-                tracking_rots.append(transform[0][0:4])
-                tracking_trans.append(transform[0][4:7])
+    def add_frame_listener(self, listener):
+        """Registers a callable to be called, with no arguments, each time
+        the background acquisition thread publishes a new frame or fails.
+        Listeners run on the acquisition thread so should return quickly.
+
+        :param listener: the callable to add
+        """
+        self._acquisition.listeners.append(listener)
+
+    def remove_frame_listener(self, listener):
+        """Removes a listener added with add_frame_listener.
+
+        :param listener: the callable to remove
+        :raises: ValueError if the listener was not added
+        """
+        self._acquisition.listeners.remove(listener)
+
+    def is_acquiring(self):
+        """
+        :return: true if a background acquisition thread is running
+        """
+        return self._acquisition.is_running()
+
+    def get_frame_into(self, out):
+        """Writes the newest frame of tracking data into caller owned
+        arrays, so that repeated calls allocate no new arrays.
+
+        The frame is not passed through the smoothing buffers. Poses are
+        written as quaternions (qw, qx, qy, qz) followed by the
+        translation (x, y, z), with NaN for tools that are not visible.
+
+        :param out: a FrameBuffer with one row per tool, see
+            sksurgerynditracker.frame_decoding.FrameBuffer
+
+        :return: out
+
+        :raises: ValueError if out does not have one row per tool
+        """
+        if len(out.port_handles) != len(self._tool_descriptors):
+            raise ValueError(f'get_frame_into needs a FrameBuffer for '
+                             f'{len(self._tool_descriptors)} tools, got '
+                             f'{len(out.port_handles)}')
+
+        if self._acquisition.is_running():
+            (timestamp, frames, _frame), _age = self._acquisition.read()
         else:
-            for descriptor in self._tool_descriptors:
-                port_handles.append(descriptor.get(
-                    "port handle"))
-                time_stamps.append(timestamp)
-                frame_numbers.append(0)
-                tracking_quality.append(0.0)
-                tracking_rots.append(full((1, 4), nan))
-                tracking_trans.append(full((1, 3), nan))
+            timestamp, frames = self._poll_frame()
 
-        self.add_frame_to_buffer(port_handles, time_stamps, frame_numbers,
-            tracking_rots, tracking_trans, tracking_quality,
-            rot_is_quaternion = True)
+        out.fill(frames, timestamp)
+        return out
 
-        return self.get_smooth_frame(port_handles)
+    def _acquire_frame(self):
+        """
+        Polls the device and smooths the result. Run on the acquisition
+        thread, the decoded frames are copied as the decoder reuses its
+        array for the next poll.
+
+        :return: timestamp, decoded frames, frame as returned by get_frame
+        """
+        timestamp, frames = self._poll_frame()
+        return timestamp, frames.copy(), self._smooth_frame(timestamp, frames)
+
+    def _poll_frame(self):
+        """
+        Gets a frame of tracking data from the poller.
+
+        :return: timestamp, decoded frames in a FRAME_DTYPE array
+        """
+        return self._poller.poll(self._state == 'tracking')
+
+    def _smooth_frame(self, timestamp, frames):
+        """
+        Passes decoded frames through the smoothing buffers. Without
+        smoothing, every tool is converted at once instead.
+
+        :return: frame, as returned by get_frame
+        """
+        port_handles = self._poller.decoder.port_handles
+        timing = self._poller.timing
+        if timing is not None:
+            mark = timing.start()
+        if self.buffer_size == 1:
+            frame = unsmoothed_frame(port_handles, timestamp, frames,
+                self.use_quaternions, self._stacked_output)
+        else:
+            self.add_frame_to_buffer(port_handles, [timestamp] * len(frames),
+                frames['frame_number'].tolist(), frames['quaternion'],
+                frames['translation'], frames['error'].tolist(),
+                rot_is_quaternion = True)
+            if timing is not None:
+                mark = timing.lap(STAGE_BUFFER, mark)
+            frame = self.get_smooth_frame(port_handles)
+            if self._stacked_output:
+                frame = stack_frame(frame, self.use_quaternions)
+        if timing is not None:
+            timing.lap(STAGE_SMOOTH, mark)
+        return frame
 
     def get_tool_descriptions(self):
         """ Returns the port handles and tool descriptions """
@@ -526,18 +958,30 @@ class NDITracker(SKSBaseTracker):
             raise ValueError("""Called start tracking before device ready,
             try calling connect first""")
 
-        ndicapy.ndiCommand(self._device, 'TSTART:')
-        self._check_for_errors('starting tracking.')
+        if self._tracker_type != "replay":
+            ndicapy.ndiCommand(self._device, 'TSTART:')
+            self._check_for_errors('starting tracking.')
         self._state = 'tracking'
 
+        if self._poller.reply.needs_calibrating():
+            self._calibrate_reply_format()
+
+        self._poller.start()
+
+        self._acquisition.start(self._acquire_frame)
+
     def stop_tracking(self):
         """
         Tells the NDI devices to stop tracking.
 
         :raises Exception: ValueError
         """
-        ndicapy.ndiCommand(self._device, 'TSTOP:')
-        self._check_for_errors('stopping tracking.')
+        self._acquisition.stop()
+        self._poller.stop()
+
+        if self._tracker_type != "replay":
+            ndicapy.ndiCommand(self._device, 'TSTOP:')
+            self._check_for_errors('stopping tracking.')
         self._state = 'ready'
 
     def _check_for_errors(self, message):
@@ -0,0 +1,445 @@
+#  -*- coding: utf-8 -*-
+
+"""An OpenIGTLink server, streaming the poses of every tool to
+navigation software such as 3D Slicer.
+
+Each tool is sent as an OpenIGTLink version 1 TRANSFORM or POSITION
+message, named after the tool. The messages of every tool are packed at
+once into a preallocated array, and every client has its own queue of
+frames to send, so a slow client drops frames rather than holding up
+the others or acquisition::
+
+    server = OpenIGTLinkServer(*tracker.get_tool_descriptions())
+    server.start()
+    while tracking:
+        server.send_frame(tracker.get_frame())
+
+Or run it on its own for a tracker configured in a JSON file::
+
+    python -m sksurgerynditracker.openigtlink --config vega.json
+"""
+
+import argparse
+import json
+import os
+import queue
+import socket
+import threading
+
+from numpy import arange, asarray, bitwise_xor, dtype, empty, isnan, modf, \
+        uint8, uint64, zeros
+
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.frame_decoding import quaternions_to_matrices, \
+        matrices_to_quaternions
+
+#: The port OpenIGTLink servers usually listen on
+DEFAULT_PORT = 18944
+
+#: A 4x4 rigid transform, sent as its rotation column by column followed
+#: by the translation
+MESSAGE_TRANSFORM = 'TRANSFORM'
+#: A position and quaternion orientation, (x, y, z, qx, qy, qz, qw)
+MESSAGE_POSITION = 'POSITION'
+
+MESSAGE_TYPES = (MESSAGE_TRANSFORM, MESSAGE_POSITION)
+
+#: The OpenIGTLink header version written
+HEADER_VERSION = 1
+
+#: Header fields, 58 bytes in network byte order. timestamp is 32 bit
+#: seconds and 32 bit fractions of a second since the epoch, crc is the
+#: CRC64 of the body
+HEADER_DTYPE = dtype([
+    ('version', '>u2'),
+    ('type', 'S12'),
+    ('device_name', 'S20'),
+    ('timestamp', '>u8'),
+    ('body_size', '>u8'),
+    ('crc', '>u8')])
+
+_BODY_LENGTHS = {MESSAGE_TRANSFORM : 12, MESSAGE_POSITION : 7}
+
+#: The polynomial of the ECMA-182 CRC64 used by OpenIGTLink
+_CRC64_POLYNOMIAL = 0x42F0E1EBA9EA3693
+
+
+def _crc64_table():
+    table = zeros(256, dtype = uint64)
+    for byte in range(256):
+        crc = byte << 56
+        for _ in range(8):
+            crc = (crc << 1) ^ _CRC64_POLYNOMIAL if crc & (1 << 63) \
+                    else crc << 1
+        table[byte] = crc & 0xFFFFFFFFFFFFFFFF
+    return table
+
+_CRC64_TABLE = _crc64_table()
+
+
+def crc64(data):
+    """
+    The ECMA-182 CRC64 that OpenIGTLink checks message bodies with, of
+    each row of an array at once.
+
+    :param data: (n, length) uint8 array, or bytes for a single row
+    :return: (n,) uint64 array of CRCs, or an int for bytes
+    """
+    if isinstance(data, bytes):
+        return int(crc64(asarray(bytearray(data), dtype = uint8)[None])[0])
+    crc = zeros(len(data), dtype = uint64)
+    shift = uint64(56)
+    for column in data.T:
+        crc = _CRC64_TABLE[(crc >> shift) ^ column] ^ (crc << uint64(8))
+    return crc
+
+
+def _crc64_position_table(length):
+    """
+    The CRC64 is linear, so the CRC of a message is the exclusive or of
+    the CRCs of each of its bytes on their own, in place among zeros.
+
+    :return: (length, 256) array, the CRC64 of a message of length
+        bytes, all zero but for each value at each position
+    """
+    table = empty((length, 256), dtype = uint64)
+    crc = _CRC64_TABLE.copy()
+    for position in reversed(range(length)):
+        table[position] = crc
+        crc = _CRC64_TABLE[crc >> uint64(56)] ^ (crc << uint64(8))
+    return table
+
+
+def message_dtype(message_type):
+    """
+    :param message_type: one of MESSAGE_TYPES
+    :return: the dtype of one whole message, header then body
+    """
+    return dtype(HEADER_DTYPE.descr +
+                 [('body', '>f4', (_BODY_LENGTHS[message_type],))])
+
+
+class MessagePacker:
+    """
+    Packs the poses of every tool into OpenIGTLink messages, in an array
+    allocated once.
+    """
+    def __init__(self, device_names, message_type = MESSAGE_TRANSFORM):
+        """
+        :param device_names: the device name of each tool's messages, at
+            most 20 characters
+        :param message_type: one of MESSAGE_TYPES
+
+        :raises: ValueError if the message type is not known
+        """
+        if message_type not in MESSAGE_TYPES:
+            raise ValueError(
+                f'OpenIGTLink message type must be one of {MESSAGE_TYPES}')
+        self.message_type = message_type
+        self.messages = zeros(len(device_names),
+                              dtype = message_dtype(message_type))
+        self.messages['version'] = HEADER_VERSION
+        self.messages['type'] = message_type.encode('ascii')
+        self.messages['device_name'] = [name.encode('ascii')[0:20]
+                                        for name in device_names]
+        self.messages['body_size'] = self.messages.dtype['body'].itemsize
+        self._raw = self.messages.view(uint8).reshape(
+            len(device_names), self.messages.itemsize)
+        self._bodies = self._raw[:, HEADER_DTYPE.itemsize:]
+        body_size = self._bodies.shape[1]
+        self._crc_table = _crc64_position_table(body_size)
+        self._positions = arange(body_size)
+
+    def pack(self, frame):
+        """
+        Packs a frame, as returned by get_frame.
+
+        :return: the messages of the tools that are visible, as bytes
+        """
+        tools = len(self.messages)
+        tracking = asarray(frame[3], dtype = float).reshape(tools, -1)
+        visible = ~isnan(tracking).any(axis = 1)
+        if len(frame) > 5:
+            visible &= asarray(frame[5], dtype = bool)
+
+        matrices = quaternions = None
+        if tracking.shape[1] == 7:
+            quaternions = tracking[:, 0:4]
+            translations = tracking[:, 4:7]
+        else:
+            matrices = tracking.reshape(tools, 4, 4)
+            translations = matrices[:, 0:3, 3]
+
+        body = self.messages['body']
+        if self.message_type == MESSAGE_TRANSFORM:
+            if matrices is None:
+                matrices = quaternions_to_matrices(quaternions,
+                                                   translations)[0]
+            body[:, 0:9] = matrices[:, 0:3, 0:3].transpose(0, 2, 1).reshape(
+                tools, 9)
+            body[:, 9:12] = translations
+        else:
+            if quaternions is None:
+                quaternions = matrices_to_quaternions(matrices)
+            body[:, 0:3] = translations
+            body[:, 3:6] = quaternions[:, 1:4]
+            body[:, 6] = quaternions[:, 0]
+
+        fractions, seconds = modf(asarray(frame[1], dtype = float))
+        self.messages['timestamp'] = (
+            (seconds.astype(uint64) << uint64(32)) +
+            (fractions * 2.0 ** 32).astype(uint64))
+        self.messages['crc'] = bitwise_xor.reduce(
+            self._crc_table[self._positions, self._bodies], axis = 1)
+        if visible.all():
+            return self.messages.tobytes()
+        return self.messages[visible].tobytes()
+
+
+class OpenIGTLinkServer: #pylint: disable=too-many-instance-attributes
+    """
+    Serves OpenIGTLink messages over TCP to any number of clients. Each
+    client has a sending thread and a queue of frames, when a client
+    falls more than the queue size behind its oldest frame is dropped.
+    Messages the clients send are read and ignored.
+    """
+    # pylint: disable=too-many-positional-arguments
+    def __init__(self, port_handles, descriptions = None,
+                 message_type = MESSAGE_TRANSFORM, host = '127.0.0.1',
+                 port = DEFAULT_PORT, device_names = None, queue_size = 4):
+        """
+        :param port_handles: the port handles of the tools, as returned
+            by get_tool_descriptions
+        :param descriptions: the tool descriptions, as returned by
+            get_tool_descriptions, used to name the tools
+        :param message_type: one of MESSAGE_TYPES
+        :param host: the address to listen on
+        :param port: the port to listen on, 0 to pick a free port
+        :param device_names: the device name of each tool's messages,
+            defaults to the file name of the tool's description without
+            its extension, or the port handle
+        :param queue_size: the number of frames held for each client
+
+        :raises: ValueError if the message type is not known
+        """
+        if device_names is None:
+            device_names = _device_names(port_handles, descriptions)
+        self.device_names = list(device_names)
+        self._packer = MessagePacker(self.device_names, message_type)
+        self.queue_size = queue_size
+        self._address = (host, port)
+        self._listener = None
+        self._thread = None
+        self._running = False
+        self._clients = []
+        self._lock = threading.Lock()
+        self.frames_dropped = 0
+
+    @property
+    def address(self):
+        """
+        The (host, port) the server is listening on, once started
+        """
+        return self._address
+
+    @property
+    def clients(self):
+        """
+        The number of clients connected
+        """
+        with self._lock:
+            return len(self._clients)
+
+    def start(self):
+        """
+        Starts listening for clients.
+
+        :return: the (host, port) listened on
+        """
+        self._listener = socket.create_server(self._address)
+        self._address = self._listener.getsockname()[0:2]
+        self._running = True
+        self._thread = threading.Thread(target = self._accept,
+                                        name = 'OpenIGTLinkServer',
+                                        daemon = True)
+        self._thread.start()
+        return self._address
+
+    def stop(self):
+        """
+        Stops listening and disconnects every client.
+        """
+        if self._listener is None:
+            return
+        self._running = False
+        _shutdown(self._listener)
+        self._listener.close()
+        self._thread.join()
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.close()
+        for client in clients:
+            client.join()
+        self._listener = None
+
+    def send_frame(self, frame):
+        """
+        Packs a frame and queues it to be sent to every client. Returns
+        without waiting for any client.
+
+        :param frame: a frame, as returned by get_frame
+        :return: the number of clients the frame was queued for
+        """
+        data = self._packer.pack(frame)
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            if not client.put(data):
+                self.frames_dropped += 1
+        return len(clients)
+
+    def _accept(self):
+        while self._running:
+            try:
+                connection, _address = self._listener.accept()
+            except OSError:
+                return
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = _Client(connection, self.queue_size, self._remove)
+            with self._lock:
+                self._clients.append(client)
+            client.start()
+
+    def _remove(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+
+class _Client:
+    """A connected client, with a thread sending its queue of frames and
+    one reading and ignoring what it sends"""
+    def __init__(self, connection, queue_size, on_close):
+        self._connection = connection
+        self._queue = queue.Queue(max(queue_size, 1))
+        self._on_close = on_close
+        self._threads = [
+            threading.Thread(target = self._send, daemon = True,
+                             name = 'OpenIGTLinkClientSend'),
+            threading.Thread(target = self._receive, daemon = True,
+                             name = 'OpenIGTLinkClientReceive')]
+
+    def start(self):
+        """Starts sending and receiving"""
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, data):
+        """Queues data to send, dropping the oldest data if the queue is
+        full. Returns false if data was dropped"""
+        try:
+            self._queue.put_nowait(data)
+            return True
+        except queue.Full:
+            pass
+        try:
+            self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            pass
+        return False
+
+    def close(self):
+        """Disconnects the client"""
+        _shutdown(self._connection)
+        self.put(None)
+
+    def join(self):
+        """Waits for the client's threads to finish"""
+        for thread in self._threads:
+            thread.join()
+
+    def _send(self):
+        try:
+            while True:
+                data = self._queue.get()
+                if data is None:
+                    break
+                self._connection.sendall(data)
+        except OSError:
+            pass
+        finally:
+            _shutdown(self._connection)
+            self._on_close(self)
+
+    def _receive(self):
+        try:
+            while self._connection.recv(4096):
+                pass
+        except OSError:
+            pass
+        finally:
+            self.put(None)
+            self._connection.close()
+
+
+def _shutdown(connection):
+    try:
+        connection.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def _device_names(port_handles, descriptions):
+    """Names each tool after its description's file name, or its port
+    handle"""
+    if descriptions is None:
+        descriptions = [None] * len(port_handles)
+    names = []
+    for port_handle, description in zip(port_handles, descriptions):
+        if isinstance(description, str) and description:
+            names.append(os.path.splitext(os.path.basename(description))[0])
+        else:
+            names.append(f'Tool{port_handle}')
+    return [name[0:20] for name in names]
+
+
+def main(args = None):
+    """
+    Tracks with an NDI tracker and serves its poses until interrupted.
+    """
+    parser = argparse.ArgumentParser(
+        description = 'Serves the poses of an NDI tracker over OpenIGTLink')
+    parser.add_argument('--config', required = True,
+                        help = 'a JSON file holding the tracker configuration')
+    parser.add_argument('--message-type', choices = MESSAGE_TYPES,
+                        default = MESSAGE_TRANSFORM)
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = DEFAULT_PORT)
+    options = parser.parse_args(args)
+
+    with open(options.config, 'r', encoding = 'utf-8') as config_file:
+        tracker = NDITracker(json.load(config_file))
+    server = OpenIGTLinkServer(*tracker.get_tool_descriptions(),
+                               message_type = options.message_type,
+                               host = options.host, port = options.port)
+    host, port = server.start()
+    print(f'Serving OpenIGTLink on {host}:{port}, interrupt to stop')
+    tracker.start_tracking()
+    try:
+        while True:
+            server.send_frame(tracker.get_frame())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        tracker.stop_tracking()
+        tracker.close()
+
+
+if __name__ == '__main__':
+    main()
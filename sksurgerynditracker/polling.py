@@ -0,0 +1,123 @@
+#  -*- coding: utf-8 -*-
+
+"""Getting each frame of tracking data from a connected NDI tracker"""
+
+import logging
+from time import perf_counter, time
+
+import ndicapy
+from sksurgerynditracker.timing import STAGE_COMMAND, STAGE_DECODE
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class FramePoller:
+    """
+    Gets frames of tracking data for a tracker: by polling the device
+    with the capture command of its reply format, from a Vega stream
+    while tracking, or from a replayed session. Each frame is then time
+    stamped, with the clock model if there is one, and recorded. If
+    recording fails it is logged and recording stops, while tracking
+    carries on.
+    """
+    # pylint: disable=too-many-positional-arguments
+    def __init__(self, device, decoder, reply, stream = None,
+                 player = None, timing = None, clock = None,
+                 recorder = None):
+        """
+        :param device: the ndicapy device to poll, None for trackers
+            without a device, whose frames are the decoder's
+        :param decoder: the FrameDecoder for the enabled tools
+        :param reply: the ReplyFormat to poll with
+        :param stream: a VegaStream to read frames from while tracking
+        :param player: a SessionPlayer to read frames from instead of
+            a device
+        :param timing: a StageTimer to time polling and decoding with
+        :param clock: a ClockModel to time stamp frames with, from their
+            frame numbers
+        :param recorder: a SessionRecorder to record each frame with
+        """
+        self.device = device
+        self.decoder = decoder
+        self.reply = reply
+        self.stream = stream
+        self.player = player
+        self.timing = timing
+        self.clock = clock
+        self.recorder = recorder
+
+    def poll(self, tracking):
+        """
+        Gets a frame of tracking data.
+
+        :param tracking: whether the tracker is tracking, frames are
+            only read from the stream while it is
+        :return: timestamp, decoded frames in a FRAME_DTYPE array
+        """
+        timestamp = time()
+        received = None
+        if self.stream is not None and tracking:
+            timestamp, frames = self.stream.get_newest()
+            received = timestamp - time() + perf_counter()
+        elif self.player is not None:
+            frames = self.decoder.frames
+            timestamp = self.player.next_frame(frames)
+        elif self.device is not None:
+            timing = self.timing
+            if timing is not None:
+                mark = timing.start()
+            ndicapy.ndiCommand(self.device, self.reply.capture_string)
+            received = perf_counter()
+            if timing is not None:
+                mark = timing.lap(STAGE_COMMAND, mark)
+            frames = self.decoder.decode(self.device, self.reply.get_frame,
+                                         self.reply.get_transform)
+            if timing is not None:
+                timing.lap(STAGE_DECODE, mark)
+        else:
+            frames = self.decoder.frames
+        if self.clock is not None and received is not None:
+            timestamp = self.clock.correct(frames, received, timestamp)
+        if self.recorder is not None:
+            try:
+                self.recorder.record(timestamp, frames)
+            except IOError:
+                self.close()
+        return timestamp, frames
+
+    def calibrate_reply_format(self):
+        """
+        Calibrates the reply format with the device, see
+        ReplyFormat.calibrate.
+
+        :return: the result of calibrate_reply_format
+        """
+        return self.reply.calibrate(self.device, self.decoder)
+
+    def start(self):
+        """
+        Starts streaming, if reading frames from a stream.
+        """
+        if self.stream is not None:
+            self.stream.start()
+
+    def stop(self):
+        """
+        Stops streaming, if reading frames from a stream.
+        """
+        if self.stream is not None:
+            self.stream.stop()
+
+    def close(self):
+        """
+        Stops recording, if recording. Errors writing the recording are
+        logged.
+        """
+        if self.recorder is None:
+            return
+        recorder = self.recorder
+        self.recorder = None
+        try:
+            recorder.close()
+        except IOError:
+            _LOGGER.exception('Recording to %s failed', recorder.path)
@@ -0,0 +1,320 @@
+#  -*- coding: utf-8 -*-
+
+"""Recording of tracking sessions to an append only binary file.
+
+A session file is an 8 byte magic string, a little endian uint32 header
+length, a JSON header describing the tools and the record layout, then
+zero padding up to a multiple of 64 bytes. After that come fixed size
+records with dtype RECORD_DTYPE, one per tool per frame, so frame i
+is records [i * n_tools, (i + 1) * n_tools).
+"""
+
+import json
+import queue
+import struct
+import threading
+from bisect import bisect_left
+from time import time
+
+from numpy import dtype, empty, memmap, searchsorted
+
+#: The first bytes of every session file
+SESSION_MAGIC = b'SKSNDI\x00\x01'
+
+#: The version of the session file format
+SESSION_VERSION = 1
+
+#: Records start at a multiple of this many bytes
+DATA_ALIGNMENT = 64
+
+#: One tool in one frame. pose is (qw, qx, qy, qz, x, y, z), quality is
+#: the RMS error reported by the device and status one of the STATUS
+#: values from frame_decoding
+RECORD_DTYPE = dtype([
+    ('port_handle', '<i4'),
+    ('frame_number', '<i8'),
+    ('timestamp', '<f8'),
+    ('pose', '<f8', (7,)),
+    ('quality', '<f8'),
+    ('status', 'u1')])
+
+_HEADER_LENGTH = struct.Struct('<I')
+
+
+def _dtype_description(record_dtype):
+    return [[name, record_dtype[name].base.str,
+             list(record_dtype[name].shape)]
+            for name in record_dtype.names]
+
+
+def write_session_header(session_file, port_handles, descriptions,
+                         metadata = None):
+    """
+    Writes the header of a session file.
+
+    :param session_file: a binary file, open for writing at its start
+    :param port_handles: the port handles of the tools, as returned by
+        get_tool_descriptions
+    :param descriptions: the tool descriptions, as returned by
+        get_tool_descriptions
+    :param metadata: an optional dictionary to store in the header
+    :return: the number of bytes written, the offset of the first record
+    """
+    header = {'version' : SESSION_VERSION,
+              'port handles' : list(port_handles),
+              'descriptions' : list(descriptions),
+              'record dtype' : _dtype_description(RECORD_DTYPE),
+              'created' : time(),
+              'metadata' : metadata or {}}
+    encoded = json.dumps(header).encode('utf-8')
+    length = len(SESSION_MAGIC) + _HEADER_LENGTH.size + len(encoded)
+    padding = -length % DATA_ALIGNMENT
+    session_file.write(SESSION_MAGIC + _HEADER_LENGTH.pack(len(encoded)) +
+                       encoded + b'\0' * padding)
+    return length + padding
+
+
+def read_session_header(session_file):
+    """
+    Reads the header of a session file.
+
+    :param session_file: a binary file, open for reading at its start
+    :return: the header dictionary, and the offset of the first record
+    :raises: ValueError if the file is not a session file this version
+        can read
+    """
+    magic = session_file.read(len(SESSION_MAGIC))
+    if magic != SESSION_MAGIC:
+        raise ValueError('Not a tracking session file')
+    length, = _HEADER_LENGTH.unpack(session_file.read(_HEADER_LENGTH.size))
+    header = json.loads(session_file.read(length).decode('utf-8'))
+    if header.get('version') != SESSION_VERSION or \
+            header.get('record dtype') != _dtype_description(RECORD_DTYPE):
+        raise ValueError('Unsupported tracking session file version')
+    offset = len(SESSION_MAGIC) + _HEADER_LENGTH.size + length
+    return header, offset + (-offset % DATA_ALIGNMENT)
+
+
+class SessionRecorder: #pylint: disable=too-many-instance-attributes
+    """
+    Records frames of tracking data to a session file. record only
+    copies the frame and queues it; a writer thread converts frames to
+    records and writes them a chunk at a time, so the caller never
+    waits for the disk. When the writer falls behind and the queue is
+    full, frames are dropped and counted in frames_dropped.
+    """
+    # pylint: disable=too-many-positional-arguments
+    def __init__(self, path, port_handles, descriptions, metadata = None,
+                 chunk_frames = 256, flush_interval = 0.5,
+                 queue_size = 1024):
+        """
+        :param path: the file to record to, it is overwritten
+        :param port_handles: the port handles of the tools, as returned
+            by get_tool_descriptions
+        :param descriptions: the tool descriptions
+        :param metadata: an optional dictionary to store in the header
+        :param chunk_frames: the number of frames written at once
+        :param flush_interval: the longest time in seconds frames wait
+            to be written when fewer than chunk_frames are queued
+        :param queue_size: the most frames queued for writing, further
+            frames are dropped
+        """
+        self.path = path
+        self._port_handles = list(port_handles)
+        self._descriptions = list(descriptions)
+        self._metadata = metadata
+        self._chunk = empty((chunk_frames, len(self._port_handles)),
+                            dtype = RECORD_DTYPE)
+        self._flush_interval = flush_interval
+        self._queue = queue.Queue(queue_size)
+        self._file = None
+        self._thread = None
+        self._error = None
+        self.frames_recorded = 0
+        self.frames_dropped = 0
+
+    def start(self):
+        """
+        Creates the file, writes the header and starts the writer thread.
+        """
+        self._file = open(self.path, 'wb') #pylint: disable=consider-using-with
+        write_session_header(self._file, self._port_handles,
+                             self._descriptions, self._metadata)
+        self._thread = threading.Thread(target = self._write,
+                                        name = 'NDISessionRecorder',
+                                        daemon = True)
+        self._thread.start()
+
+    def record(self, timestamp, frames):
+        """
+        Queues a frame for writing, without blocking. The frame is
+        dropped if the queue is full.
+
+        :param timestamp: the host time stamp of the frame
+        :param frames: the decoded frame, a FRAME_DTYPE array with one
+            element per tool
+        :raises: IOError if writing has failed
+        """
+        if self._error is not None:
+            raise IOError(f'Recording to {self.path} failed') \
+                    from self._error
+        try:
+            self._queue.put_nowait((timestamp, frames.copy()))
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def close(self):
+        """
+        Writes all queued frames and closes the file.
+
+        :raises: IOError if writing has failed
+        """
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+        if self._error is not None:
+            raise IOError(f'Recording to {self.path} failed') \
+                    from self._error
+
+    def _write(self):
+        """Runs on the writer thread until close queues None"""
+        filled = 0
+        while True:
+            try:
+                item = self._queue.get(timeout = self._flush_interval)
+            except queue.Empty:
+                filled = self._write_chunk(filled)
+                continue
+            if item is None:
+                self._write_chunk(filled)
+                return
+            self._fill_row(self._chunk[filled], *item)
+            filled += 1
+            if filled == len(self._chunk):
+                filled = self._write_chunk(filled)
+
+    @staticmethod
+    def _fill_row(row, timestamp, frames):
+        row['port_handle'] = frames['port_handle']
+        row['frame_number'] = frames['frame_number']
+        row['timestamp'] = timestamp
+        row['pose'][:, 0:4] = frames['quaternion']
+        row['pose'][:, 4:7] = frames['translation']
+        row['quality'] = frames['error']
+        row['status'] = frames['status']
+
+    def _write_chunk(self, filled):
+        """Writes the first filled frames of the chunk"""
+        if filled == 0 or self._error is not None:
+            return 0
+        try:
+            self._file.write(self._chunk[0:filled].tobytes())
+            self._file.flush()
+            self.frames_recorded += filled
+        except OSError as error:
+            self._error = error
+        return 0
+
+
+class SessionReader: #pylint: disable=too-many-instance-attributes
+    """
+    Reads a session file by memory mapping it, so files larger than
+    memory can be read and nothing is loaded until it is used.
+
+    records, poses, frame_numbers and timestamps are NumPy views of the
+    file, not copies. A sparse index, holding every index_stride'th
+    frame's time stamp and frame number, finds frames by time or by
+    frame number with a binary search of the index and then of a single
+    block of the file.
+    """
+    def __init__(self, path, index_stride = 1024):
+        """
+        :param path: the session file
+        :param index_stride: the number of frames between index entries
+        :raises: ValueError if the file is not a session file this
+            version can read
+        """
+        with open(path, 'rb') as session_file:
+            header, offset = read_session_header(session_file)
+        self.header = header
+        self.port_handles = header['port handles']
+        self.descriptions = header['descriptions']
+        self.metadata = header.get('metadata', {})
+
+        records = memmap(path, dtype = RECORD_DTYPE, mode = 'r',
+                         offset = offset)
+        tools = max(len(self.port_handles), 1)
+        frames = len(records) // tools
+        #: all records, shape (n_frames, n_tools)
+        self.records = records[0:frames * tools].reshape(frames, tools)
+        #: poses, shape (n_frames, n_tools, 7), (qw, qx, qy, qz, x, y, z)
+        self.poses = self.records['pose']
+        #: tracker frame numbers, shape (n_frames, n_tools)
+        self.frame_numbers = self.records['frame_number']
+        #: host time stamps, shape (n_frames,)
+        self.timestamps = self.records['timestamp'][:, 0]
+
+        self._stride = index_stride
+        self._index_times = self.timestamps[::index_stride].tolist()
+        self._index_frame_numbers = self._frame_number_of(
+            self.frame_numbers[::index_stride]).tolist()
+
+    def __len__(self):
+        return len(self.records)
+
+    @staticmethod
+    def _frame_number_of(frame_numbers):
+        """The frame number of each frame, tools that were not seen
+        have frame number 0 so the largest is used"""
+        return frame_numbers.max(axis = 1)
+
+    def _search(self, index, values_of, value):
+        """Finds the first frame whose value is at least value, searching
+        the sparse index, then the one block of the file it points to"""
+        block = bisect_left(index, value) - 1
+        if block < 0:
+            return 0
+        start = block * self._stride
+        end = min(start + self._stride, len(self))
+        return start + int(searchsorted(values_of(start, end), value))
+
+    def find_time(self, timestamp):
+        """
+        Finds the first frame at or after a time.
+
+        :param timestamp: the host time stamp to find
+        :return: the index of the frame, len(self) if all frames are
+            earlier
+        """
+        return self._search(self._index_times,
+                            lambda start, end: self.timestamps[start:end],
+                            timestamp)
+
+    def find_frame_number(self, frame_number):
+        """
+        Finds the first frame with a tracker frame number at or after
+        frame_number.
+
+        :param frame_number: the tracker frame number to find
+        :return: the index of the frame, len(self) if all frames have
+            lower frame numbers
+        """
+        return self._search(
+            self._index_frame_numbers,
+            lambda start, end: self._frame_number_of(
+                self.frame_numbers[start:end]),
+            frame_number)
+
+    def between_times(self, start_time, end_time):
+        """
+        Gets the frames recorded in a time interval.
+
+        :param start_time: the start of the interval, inclusive
+        :param end_time: the end of the interval, exclusive
+        :return: a view of the records, shape (n_frames, n_tools)
+        """
+        return self.records[self.find_time(start_time):
+                            self.find_time(end_time)]
@@ -0,0 +1,100 @@
+#  -*- coding: utf-8 -*-
+
+"""Playback of recorded tracking sessions"""
+
+from time import perf_counter, sleep
+
+from sksurgerynditracker.recording import SessionReader
+
+#: Frames are played with the time between them when recorded
+PACING_REALTIME = 'realtime'
+#: Frames are played at a fixed frame rate, by tracker frame number
+PACING_FRAME_NUMBER = 'frame number'
+#: Frames are played as fast as they are asked for
+PACING_FAST = 'fast'
+
+PACING_MODES = (PACING_REALTIME, PACING_FRAME_NUMBER, PACING_FAST)
+
+
+class SessionPlayer: #pylint: disable=too-many-instance-attributes
+    """
+    Plays back a session file written by recording.SessionRecorder,
+    one frame at a time.
+    """
+    def __init__(self, path, pacing = PACING_REALTIME, frame_rate = 60.0,
+                 loop = False):
+        """
+        :param path: the session file
+        :param pacing: one of PACING_MODES
+        :param frame_rate: the device frame rate in Hz, used to pace
+            by frame number
+        :param loop: if true, play the session again from the start when
+            it ends
+        :raises: ValueError if the file is not a session file or the
+            pacing is not known
+        """
+        if pacing not in PACING_MODES:
+            raise ValueError(f'Replay pacing must be one of {PACING_MODES}')
+        reader = SessionReader(path)
+        self.port_handles = reader.port_handles
+        self.descriptions = reader.descriptions
+        self.metadata = reader.metadata
+        self._records = reader.records
+
+        self._pacing = pacing
+        self._frame_period = 1.0 / frame_rate
+        self._loop = loop
+        self._index = 0
+        self._start = None
+
+    def __len__(self):
+        return len(self._records)
+
+    def rewind(self):
+        """
+        Starts playing from the first frame again.
+        """
+        self._index = 0
+        self._start = None
+
+    def next_frame(self, frames):
+        """
+        Waits until the next frame is due, as set by the pacing, and
+        copies it into frames.
+
+        :param frames: a FRAME_DTYPE array with one element per tool,
+            filled in place
+        :return: the time stamp recorded with the frame
+        :raises: IOError at the end of the session, unless looping
+        """
+        if self._index >= len(self._records):
+            if not self._loop or len(self._records) == 0:
+                raise IOError('End of recorded tracking session')
+            self.rewind()
+
+        row = self._records[self._index]
+        if self._start is None:
+            self._start = perf_counter()
+        self._wait_for(row)
+
+        frames['port_handle'] = row['port_handle']
+        frames['frame_number'] = row['frame_number']
+        frames['quaternion'] = row['pose'][:, 0:4]
+        frames['translation'] = row['pose'][:, 4:7]
+        frames['error'] = row['quality']
+        frames['status'] = row['status']
+        self._index += 1
+        return float(row['timestamp'][0])
+
+    def _wait_for(self, row):
+        first = self._records[0]
+        if self._pacing == PACING_REALTIME:
+            due = row['timestamp'][0] - first['timestamp'][0]
+        elif self._pacing == PACING_FRAME_NUMBER:
+            due = (row['frame_number'].max() -
+                   first['frame_number'].max()) * self._frame_period
+        else:
+            return
+        delay = self._start + due - perf_counter()
+        if delay > 0:
+            sleep(delay)
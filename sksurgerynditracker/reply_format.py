@@ -0,0 +1,170 @@
+#  -*- coding: utf-8 -*-
+
+"""Measures which tracking reply format, BX or TX, to use with a device"""
+
+from time import perf_counter
+from numpy import abs as np_abs, allclose, array_equal, sum as np_sum
+import ndicapy
+
+from sksurgerynditracker.frame_decoding import STATUS_VALID
+
+
+def capture_reply(device, decoder, capture_string):
+    """
+    Captures and decodes one frame.
+
+    :param device: the ndicapy device, which must be tracking
+    :param decoder: a FrameDecoder for the enabled tools
+    :param capture_string: the capture command, e.g. 'BX:0801'
+    :return: the time to capture and decode the frame in seconds, and a
+        copy of the decoded frame. Both are None if the device reported
+        an error or the reply could not be decoded
+    """
+    reply_format = capture_string[0:2]
+    get_frame = getattr(ndicapy, f'ndiGet{reply_format}Frame')
+    get_transform = getattr(ndicapy, f'ndiGet{reply_format}Transform')
+    start = perf_counter()
+    ndicapy.ndiCommand(device, capture_string)
+    if ndicapy.ndiGetError(device) != ndicapy.NDI_OKAY:
+        return None, None
+    try:
+        decoded = decoder.decode(device, get_frame, get_transform)
+    except (TypeError, ValueError):
+        return None, None
+    return perf_counter() - start, decoded.copy()
+
+
+def frames_consistent(first, second, tolerance = 1.0,
+                      rotation_tolerance = 1e-3):
+    """
+    Checks that two decoded frames agree: the same tools are visible,
+    and the visible tools are in the same place.
+
+    :param first: a FRAME_DTYPE array
+    :param second: a FRAME_DTYPE array for the same tools
+    :param tolerance: the largest difference in translation allowed
+    :param rotation_tolerance: the largest difference allowed between 1
+        and the absolute dot product of the quaternions
+    :return: true if the frames are consistent
+    """
+    if not array_equal(first['status'], second['status']):
+        return False
+    valid = first['status'] == STATUS_VALID
+    if not allclose(first['translation'][valid],
+                    second['translation'][valid],
+                    rtol = 0.0, atol = tolerance):
+        return False
+    dot = np_sum(first['quaternion'][valid] * second['quaternion'][valid],
+                 axis = 1)
+    return bool(((1.0 - np_abs(dot)) <= rotation_tolerance).all())
+
+
+def calibrate_reply_format(device, decoder, reply_options = '0801',
+                           frames = 5, tolerance = 1.0):
+    """
+    Captures frames alternately with BX and TX replies and picks the
+    faster format that decodes. Each BX reply is compared with the TX
+    reply captured straight after it, when both hold the same frame, so
+    that tools moving between frames don't count against BX. BX is not
+    used if any such pair disagrees, as TX is the reference format.
+
+    :param device: the ndicapy device, which must be tracking
+    :param decoder: a FrameDecoder for the enabled tools
+    :param reply_options: the reply options, as a hexadecimal string
+    :param frames: the number of frames to capture with each format
+    :param tolerance: the largest difference in translation allowed
+        between BX and TX replies holding the same frame
+    :return: a dictionary with the mean capture time of each format in
+        seconds, 'BX' and 'TX', None where the format failed, whether
+        the formats were 'consistent', None if no pair of replies held
+        the same frame, and the chosen 'capture string'
+    :raises: IOError if neither format can be decoded
+    """
+    times = {'BX' : 0.0, 'TX' : 0.0}
+    consistent = None
+    for _ in range(frames):
+        replies = {}
+        for reply_format, elapsed in times.items():
+            if elapsed is None:
+                continue
+            seconds, replies[reply_format] = capture_reply(
+                device, decoder, f'{reply_format}:{reply_options}')
+            times[reply_format] = None if seconds is None \
+                    else elapsed + seconds
+        if times['BX'] is not None and times['TX'] is not None and \
+                array_equal(replies['BX']['frame_number'],
+                            replies['TX']['frame_number']):
+            agree = frames_consistent(replies['BX'], replies['TX'],
+                                      tolerance)
+            consistent = agree and consistent is not False
+
+    bx_time, tx_time = (None if times[reply_format] is None
+                        else times[reply_format] / frames
+                        for reply_format in ('BX', 'TX'))
+    if bx_time is None and tx_time is None:
+        raise IOError('Could not decode tracking data as BX or TX')
+    if tx_time is None or \
+            (bx_time is not None and consistent is not False and
+             bx_time <= tx_time):
+        capture_string = f'BX:{reply_options}'
+    else:
+        capture_string = f'TX:{reply_options}'
+
+    return {'BX' : bx_time, 'TX' : tx_time, 'consistent' : consistent,
+            'capture string' : capture_string}
+
+
+class ReplyFormat:
+    """
+    The reply format a tracker captures frames with: the capture command
+    and the ndicapy functions that read its reply. The format can be
+    calibrated once, the first time tracking starts.
+    """
+    def __init__(self, capture_string, calibration_frames = None):
+        """
+        :param capture_string: the capture command, e.g. 'BX:0801'
+        :param calibration_frames: the number of frames to capture with
+            each format when calibrating, None not to calibrate
+        """
+        self.calibration_frames = calibration_frames
+        self.calibration = None
+        self.capture_string = None
+        self.get_frame = None
+        self.get_transform = None
+        self.set_capture_string(capture_string)
+
+    def set_capture_string(self, capture_string):
+        """
+        Sets the capture command, and the ndicapy functions that read
+        its reply.
+
+        :param capture_string: the capture command, e.g. 'BX:0801'
+        """
+        reply_format = capture_string[0:2]
+        self.get_frame = getattr(ndicapy, f'ndiGet{reply_format}Frame')
+        self.get_transform = getattr(ndicapy,
+                                     f'ndiGet{reply_format}Transform')
+        self.capture_string = capture_string
+
+    def needs_calibrating(self):
+        """
+        :return: true if calibration was asked for and has not been done
+        """
+        return self.calibration_frames is not None and \
+                self.calibration is None
+
+    def calibrate(self, device, decoder):
+        """
+        Calibrates the reply format, see calibrate_reply_format, and
+        captures with the chosen format from then on.
+
+        :param device: the ndicapy device, which must be tracking
+        :param decoder: a FrameDecoder for the enabled tools
+        :return: the result of calibrate_reply_format
+        :raises: IOError if neither format can be decoded
+        """
+        self.calibration = calibrate_reply_format(
+            device, decoder, self.capture_string[3:],
+            self.calibration_frames)
+        self.set_capture_string(self.calibration['capture string'])
+        return self.calibration
@@ -15,3 +15,95 @@ def fix_com_port_greater_than_9(device_name):
     if device_name[0:3] != 'COM' or len(device_name) == 4:
         return device_name
     return '\\\\.\\' + device_name
+
+
+#: Strings in a port's manufacturer, product or description that
+#: identify an NDI device
+NDI_PORT_NAMES = ('NDI', 'Northern Digital')
+
+#: USB vendor ids of the USB to serial adapters used by NDI devices,
+#: FTDI and Silicon Labs CP210x
+NDI_ADAPTER_VIDS = (0x0403, 0x10C4)
+
+#: Strings in a port's description that identify devices that are not
+#: NDI trackers
+UNRELATED_PORT_NAMES = ('Bluetooth',)
+
+#: Rank of ports identified as NDI devices, by name or allow list
+RANK_NDI = 0
+#: Rank of ports on a USB to serial adapter used by NDI
+RANK_ADAPTER = 1
+#: Rank of ports without USB metadata, e.g. built in serial ports
+RANK_UNKNOWN = 2
+#: Rank of other USB devices
+RANK_OTHER_USB = 3
+
+
+def _matches_usb_id(port, usb_ids):
+    """
+    Checks a port against a list of USB ids, each a string of the
+    form 'vvvv' or 'vvvv:pppp' with hexadecimal vendor and product ids
+    """
+    vid = getattr(port, 'vid', None)
+    pid = getattr(port, 'pid', None)
+    if vid is None:
+        return False
+    for usb_id in usb_ids:
+        vendor, _sep, product = usb_id.partition(':')
+        if int(vendor, 16) == vid and (not product or
+                                       int(product, 16) == pid):
+            return True
+    return False
+
+
+def _port_text(port):
+    return ' '.join(str(getattr(port, attribute, None) or '')
+                    for attribute in ('manufacturer', 'product',
+                                      'description'))
+
+
+def serial_port_rank(port, allow = None, deny = None):
+    """
+    Ranks a serial port by how likely it is to be an NDI device, using
+    the USB metadata reported by pyserial.
+
+    :param port: a pyserial ListPortInfo
+    :param allow: USB ids, 'vvvv' or 'vvvv:pppp' in hexadecimal, of
+        ports to treat as NDI devices
+    :param deny: USB ids of ports to skip
+    :return: RANK_NDI, RANK_ADAPTER, RANK_UNKNOWN or RANK_OTHER_USB, or
+        None if the port should not be probed
+    """
+    if deny and _matches_usb_id(port, deny):
+        return None
+    text = _port_text(port)
+    if (allow and _matches_usb_id(port, allow)) or \
+            any(name in text for name in NDI_PORT_NAMES):
+        return RANK_NDI
+    if any(name in text for name in UNRELATED_PORT_NAMES):
+        return None
+    vid = getattr(port, 'vid', None)
+    if vid is None:
+        return RANK_UNKNOWN
+    return RANK_ADAPTER if vid in NDI_ADAPTER_VIDS else RANK_OTHER_USB
+
+
+def rank_serial_ports(ports, allow = None, deny = None):
+    """
+    Orders serial ports so that the ports most likely to be NDI devices
+    come first, and removes ports that are not. Ports of equal rank
+    keep their enumeration order.
+
+    :param ports: a list of pyserial ListPortInfo, as returned by
+        serial.tools.list_ports.comports
+    :param allow: USB ids, 'vvvv' or 'vvvv:pppp' in hexadecimal, of
+        ports to treat as NDI devices
+    :param deny: USB ids of ports to skip
+    :return: a list of (rank, port), sorted by rank
+    """
+    ranked = []
+    for port in ports:
+        rank = serial_port_rank(port, allow, deny)
+        if rank is not None:
+            ranked.append((rank, port))
+    return sorted(ranked, key = lambda ranked_port: ranked_port[0])
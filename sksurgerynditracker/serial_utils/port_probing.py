@@ -0,0 +1,133 @@
+"""Probing of serial ports for NDI devices, optionally concurrently"""
+
+import multiprocessing
+import threading
+from multiprocessing.connection import wait
+from time import perf_counter
+
+import ndicapy
+
+
+def _probe_worker(probe, name, connection):
+    """Runs in a child process, sends the probe result to the parent"""
+    try:
+        result = probe(name)
+    except Exception: #pylint: disable=broad-except
+        result = None
+    connection.send(result)
+    connection.close()
+
+
+def probe_serial_ports(names, timeout = 5.0, workers = 1, probe = None):
+    """
+    Probes serial ports and returns the first that answers.
+
+    By default the ports are probed one at a time, in this process.
+    ndiProbe holds the GIL while it waits for a device, so to probe
+    ports concurrently each probe must run in its own process. With
+    workers greater than one up to workers probes run at once, each in
+    a child process. A probe that has not answered after timeout seconds
+    is terminated, as are all probes still running when a device is
+    found.
+
+    Child processes are only used from the main thread of the main
+    process, otherwise the ports are probed one at a time anyway, as
+    forking a process that is running other threads is unsafe. Where
+    child processes are spawned rather than forked, as on Windows and
+    macOS, the main module is imported again in each child, so a script
+    probing with workers must do so under an
+    ``if __name__ == "__main__":`` guard.
+
+    :param names: the names of the serial ports to probe, in order of
+        preference
+    :param timeout: the maximum time for each probe in seconds, only
+        enforced when probing in child processes
+    :param workers: the maximum number of probes to run at once,
+        defaults to 1, probing in this process
+    :param probe: the probe function, defaults to ndicapy.ndiProbe. It
+        must be picklable to probe in child processes
+    :return: the name of the first port to return NDI_OKAY, or None,
+        and a list of (name, result, seconds) for each port probed.
+        result is None if the probe timed out or failed
+    """
+    if probe is None:
+        probe = ndicapy.ndiProbe
+    if workers <= 1 or not _can_use_processes():
+        return _probe_sequentially(names, probe)
+    return _probe_concurrently(names, timeout, workers, probe)
+
+
+def _can_use_processes():
+    """Whether probes can safely run in child processes, only from the
+    main thread of a process that is not itself a child"""
+    return (multiprocessing.parent_process() is None and
+            threading.current_thread() is threading.main_thread())
+
+
+def _probe_sequentially(names, probe):
+    """Probes each port in turn, in this process, until one answers"""
+    timings = []
+    for name in names:
+        start = perf_counter()
+        try:
+            result = probe(name)
+        except Exception: #pylint: disable=broad-except
+            result = None
+        timings.append((name, result, perf_counter() - start))
+        if result == ndicapy.NDI_OKAY:
+            return name, timings
+    return None, timings
+
+
+def _probe_concurrently(names, timeout, workers, probe):
+    """Probes up to workers ports at once, each in a child process"""
+    context = multiprocessing.get_context()
+    pending = list(names)
+    running = {}
+    timings = []
+    found = None
+
+    try:
+        while found is None and (pending or running):
+            while pending and len(running) < workers:
+                name = pending.pop(0)
+                receiver, sender = context.Pipe(duplex = False)
+                process = context.Process(target = _probe_worker,
+                                          args = (probe, name, sender),
+                                          daemon = True)
+                process.start()
+                sender.close()
+                running[receiver] = (process, name, perf_counter())
+
+            deadline = min(start for _process, _name, start
+                           in running.values()) + timeout
+            for receiver in wait(list(running),
+                                 max(deadline - perf_counter(), 0.0)):
+                process, name, start = running.pop(receiver)
+                try:
+                    result = receiver.recv()
+                except EOFError:
+                    result = None
+                receiver.close()
+                process.join()
+                timings.append((name, result, perf_counter() - start))
+                if result == ndicapy.NDI_OKAY and found is None:
+                    found = name
+
+            now = perf_counter()
+            for receiver, (process, name, start) in list(running.items()):
+                if now - start >= timeout:
+                    del running[receiver]
+                    _terminate(process, receiver)
+                    timings.append((name, None, now - start))
+    finally:
+        for receiver, (process, _name, _start) in running.items():
+            _terminate(process, receiver)
+
+    return found, timings
+
+
+def _terminate(process, receiver):
+    process.terminate()
+    process.join()
+    receiver.close()
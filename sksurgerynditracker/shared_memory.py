@@ -0,0 +1,341 @@
+#  -*- coding: utf-8 -*-
+
+"""Publishing of tracking frames to other processes on the same host,
+through a ring buffer in shared memory.
+
+One process owns the tracker and publishes every frame, any number of
+local processes subscribe and read frames with no pickling, sockets or
+locks::
+
+    port_handles, _descriptions = tracker.get_tool_descriptions()
+    publisher = SharedFramePublisher('ndi', port_handles,
+                                     tracker.use_quaternions)
+    while tracking:
+        publisher.publish(tracker.get_frame())
+
+    subscriber = SharedFrameSubscriber('ndi')
+    frame, sequence = subscriber.wait_for_frame()
+
+The shared memory is a header, the tools' port handles, then a ring of
+fixed size slots, one frame per slot. Each slot starts with a sequence
+lock, a counter that is odd while the frame in the slot is being
+written. Readers copy a slot and check its counter was even and did not
+change while they copied, else they try again, so the publisher never
+waits for readers.
+"""
+
+import os
+import sys
+from multiprocessing import resource_tracker, shared_memory
+from time import perf_counter, sleep
+
+from numpy import array, dtype, int32, ndarray
+
+#: The first bytes of every frame ring
+RING_MAGIC = b'SKSNDIR\x01'
+
+#: The version of the frame ring layout
+RING_VERSION = 1
+
+#: The number of frames held by default
+DEFAULT_SLOTS = 16
+
+_HEADER_DTYPE = dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('tools', '<u4'),
+    ('slots', '<u4'),
+    ('use_quaternions', 'u1'),
+    ('stacked', 'u1'),
+    ('published', '<u8')], align = True)
+
+#: Port handles and slots start at a multiple of this many bytes
+_ALIGNMENT = 64
+
+#the names of the rings published by this process
+_PUBLISHED = set()
+
+#how many times a slot is read before giving up on a torn or unfinished
+#write, leaving the caller to sleep or give up
+_READ_ATTEMPTS = 100
+
+
+def _align(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _slot_dtype(tools, use_quaternions):
+    """One frame of tracking data, as returned by get_frame, with the
+    sequence lock guarding it"""
+    pose_shape = (7,) if use_quaternions else (4, 4)
+    return dtype([
+        ('sequence', '<u8'),
+        ('time_stamps', '<f8', (tools,)),
+        ('frame_numbers', '<f8', (tools,)),
+        ('tracking', '<f8', (tools,) + pose_shape),
+        ('quality', '<f8', (tools,)),
+        ('visible', '?', (tools,))], align = True)
+
+
+class _FrameRing:
+    """Views of the header, port handles and slots of a frame ring"""
+    def __init__(self, memory):
+        self.header = ndarray(1, _HEADER_DTYPE, memory.buf)[0]
+        self.tools = int(self.header['tools'])
+        self.use_quaternions = bool(self.header['use_quaternions'])
+        self.stacked = bool(self.header['stacked'])
+        self.port_handles = ndarray(self.tools, int32, memory.buf,
+                                    _align(_HEADER_DTYPE.itemsize))
+        slots = ndarray(int(self.header['slots']),
+                        _slot_dtype(self.tools, self.use_quaternions),
+                        memory.buf, _slots_offset(self.tools))
+        self.slots = slots
+        self.sequence = slots['sequence']
+
+    def release(self):
+        """Drops the views so that the shared memory can be closed"""
+        self.header = self.port_handles = self.slots = self.sequence = None
+
+
+def _slots_offset(tools):
+    return _align(_align(_HEADER_DTYPE.itemsize) + 4 * tools)
+
+
+class SharedFramePublisher:
+    """
+    Creates a frame ring in shared memory and publishes frames into it.
+    Only one process should publish to a ring.
+    """
+    def __init__(self, name, port_handles, use_quaternions = False,
+                 stacked = False, slots = DEFAULT_SLOTS):
+        """
+        :param name: the name of the shared memory, which subscribers
+            open the ring with
+        :param port_handles: the port handles of the tools, as returned
+            by get_tool_descriptions. None is stored as -1
+        :param use_quaternions: true if the frames published hold
+            quaternion tracking
+        :param stacked: true if the frames published are stacked output
+        :param slots: the number of frames held, subscribers reading
+            more slowly than this many frames miss frames
+
+        :raises: ValueError if slots is less than one, FileExistsError
+            if shared memory with the name already exists
+        """
+        if slots < 1:
+            raise ValueError('A frame ring needs at least one slot')
+        tools = len(port_handles)
+        size = (_slots_offset(tools) +
+                slots * _slot_dtype(tools, use_quaternions).itemsize)
+        self._memory = shared_memory.SharedMemory(name, create = True,
+                                                  size = size)
+        _PUBLISHED.add(self._memory.name)
+        header = ndarray(1, _HEADER_DTYPE, self._memory.buf)[0]
+        header['magic'] = RING_MAGIC
+        header['version'] = RING_VERSION
+        header['tools'] = tools
+        header['slots'] = slots
+        header['use_quaternions'] = bool(use_quaternions)
+        header['stacked'] = bool(stacked)
+        header['published'] = 0
+        del header
+        self._ring = _FrameRing(self._memory)
+        self._ring.port_handles[:] = [-1 if port_handle is None
+                                      else port_handle
+                                      for port_handle in port_handles]
+        self._ring.sequence[:] = 0
+        self.published = 0
+
+    @property
+    def name(self):
+        """
+        The name of the shared memory
+        """
+        return self._memory.name
+
+    def publish(self, frame):
+        """
+        Writes a frame into the oldest slot of the ring.
+
+        :param frame: a frame as returned by get_frame, with tracking as
+            set when creating the publisher
+
+        :raises: ValueError if the frame does not have one entry per tool
+        """
+        ring = self._ring
+        if len(frame[0]) != ring.tools:
+            raise ValueError(f'Frame ring holds {ring.tools} tools, '
+                             f'the frame has {len(frame[0])}')
+        sequence = self.published + 1
+        index = (sequence - 1) % len(ring.slots)
+        slot = ring.slots[index:index + 1]
+        tracking = array(frame[3], dtype = float).reshape(
+            ring.slots['tracking'].shape[1:])
+
+        ring.sequence[index] = 2 * sequence - 1
+        slot['time_stamps'] = frame[1]
+        slot['frame_numbers'] = frame[2]
+        slot['tracking'] = tracking
+        slot['quality'] = frame[4]
+        if len(frame) > 5:
+            slot['visible'] = frame[5]
+        else:
+            slot['visible'] = [True] * ring.tools
+        ring.sequence[index] = 2 * sequence
+        ring.header['published'] = sequence
+        self.published = sequence
+
+    def close(self):
+        """
+        Removes the shared memory. Subscribers that have the ring open
+        can still read the frames published so far.
+        """
+        if self._ring is None:
+            return
+        self._ring.release()
+        self._ring = None
+        self._memory.close()
+        self._memory.unlink()
+        _PUBLISHED.discard(self._memory.name)
+
+
+class SharedFrameSubscriber:
+    """
+    Reads frames from a frame ring created by a SharedFramePublisher,
+    in this or another process.
+    """
+    def __init__(self, name, poll_interval = 0.0005):
+        """
+        :param name: the name the publisher was created with
+        :param poll_interval: the time in seconds to sleep between
+            checks for a new frame when waiting
+
+        :raises: FileNotFoundError if there is no shared memory with the
+            name, ValueError if it does not hold a frame ring
+        """
+        self._memory = _open_shared_memory(name)
+        header = ndarray(1, _HEADER_DTYPE, self._memory.buf)[0]
+        valid = (header['magic'] == RING_MAGIC and
+                 header['version'] == RING_VERSION)
+        del header
+        if not valid:
+            self._memory.close()
+            raise ValueError(f'Shared memory {name} is not a frame ring')
+        _untrack(self._memory)
+        self._ring = _FrameRing(self._memory)
+        self.poll_interval = poll_interval
+        self.port_handles = self._ring.port_handles.tolist()
+        self.use_quaternions = self._ring.use_quaternions
+        self.stacked = self._ring.stacked
+
+    def get(self):
+        """
+        Returns the newest frame without waiting.
+
+        :return: frame, as returned by get_frame, and its sequence
+            number, counting from one. frame is None if nothing has been
+            published yet, or if the newest frame could not be read
+            because the publisher is still writing over it
+        """
+        sequence = 0
+        for _attempt in range(_READ_ATTEMPTS):
+            sequence = int(self._ring.header['published'])
+            if sequence == 0:
+                return None, 0
+            frame = self._read(sequence)
+            if frame is not None:
+                return frame, sequence
+        return None, sequence
+
+    def wait_for_frame(self, sequence = 0, timeout = None):
+        """
+        Waits for the frame after sequence to be published. If it has
+        already been overwritten, the oldest frame still held is
+        returned instead, so the sequence number returned jumps by the
+        number of frames missed.
+
+        :param sequence: the sequence number of the last frame read
+        :param timeout: maximum time to wait in seconds, None waits forever
+        :return: frame, as returned by get_frame, and its sequence number
+        :raises: TimeoutError if no new frame arrives before the timeout
+        """
+        deadline = None if timeout is None else perf_counter() + timeout
+        slots = len(self._ring.slots)
+        wanted = sequence + 1
+        while True:
+            published = int(self._ring.header['published'])
+            if published >= wanted:
+                wanted = max(wanted, published - slots + 1)
+                frame = self._read(wanted)
+                if frame is not None:
+                    return frame, wanted
+                if self._overwritten(wanted):
+                    wanted += 1
+                    continue
+            if deadline is not None and perf_counter() > deadline:
+                raise TimeoutError('Timed out waiting for a tracking frame')
+            sleep(self.poll_interval)
+
+    def close(self):
+        """
+        Closes this process's view of the shared memory.
+        """
+        if self._ring is None:
+            return
+        self._ring.release()
+        self._ring = None
+        self._memory.close()
+
+    def _read(self, sequence):
+        """Copies frame sequence out of its slot, or returns None if the
+        slot has moved on to a newer frame or is still being written"""
+        ring = self._ring
+        index = (sequence - 1) % len(ring.slots)
+        for _attempt in range(_READ_ATTEMPTS):
+            before = int(ring.sequence[index])
+            if before > 2 * sequence:
+                return None
+            if before == 2 * sequence:
+                slot = ring.slots[index:index + 1].copy()[0]
+                if int(ring.sequence[index]) == before:
+                    return self._frame(slot)
+        return None
+
+    def _overwritten(self, sequence):
+        """True if the slot of frame sequence holds a newer frame"""
+        ring = self._ring
+        index = (sequence - 1) % len(ring.slots)
+        return int(ring.sequence[index]) > 2 * sequence
+
+    def _frame(self, slot):
+        """Builds a frame, as returned by get_frame, from a slot"""
+        frame = (list(self.port_handles), slot['time_stamps'].tolist(),
+                 slot['frame_numbers'].tolist())
+        tracking = slot['tracking']
+        if self.stacked:
+            return frame + (tracking, slot['quality'].tolist(),
+                            slot['visible'])
+        if self.use_quaternions:
+            tracking = tracking.reshape(len(tracking), 1, 7)
+        return frame + (list(tracking), slot['quality'].tolist())
+
+
+def _open_shared_memory(name):
+    """Opens existing shared memory, without the resource tracker
+    removing it when this process exits, as Python 3.13 allows"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory( #pylint: disable=unexpected-keyword-arg
+            name, track = False)
+    return shared_memory.SharedMemory(name)
+
+def _untrack(memory):
+    """Before Python 3.13 every process opening shared memory on posix
+    registers it with the resource tracker, which would remove it when
+    the process exits, so unregisters it again. Rings published by this
+    process, or the process it forked from, share its registration."""
+    if sys.version_info >= (3, 13) or os.name != 'posix':
+        return
+    if memory.name in _PUBLISHED:
+        return
+    resource_tracker.unregister(
+        memory._name, 'shared_memory') #pylint: disable=protected-access
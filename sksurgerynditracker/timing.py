@@ -0,0 +1,158 @@
+#  -*- coding: utf-8 -*-
+
+"""Low overhead timing of the stages of getting a frame of tracking data"""
+
+from time import perf_counter_ns
+
+#: Sending the capture command and waiting for the reply
+STAGE_COMMAND = 'ndiCommand'
+#: Extracting each tool's transform from the reply
+STAGE_DECODE = 'decode'
+#: Adding the decoded frame to the smoothing buffers
+STAGE_BUFFER = 'add_frame_to_buffer'
+#: Averaging the smoothing buffers, or without smoothing, converting
+#: every tool's quaternion at once
+STAGE_SMOOTH = 'get_smooth_frame'
+
+STAGES = (STAGE_COMMAND, STAGE_DECODE, STAGE_BUFFER, STAGE_SMOOTH)
+
+#: The number of histogram bins, the last bin holds everything from
+#: 2 ** 46 ns, about 20 hours, up
+HISTOGRAM_BINS = 48
+
+
+class TimingHistogram:
+    """
+    Counts durations in a fixed number of power of two bins, so adding
+    a duration never allocates. Bin 0 holds durations of 0 ns and bin i
+    durations from 2 ** (i - 1) up to 2 ** i ns.
+    """
+    __slots__ = ('counts', 'count', 'total', 'minimum', 'maximum')
+
+    def __init__(self, bins = HISTOGRAM_BINS):
+        """
+        :param bins: the number of bins
+        """
+        self.counts = [0] * bins
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = 0
+
+    def add(self, nanoseconds):
+        """
+        Counts one duration.
+
+        :param nanoseconds: the duration as an integer number of
+            nanoseconds
+        """
+        self.counts[min(nanoseconds.bit_length(), len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total += nanoseconds
+        if self.minimum is None or nanoseconds < self.minimum:
+            self.minimum = nanoseconds
+        self.maximum = max(self.maximum, nanoseconds)
+
+    def reset(self):
+        """
+        Forgets all durations counted.
+        """
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = 0
+
+    def percentile(self, fraction):
+        """
+        Estimates a percentile from the bins.
+
+        :param fraction: the percentile as a fraction, e.g. 0.99
+        :return: the upper edge in nanoseconds of the bin holding the
+            percentile, capped at the longest duration counted, which is
+            also used for the last bin. None if nothing has been counted
+        """
+        if self.count == 0:
+            return None
+        wanted = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts[:-1]):
+            seen += count
+            if count and seen >= wanted:
+                return min(1 << index, self.maximum)
+        return self.maximum
+
+    def stats(self):
+        """
+        :return: a dictionary with the 'count' of durations, their
+            'mean', 'min' and 'max', the 'p50', 'p90' and 'p99'
+            percentiles estimated from the bins, all in seconds (None if
+            nothing has been counted), and the 'histogram' as a list of
+            (upper bin edge in seconds, count) for the bins in use
+        """
+        def seconds(nanoseconds):
+            return None if nanoseconds is None else nanoseconds * 1e-9
+
+        return {'count' : self.count,
+                'mean' : seconds(self.total / self.count
+                                 if self.count else None),
+                'min' : seconds(self.minimum),
+                'max' : seconds(self.maximum if self.count else None),
+                'p50' : seconds(self.percentile(0.5)),
+                'p90' : seconds(self.percentile(0.9)),
+                'p99' : seconds(self.percentile(0.99)),
+                'histogram' : [((1 << index) * 1e-9, count)
+                               for index, count in enumerate(self.counts)
+                               if count]}
+
+
+class StageTimer:
+    """
+    Times the stages of getting a frame into one TimingHistogram per
+    stage. Stages are timed back to back: start returns a time stamp,
+    and each call to lap counts the time since the previous time stamp
+    against a stage and returns a new one.
+
+    Histograms are updated without locking. They are only written by
+    the thread getting frames, so reading stats from another thread
+    may see a frame's durations partly counted, but never loses any.
+    """
+    def __init__(self, stages = STAGES):
+        """
+        :param stages: the names of the stages to time
+        """
+        self.histograms = {stage : TimingHistogram() for stage in stages}
+
+    @staticmethod
+    def start():
+        """
+        :return: the current time stamp, in nanoseconds
+        """
+        return perf_counter_ns()
+
+    def lap(self, stage, since):
+        """
+        Counts the time since a time stamp against a stage.
+
+        :param stage: the name of the stage
+        :param since: the time stamp the stage started at, as returned
+            by start or lap
+        :return: the current time stamp, for timing the next stage
+        """
+        now = perf_counter_ns()
+        self.histograms[stage].add(now - since)
+        return now
+
+    def reset(self):
+        """
+        Forgets all durations counted.
+        """
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+    def stats(self):
+        """
+        :return: a dictionary of TimingHistogram.stats, by stage
+        """
+        return {stage : histogram.stats()
+                for stage, histogram in self.histograms.items()}
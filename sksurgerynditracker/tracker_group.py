@@ -0,0 +1,296 @@
+#  -*- coding: utf-8 -*-
+
+"""Tracking with several NDI trackers at once, e.g. a Vega for optical
+tools and an Aurora for EM sensors on the same cart"""
+
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from operator import methodcaller
+
+from numpy import array, concatenate, full_like, isfinite, isnan, nan, \
+        where
+from numpy.linalg import norm, svd
+
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.frame_decoding import IDENTITY_MATRIX_POSE, \
+        IDENTITY_QUATERNION_POSE
+
+#: Each tracker's newest frame is used as it is
+ALIGNMENT_NONE = 'none'
+#: Each tracker's frame nearest to the common time stamp is used
+ALIGNMENT_NEAREST = 'nearest'
+#: Each tracker's frames are interpolated to the common time stamp
+ALIGNMENT_INTERPOLATE = 'interpolate'
+
+ALIGNMENT_MODES = (ALIGNMENT_NONE, ALIGNMENT_NEAREST, ALIGNMENT_INTERPOLATE)
+
+
+class TrackerGroup:
+    """
+    Owns several NDITrackers and polls them all at once, each on its own
+    thread, so that a frame from the group takes as long as the slowest
+    tracker rather than the sum of them. ndicapy releases the GIL while
+    waiting for a device, so the trackers' round trips overlap.
+
+    get_frame returns one merged frame, with the tools of every tracker
+    in the order the trackers were given. Port handles are (name, port
+    handle) pairs, as port handles are only unique within one tracker,
+    and each tool keeps its own tracker's frame number and host time
+    stamp.
+
+    Trackers poll at their own rates, so their newest frames were taken
+    at different times. With an alignment other than ALIGNMENT_NONE the
+    group keeps a short history of each tracker's frames and picks, or
+    interpolates, every tracker's frame at a common time stamp: the
+    oldest of the trackers' newest frames, the latest time all of them
+    have tracking for.
+    """
+    def __init__(self, trackers, alignment = ALIGNMENT_NONE, history = 8):
+        """
+        :param trackers: a dictionary of NDITrackers, or of NDITracker
+            configurations to connect with, by name. Configurations are
+            connected at once, each on its own thread. The group closes
+            the trackers when it is closed
+        :param alignment: one of ALIGNMENT_MODES
+        :param history: the number of frames kept from each tracker
+            for alignment
+
+        :raises: ValueError if there are no trackers, the alignment is
+            not known or the trackers do not all use quaternions or all
+            use matrices, or as NDITracker
+        """
+        if alignment not in ALIGNMENT_MODES:
+            raise ValueError(
+                f'Tracker group alignment must be one of {ALIGNMENT_MODES}')
+        if not trackers:
+            raise ValueError('A tracker group needs at least one tracker')
+        self.alignment = alignment
+        self.names = list(trackers)
+        self._executor = ThreadPoolExecutor(
+            max_workers = len(self.names),
+            thread_name_prefix = 'NDITrackerGroup')
+        futures = [self._executor.submit(_connect, trackers[name])
+                   for name in self.names]
+        wait(futures)
+        self.trackers = [future.result() for future in futures
+                         if future.exception() is None]
+        if len(self.trackers) < len(futures):
+            self.close()
+            raise [future.exception() for future in futures
+                   if future.exception() is not None][0]
+        self.use_quaternions = self.trackers[0].use_quaternions
+        if any(bool(tracker.use_quaternions) != bool(self.use_quaternions)
+               for tracker in self.trackers):
+            self.close()
+            raise ValueError('The trackers in a group must all use '
+                             'quaternions or all use matrices')
+        self._histories = [deque(maxlen = max(history, 1))
+                           for _ in self.trackers]
+        self._stacked = None
+
+    def get_tool_descriptions(self):
+        """
+        :return: list of (name, port handle) pairs, one per tool of
+            every tracker.
+            list of tool descriptions
+        """
+        port_handles = []
+        descriptions = []
+        for name, tracker in zip(self.names, self.trackers):
+            tracker_handles, tracker_descriptions = \
+                    tracker.get_tool_descriptions()
+            port_handles += [(name, port_handle)
+                             for port_handle in tracker_handles]
+            descriptions += tracker_descriptions
+        return port_handles, descriptions
+
+    def start_tracking(self):
+        """
+        Tells every tracker to start tracking, at once.
+
+        :raises: as NDITracker.start_tracking
+        """
+        for history in self._histories:
+            history.clear()
+        self._run_all(methodcaller('start_tracking'), self.trackers)
+
+    def stop_tracking(self):
+        """
+        Tells every tracker to stop tracking, at once.
+
+        :raises: as NDITracker.stop_tracking
+        """
+        self._run_all(methodcaller('stop_tracking'), self.trackers)
+
+    def close(self):
+        """
+        Closes every tracker and stops the polling threads.
+
+        :raises: as NDITracker.close, once every tracker has been closed
+        """
+        try:
+            self._run_all(methodcaller('close'), self.trackers)
+        finally:
+            self._executor.shutdown()
+
+    def get_frame(self):
+        """
+        Gets a frame from every tracker at once and merges them.
+
+        :return: as NDITracker.get_frame, with the tools of every
+            tracker. Port handles are (name, port handle) pairs. With
+            ALIGNMENT_INTERPOLATE every time stamp is the common time
+            stamp and frame numbers are interpolated too
+
+        :raises: ValueError if some trackers use stacked output and
+            others do not, or as NDITracker.get_frame
+        """
+        frames = self._run_all(methodcaller('get_frame'), self.trackers)
+        stacked = {len(frame) > 5 for frame in frames}
+        if len(stacked) > 1:
+            raise ValueError('The trackers in a group must all use stacked '
+                             'output or all not use it')
+        self._stacked = stacked.pop()
+
+        samples = []
+        for history, frame in zip(self._histories, frames):
+            sample = _Sample(frame, self.use_quaternions)
+            if not history or history[-1].timestamp != sample.timestamp:
+                history.append(sample)
+            samples.append(sample)
+
+        if self.alignment != ALIGNMENT_NONE:
+            samples = self._align()
+        return self._merge(samples)
+
+    def _run_all(self, function, items):
+        """Calls function with each item on the polling threads, waits
+        for every call to finish, then raises the first error if any"""
+        futures = [self._executor.submit(function, item) for item in items]
+        wait(futures)
+        for future in futures:
+            if future.exception() is not None:
+                raise future.exception()
+        return [future.result() for future in futures]
+
+    def _align(self):
+        """Gets every tracker's sample at the common time stamp"""
+        newest = [history[-1].timestamp for history in self._histories
+                  if history[-1].timestamp is not None]
+        if not newest:
+            return [history[-1] for history in self._histories]
+        target = min(newest)
+        return [_sample_at(list(history), target, self.alignment)
+                for history in self._histories]
+
+    def _merge(self, samples):
+        """Joins the samples of every tracker into one frame"""
+        port_handles = []
+        for name, sample in zip(self.names, samples):
+            port_handles += [(name, port_handle)
+                             for port_handle in sample.port_handles]
+        time_stamps = concatenate([sample.time_stamps for sample in samples])
+        frame_numbers = concatenate([sample.frame_numbers
+                                     for sample in samples])
+        quality = concatenate([sample.quality for sample in samples])
+        poses = concatenate([sample.poses for sample in samples])
+        visible = ~isnan(poses).any(axis = tuple(range(1, poses.ndim)))
+
+        if self.use_quaternions:
+            identity_pose = IDENTITY_QUATERNION_POSE
+        else:
+            identity_pose = IDENTITY_MATRIX_POSE
+            poses[:, 3, :] = IDENTITY_MATRIX_POSE[3]
+        frame = (port_handles, time_stamps.tolist(), frame_numbers.tolist())
+        if self._stacked:
+            poses[~visible] = identity_pose
+            return frame + (poses, quality.tolist(), visible)
+        if self.use_quaternions:
+            tracking = list(poses.reshape(len(poses), 1, 7))
+        else:
+            tracking = list(poses)
+        return frame + (tracking, quality.tolist())
+
+
+class _Sample: #pylint: disable=too-few-public-methods
+    """One tracker's frame as arrays, with NaN poses for tools that
+    are not visible"""
+    __slots__ = ('port_handles', 'timestamp', 'time_stamps',
+                 'frame_numbers', 'poses', 'quality')
+
+    def __init__(self, frame, use_quaternions):
+        port_handles, time_stamps, frame_numbers, tracking, quality = \
+                frame[0:5]
+        pose_shape = (7,) if use_quaternions else (4, 4)
+        self.port_handles = list(port_handles)
+        self.time_stamps = array(time_stamps, dtype = float)
+        self.frame_numbers = array(frame_numbers, dtype = float)
+        self.quality = array(quality, dtype = float)
+        self.poses = array(tracking, dtype = float).reshape(
+            (len(self.port_handles),) + pose_shape)
+        if len(frame) > 5:
+            self.poses[~array(frame[5], dtype = bool)] = nan
+        elif not use_quaternions:
+            self.poses[isnan(self.poses).any(axis = (1, 2))] = nan
+        self.timestamp = None
+        if len(self.time_stamps) > 0:
+            self.timestamp = float(self.time_stamps.max())
+
+    def blend(self, later, weight):
+        """
+        :return: a sample weight of the way from this sample to later,
+            interpolating rotations linearly then normalising them
+        """
+        sample = _Sample.__new__(_Sample)
+        sample.port_handles = self.port_handles
+        sample.timestamp = self.timestamp + weight * (later.timestamp -
+                                                     self.timestamp)
+        sample.time_stamps = full_like(self.time_stamps, sample.timestamp)
+        for field in ('frame_numbers', 'quality', 'poses'):
+            start = getattr(self, field)
+            setattr(sample, field,
+                    start + weight * (getattr(later, field) - start))
+        if self.poses.ndim == 2:
+            rotations = self.poses[:, 0:4]
+            #q and -q are the same rotation, blend along the shorter arc
+            signs = where((rotations * later.poses[:, 0:4]).sum(
+                axis = 1, keepdims = True) < 0, -1.0, 1.0)
+            blended = rotations + weight * (
+                signs * later.poses[:, 0:4] - rotations)
+            sample.poses[:, 0:4] = blended / norm(blended, axis = 1,
+                                                  keepdims = True)
+        else:
+            finite = isfinite(sample.poses).all(axis = (1, 2))
+            left, _, right = svd(sample.poses[finite, 0:3, 0:3])
+            sample.poses[finite, 0:3, 0:3] = left @ right
+        return sample
+
+
+def _connect(tracker):
+    """Returns the tracker, or an NDITracker for a configuration"""
+    if isinstance(tracker, dict):
+        return NDITracker(tracker)
+    return tracker
+
+
+def _sample_at(history, target, alignment):
+    """Picks or interpolates the sample at time target from a history
+    of samples in time order"""
+    if history[-1].timestamp is None:
+        return history[-1]
+    timestamps = [sample.timestamp for sample in history]
+    after = bisect_left(timestamps, target)
+    if after == 0:
+        return history[0]
+    if after == len(history):
+        return history[-1]
+    before = after - 1
+    if alignment == ALIGNMENT_NEAREST:
+        nearer = target - timestamps[before] <= timestamps[after] - target
+        return history[before] if nearer else history[after]
+    if timestamps[after] == target:
+        return history[after]
+    weight = ((target - timestamps[before]) /
+              (timestamps[after] - timestamps[before]))
+    return history[before].blend(history[after], weight)
@@ -0,0 +1,202 @@
+#  -*- coding: utf-8 -*-
+
+"""Streamed (push) acquisition of tracking data from an NDI Vega"""
+
+import socket
+import struct
+import threading
+from collections import deque
+from time import time
+
+from sksurgerynditracker.ndi_protocol import BX_HEADER_LENGTH, \
+        BX_START_SEQUENCE, bx_reply_length, decode_reply, encode_command, \
+        parse_bx_reply
+
+
+class VegaStream: #pylint: disable=too-many-instance-attributes
+    """
+    Asks a Vega to stream BX replies over its own TCP connection, and
+    decodes them on a receiver thread into a bounded queue. When the
+    queue is full the oldest frame is dropped.
+
+    The Vega pushes a reply every frame, so no command has to go out
+    for each frame. The connection is separate from the one ndicapy
+    uses, which carries on handling all other commands.
+    """
+    # pylint: disable=too-many-positional-arguments
+    def __init__(self, ip_address, port, frames,
+                 queue_size = 8, command = 'BX 0801',
+                 stream_id = 'sksurgerynditracker', timeout = 2.0):
+        """
+        :param ip_address: the ip address of the Vega
+        :param port: the port of the Vega's API server
+        :param frames: a FRAME_DTYPE array with the port handles of the
+            tools to decode, used as a template for each streamed frame
+        :param queue_size: the maximum number of frames held
+        :param command: the command whose replies are streamed
+        :param stream_id: the id to identify the stream with
+        :param timeout: socket timeout in seconds
+        """
+        self._address = (ip_address, port)
+        self._template = frames.copy()
+        self._command = command
+        self._stream_id = stream_id
+        self._timeout = timeout
+        self._queue = deque(maxlen = queue_size)
+        self._condition = threading.Condition()
+        self._socket = None
+        self._thread = None
+        self._running = False
+        self._error = None
+        self.frames_received = 0
+        self.frames_dropped = 0
+
+    def start(self):
+        """
+        Connects to the Vega and starts the stream.
+
+        :raises: IOError if the connection fails or the Vega does
+            not accept the STREAM command
+        """
+        self._socket = socket.create_connection(self._address,
+                                                timeout = self._timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket.sendall(encode_command(
+            f'STREAM --cmd="{self._command}" --id={self._stream_id}'))
+
+        buffer = bytearray()
+        reply = self._read_ascii_reply(buffer)
+        if not reply.startswith('OKAY'):
+            self._socket.close()
+            raise IOError(f'Vega did not start streaming: {reply}')
+
+        self._running = True
+        self._error = None
+        self._thread = threading.Thread(target = self._receive,
+                                        args = (buffer,),
+                                        name = 'VegaStreamReceiver',
+                                        daemon = True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the stream and closes the connection.
+        """
+        if self._socket is None:
+            return
+        self._running = False
+        try:
+            self._socket.sendall(encode_command(
+                f'USTREAM --id={self._stream_id}'))
+        except OSError:
+            pass
+        if self._thread is not None:
+            self._thread.join(self._timeout)
+        self._socket.close()
+        self._socket = None
+        self._thread = None
+        with self._condition:
+            self._queue.clear()
+
+    def get(self, timeout = None):
+        """
+        Takes the oldest frame from the queue, waiting for one if the
+        queue is empty.
+
+        :param timeout: maximum time to wait in seconds
+        :return: host receive time stamp, decoded FRAME_DTYPE array
+        :raises: TimeoutError if no frame arrives in time, IOError if
+            the stream is not running, or the error that stopped it,
+            such as a reply that could not be decoded
+        """
+        with self._condition:
+            self._wait_for_frame(timeout)
+            return self._queue.popleft()
+
+    def get_newest(self, timeout = None):
+        """
+        Takes the newest frame and discards any older ones, waiting for
+        a frame if none has arrived since the last call.
+
+        :param timeout: maximum time to wait in seconds
+        :return: host receive time stamp, decoded FRAME_DTYPE array
+        :raises: TimeoutError if no frame arrives in time, IOError if
+            the stream is not running, or the error that stopped it,
+            such as a reply that could not be decoded
+        """
+        with self._condition:
+            self._wait_for_frame(timeout)
+            newest = self._queue.pop()
+            self._queue.clear()
+            return newest
+
+    def _wait_for_frame(self, timeout):
+        if timeout is None:
+            timeout = self._timeout
+        if not self._condition.wait_for(
+                lambda: self._queue or self._error is not None
+                or not self._running, timeout):
+            raise TimeoutError('Timed out waiting for streamed frame')
+        if not self._queue:
+            if self._error is not None:
+                raise self._error
+            raise IOError('Vega stream is not running')
+
+    def _read_ascii_reply(self, buffer):
+        """Reads an ASCII reply, leaving any following bytes in buffer"""
+        while b'\r' not in buffer:
+            self._recv_into(buffer)
+        end = buffer.index(b'\r') + 1
+        reply = decode_reply(bytes(buffer[0:end]))
+        del buffer[0:end]
+        return reply
+
+    def _recv_into(self, buffer):
+        data = self._socket.recv(65536)
+        if not data:
+            raise IOError('Vega closed the stream connection')
+        buffer += data
+
+    def _receive(self, buffer):
+        """Receives and decodes replies until the stream is stopped, or
+        fails to receive or decode a reply"""
+        try:
+            while self._running:
+                try:
+                    self._decode_next(buffer)
+                except socket.timeout:
+                    continue
+        except (IOError, OSError, struct.error, ValueError,
+                IndexError) as error:
+            with self._condition:
+                if self._running:
+                    self._error = error
+                self._running = False
+                self._condition.notify_all()
+
+    def _decode_next(self, buffer):
+        """Decodes the next reply in the stream, receiving as needed"""
+        while len(buffer) < 2:
+            self._recv_into(buffer)
+        if buffer[0:2] != BX_START_SEQUENCE:
+            reply = self._read_ascii_reply(buffer)
+            if reply.startswith('ERROR'):
+                raise IOError(f'Vega stream reported {reply}')
+            return
+
+        while len(buffer) < BX_HEADER_LENGTH:
+            self._recv_into(buffer)
+        length = bx_reply_length(buffer)
+        while len(buffer) < length:
+            self._recv_into(buffer)
+        timestamp = time()
+        frames, _system_status = parse_bx_reply(bytes(buffer[0:length]),
+                                                self._template.copy())
+        del buffer[0:length]
+
+        with self._condition:
+            if len(self._queue) == self._queue.maxlen:
+                self.frames_dropped += 1
+            self._queue.append((timestamp, frames))
+            self.frames_received += 1
+            self._condition.notify_all()
@@ -21,6 +21,11 @@ SETTINGS_POLARIS_QUAT_SMOOTH = SETTINGS_POLARIS_QUAT.copy()
 SETTINGS_POLARIS_SMOOTH["smoothing buffer"] = 2
 SETTINGS_POLARIS_QUAT_SMOOTH["smoothing buffer"] = 2
 
+SETTINGS_POLARIS_STACKED = SETTINGS_POLARIS.copy()
+SETTINGS_POLARIS_QUAT_STACKED = SETTINGS_POLARIS_QUAT.copy()
+SETTINGS_POLARIS_STACKED["stacked output"] = True
+SETTINGS_POLARIS_QUAT_STACKED["stacked output"] = True
+
 class MockPort:
     """A fake serial port for ndi"""
     device = 'bad port'
@@ -142,3 +147,23 @@ class MockBXFrameSource():
     def mockndiGetBXTransformMissing(self, _device, _port_handle): #pylint:disable=invalid-name
         """Mock of ndiGetBXTransform"""
         return "MISSING"
+
+def patch_polaris(mocker, bxsource, ndidevice):
+    """
+    Patches ndicapy and pyserial so that an NDITracker connects to a
+    mock polaris and reads frames from bxsource
+    """
+    mocker.patch('serial.tools.list_ports.comports', mockComports)
+    mocker.patch('ndicapy.ndiProbe', mockndiProbe)
+    mocker.patch('ndicapy.ndiOpen', mockndiOpen)
+    mocker.patch('ndicapy.ndiCommand', ndidevice.mockndiCommand)
+    mocker.patch('ndicapy.ndiGetError', mockndiGetError)
+    mocker.patch('ndicapy.ndiClose')
+    mocker.patch('ndicapy.ndiGetPHSRNumberOfHandles',
+            ndidevice.mockndiGetPHSRNumberOfHandles)
+    mocker.patch('ndicapy.ndiGetPHRQHandle', ndidevice.mockndiGetPHRQHandle)
+    mocker.patch('ndicapy.ndiPVWRFromFile')
+    mocker.patch('ndicapy.ndiGetPHSRHandle', mockndiGetPHSRHandle)
+    mocker.patch('ndicapy.ndiVER', mockndiVER)
+    mocker.patch('ndicapy.ndiGetBXFrame', bxsource.mockndiGetBXFrame)
+    mocker.patch('ndicapy.ndiGetBXTransform', bxsource.mockndiGetBXTransform)
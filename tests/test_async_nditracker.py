@@ -0,0 +1,116 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of the asyncio front end,
+using a mocked ndicapy"""
+
+import asyncio
+from time import sleep
+import pytest
+import numpy as np
+from sksurgerynditracker.async_nditracker import AsyncNDITracker
+
+from tests.polaris_mocks import SETTINGS_POLARIS, patch_polaris, \
+        MockNDIDevice, MockBXFrameSource
+
+def _connect_mocks(mocker):
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+    return bxsource, ndidevice
+
+def test_async_frames(mocker):
+    """
+    Checks that frames are streamed to an async for loop, and that
+    iteration stops when tracking stops
+    """
+    bxsource, ndidevice = _connect_mocks(mocker)
+
+    async def track():
+        tracker = AsyncNDITracker(SETTINGS_POLARIS)
+        with pytest.raises(ValueError):
+            await tracker.start_tracking()
+        await tracker.connect()
+        bxsource.setdevice(ndidevice)
+        assert len(tracker.get_tool_descriptions()) == 2
+        await tracker.start_tracking()
+
+        (port_handles, _time_stamps, frame_numbers, tracking,
+                _tracking_quality) = await tracker.get_frame()
+        assert len(port_handles) == 2
+        assert np.allclose(tracking[0][0:3, 3],
+                           np.array([10., -20., 5.]) * frame_numbers[0])
+
+        last_frame_number = 0
+        count = 0
+        async for frame in tracker.frames():
+            assert frame[2][0] > last_frame_number
+            last_frame_number = frame[2][0]
+            count += 1
+            if count == 3:
+                await tracker.stop_tracking()
+        assert count == 3
+
+        await tracker.close()
+        assert tracker.tracker is None
+
+    asyncio.run(track())
+
+def test_async_not_tracking(mocker):
+    """
+    When not tracking get frame polls the tracker in an executor
+    """
+    bxsource, ndidevice = _connect_mocks(mocker)
+
+    async def poll():
+        tracker = AsyncNDITracker(SETTINGS_POLARIS)
+        await tracker.connect()
+        bxsource.setdevice(ndidevice)
+        frame = await tracker.get_frame()
+        await tracker.close()
+        return frame
+
+    frame_numbers = asyncio.run(poll())[2]
+    assert frame_numbers == [bxsource.bx_frame_count] * 2
+
+def test_async_loop_closed(mocker):
+    """
+    Acquisition carries on when the event loop closes while tracking
+    """
+    bxsource, ndidevice = _connect_mocks(mocker)
+
+    async def track():
+        tracker = AsyncNDITracker(SETTINGS_POLARIS)
+        await tracker.connect()
+        bxsource.setdevice(ndidevice)
+        await tracker.start_tracking()
+        await tracker.get_frame()
+        return tracker.tracker
+
+    tracker = asyncio.run(track())
+    sleep(0.05)
+    frame_number = tracker.get_frame()[2][0]
+    sleep(0.05)
+    assert tracker.is_acquiring()
+    assert tracker.get_frame()[2][0] > frame_number
+    tracker.stop_tracking()
+    tracker.close()
+
+def test_async_error(mocker):
+    """
+    Errors on the acquisition thread are raised by the frame iterator
+    """
+    _connect_mocks(mocker)
+    mocker.patch('ndicapy.ndiGetBXFrame', side_effect = IOError('lost'))
+
+    async def track():
+        tracker = AsyncNDITracker(SETTINGS_POLARIS)
+        await tracker.connect()
+        await tracker.start_tracking()
+        try:
+            async for _frame in tracker.frames():
+                pass
+        finally:
+            await tracker.close()
+
+    with pytest.raises(IOError, match = 'lost'):
+        asyncio.run(track())
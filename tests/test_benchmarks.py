@@ -0,0 +1,25 @@
+# coding=utf-8
+
+"""A quick run of the get_frame benchmark, to check it still works"""
+
+import json
+from benchmarks.bench_get_frame import main
+
+def test_get_frame_benchmark(tmp_path):
+    """
+    Runs the benchmark on a few configurations and checks the output
+    """
+    output = tmp_path / 'results.json'
+    main(['--tools', '1', '3', '--smoothing', '1', '2', '--frames', '20',
+          '--warmup', '2', '--allocation-frames', '5',
+          '--output', str(output)])
+
+    results = json.loads(output.read_text(encoding = 'utf-8'))
+    assert results['benchmark'] == 'get_frame'
+    assert len(results['results']) == 2 * 2 * 2 * 2
+    for result in results['results']:
+        assert result['p50 us'] <= result['p99 us'] <= result['max us']
+        assert result['frames per second'] > 0
+        assert result['peak bytes per frame'] > 0
+    assert {result['reply format'] for result in results['results']} == \
+            {'BX', 'TX'}
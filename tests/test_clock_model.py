@@ -0,0 +1,114 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of the tracker clock model"""
+
+from time import perf_counter, sleep, time
+import numpy as np
+import pytest
+from sksurgerynditracker.clock_model import ClockModel
+from sksurgerynditracker.frame_decoding import FRAME_DTYPE
+from sksurgerynditracker.nditracker import NDITracker
+
+from tests.polaris_mocks import SETTINGS_POLARIS, \
+        patch_polaris, MockNDIDevice, MockBXFrameSource
+
+# pylint: disable=too-many-positional-arguments
+def _receive(model, first_frame, frames, period, rng, start = 100.0):
+    """Adds frames acquired every period seconds, received 2 ms later
+    plus jitter, with one in twenty delayed by 30 ms
+
+    :return: the acquisition times, and the model's estimates of them
+    """
+    acquired = start + period * np.arange(frames)
+    received = acquired + 0.002 + rng.exponential(0.001, frames)
+    received[::20] += 0.03
+    estimates = [model.update(first_frame + index, receive_time)[0]
+                 for index, receive_time in enumerate(received)]
+    return acquired, np.array(estimates)
+
+def test_clock_model_fits_drift():
+    """
+    The fitted frame period follows the device's clock drift, and
+    acquisition times are at the quickest receive times
+    """
+    rng = np.random.default_rng(0)
+    model = ClockModel(60.0, window = 1200)
+    period = (1.0 / 60.0) / (1.0 + 100e-6)
+    acquired, estimates = _receive(model, 5000, 2400, period, rng)
+    assert model.drift == pytest.approx(100.0, abs = 20.0)
+    assert model.frame_rate == pytest.approx(60.006, abs = 0.002)
+    assert model.outliers > 0
+    assert model.jitter < 0.002
+    errors = estimates[-600:] - (acquired[-600:] + 0.002)
+    assert np.all(np.abs(errors) < 0.0005)
+    assert -0.001 < model.latency < 0.04
+
+    _acquired, _estimates = _receive(model, 7400, 2400,
+                                     (1.0 / 60.0) / (1.0 - 50e-6), rng,
+                                     start = acquired[-1] + period)
+    assert model.drift == pytest.approx(-50.0, abs = 20.0)
+
+def test_clock_model_frame_numbers():
+    """
+    Repeated frame numbers are not fitted again, frame numbers going
+    backwards reset the model
+    """
+    model = ClockModel(40.0, transport_latency = 0.001)
+    with pytest.raises(ValueError):
+        model.acquisition_time(1)
+    assert model.update(10, 1.0) == pytest.approx((0.999, 0.001))
+    assert model.update(10, 1.5) == pytest.approx((0.999, 0.501))
+    assert model.frames == 1
+    assert model.acquisition_time(12) == pytest.approx(1.049)
+    assert model.period == 1.0 / 40.0
+
+    model.update(11, 1.025)
+    model.update(2, 5.0)
+    assert model.frames == 1
+    assert model.acquisition_time(3) == pytest.approx(5.024)
+
+    with pytest.raises(ValueError):
+        ClockModel(0.0)
+    with pytest.raises(ValueError):
+        ClockModel(window = 1)
+
+def test_clock_model_correct():
+    """
+    Decoded frames are time stamped on the host's time clock, frames
+    with no tools keep their time stamp
+    """
+    model = ClockModel()
+    frames = np.zeros(2, dtype = FRAME_DTYPE)
+    frames['frame_number'] = [41, 42]
+    timestamp = model.correct(frames, perf_counter() - 0.01, 0.0)
+    assert timestamp == pytest.approx(time() - 0.01, abs = 0.005)
+    assert model.frames == 1
+    assert model.correct(np.zeros(0, dtype = FRAME_DTYPE),
+                         perf_counter(), 3.0) == 3.0
+
+def test_tracker_clock_model(mocker):
+    """
+    With a clock model configured frames are time stamped from their
+    frame numbers
+    """
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+    settings = SETTINGS_POLARIS.copy()
+    settings["clock model"] = 50.0
+    tracker = NDITracker(settings)
+    bxsource.setdevice(ndidevice)
+    assert tracker.get_clock_model().nominal_period == 1.0 / 50.0
+    tracker.start_tracking()
+    time_stamps = []
+    for _ in range(20):
+        sleep(0.02)
+        time_stamps.append(tracker.get_frame()[1][0])
+    assert time_stamps == sorted(time_stamps)
+    assert time_stamps[-1] == pytest.approx(time(), abs = 1.0)
+    assert tracker.get_clock_model().frames == 20
+    assert tracker.get_clock_model().latency is not None
+    tracker.stop_tracking()
+    tracker.close()
+
+    assert NDITracker(SETTINGS_POLARIS).get_clock_model() is None
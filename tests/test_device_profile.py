@@ -0,0 +1,69 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of device capability profiles"""
+
+import ndicapy
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.device_profile import DeviceProfile
+
+from tests.polaris_mocks import SETTINGS_POLARIS, patch_polaris, \
+        MockNDIDevice, MockBXFrameSource
+
+VER_REPLY_SPECTRA = ('Polaris Spectra Control Firmware\n'
+                     'NDI S/N: P6-01234\n'
+                     'Characterization Date: 01/01/15\n'
+                     'Freeze Tag: Polaris Spectra Rev 007\n'
+                     'Freeze Date: 01/01/15\n'
+                     '(C) Northern Digital Inc.\n')
+
+def test_profile_from_version():
+    """
+    Firmware and serial number are read from the VER reply, and known
+    TX only firmware captures with TX
+    """
+    profile = DeviceProfile.from_version_reply('polaris', VER_REPLY_SPECTRA)
+    assert profile.firmware == ' Polaris Spectra Rev 007'
+    assert profile.serial_number == 'P6-01234'
+    assert not profile.supports_bx
+    assert profile.frame_rates == (20.0, 30.0, 60.0)
+    assert profile.capture_string == 'TX:0801'
+
+    profile = DeviceProfile.from_version_reply('vega', 'Mock for Testing')
+    assert profile.firmware == 'unknown 00.0'
+    assert profile.capture_string == 'BX:0801'
+    assert profile.stream_command == 'BX 0801'
+
+def test_profile_round_trip():
+    """
+    A profile survives conversion to and from a dictionary
+    """
+    profile = DeviceProfile.from_version_reply('polaris', VER_REPLY_SPECTRA)
+    copy = DeviceProfile.from_dict(profile.to_dict())
+    assert copy.to_dict() == profile.to_dict()
+
+    profile.supports_bx = True
+    profile.reply_format = 'TX'
+    copy = DeviceProfile.from_dict(profile.to_dict())
+    assert copy.reply_format == 'TX'
+    assert copy.capture_string == 'TX:0801'
+
+def test_tracker_one_ver_query(mocker):
+    """
+    Connecting queries VER once and captures as the profile says
+    """
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+    mock_ver = mocker.patch('ndicapy.ndiVER',
+                            return_value = VER_REPLY_SPECTRA)
+    mocker.patch('ndicapy.ndiGetTXFrame', return_value = 1)
+    mocker.patch('ndicapy.ndiGetTXTransform', return_value = 'MISSING')
+    spy = mocker.spy(ndicapy, 'ndiCommand')
+
+    tracker = NDITracker(SETTINGS_POLARIS)
+    assert mock_ver.call_count == 1
+    assert tracker.get_device_profile().firmware == \
+            ' Polaris Spectra Rev 007'
+    tracker.get_frame()
+    assert spy.call_args_list[-1][0][1] == 'TX:0801'
+    tracker.close()
@@ -0,0 +1,158 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of the discovery cache"""
+
+import json
+import pytest
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.discovery_cache import DiscoveryCache, \
+        DeviceDiscovery, network_key, serial_port_key
+
+from tests.polaris_mocks import SETTINGS_POLARIS, patch_polaris, \
+        MockNDIDevice, MockBXFrameSource, mockndiVER
+
+class _Port:
+    """A fake pyserial ListPortInfo"""
+    device = '/dev/ttyUSB0'
+    serial_number = None
+
+def test_cache_round_trip(tmp_path):
+    """
+    Entries are written to disk and read back by a new cache
+    """
+    path = str(tmp_path / 'ndi_cache.json')
+    cache = DiscoveryCache(path)
+    assert cache.get('port:COM3') is None
+
+    cache.put('port:COM3', {'port' : 'COM3', 'capture mode' : 'TX:0801'})
+    entry = DiscoveryCache(path).get('port:COM3')
+    assert entry['port'] == 'COM3'
+    assert entry['capture mode'] == 'TX:0801'
+    assert entry['last connected'] > 0
+
+    cache.remove('port:COM3')
+    assert DiscoveryCache(path).get('port:COM3') is None
+
+def test_cache_bad_file(tmp_path):
+    """
+    A cache file that isn't valid is treated as empty, and replaced
+    """
+    path = tmp_path / 'ndi_cache.json'
+    path.write_text('not json', encoding = 'utf-8')
+    cache = DiscoveryCache(str(path))
+    assert cache.get('port:COM3') is None
+    cache.put('port:COM3', {'port' : 'COM3'})
+    assert json.loads(path.read_text(encoding = 'utf-8'))['version'] == 1
+
+def test_cache_keys():
+    """
+    Serial devices are keyed by USB serial number where available
+    """
+    port = _Port()
+    assert serial_port_key(port) == 'port:/dev/ttyUSB0'
+    port.serial_number = 'A9X12'
+    assert serial_port_key(port) == 'usb:A9X12'
+    assert network_key('192.168.1.5', 8765) == 'ip:192.168.1.5:8765'
+
+def test_device_discovery(tmp_path):
+    """
+    A device found through the cache gets its cached profile, entries
+    for other tracker types are ignored
+    """
+    cache = DiscoveryCache(str(tmp_path / 'ndi_cache.json'))
+    discovery = DeviceDiscovery('vega', cache)
+    discovery.found('ip:10.0.0.2:8765', 8765)
+    discovery.read_profile(lambda: 'Mock for Testing')
+    discovery.profile.reply_format = 'TX'
+    discovery.remember()
+
+    discovery = DeviceDiscovery('vega', cache)
+    entry = discovery.cached_entry('ip:10.0.0.2:8765')
+    discovery.found('ip:10.0.0.2:8765', 8765, entry)
+    assert discovery.read_profile(None).capture_string == 'TX:0801'
+    assert DeviceDiscovery('polaris', cache).cached_entry(
+        'ip:10.0.0.2:8765') is None
+    assert DeviceDiscovery('dummy').read_profile(None).tracker_type == \
+            'dummy'
+
+def test_tracker_uses_cache(mocker, tmp_path):
+    """
+    The first connection searches and fills the cache, the second
+    probes only the cached port and reuses the capture mode
+    """
+    settings = SETTINGS_POLARIS.copy()
+    settings["discovery cache"] = str(tmp_path / 'ndi_cache.json')
+    patch_polaris(mocker, MockBXFrameSource(), MockNDIDevice())
+
+    tracker = NDITracker(settings)
+    tracker.close()
+    entry = DiscoveryCache(settings["discovery cache"]).get('port:good port')
+    assert entry['tracker type'] == 'polaris'
+    assert entry['port'] == 'good port'
+    assert entry['profile']['supports bx']
+
+    mock_ver = mocker.patch('ndicapy.ndiVER', side_effect = mockndiVER)
+    mock_get_tx_frame = mocker.patch('ndicapy.ndiGetTXFrame',
+                                     return_value = 1)
+    mocker.patch('ndicapy.ndiGetTXTransform', return_value = 'MISSING')
+    cache = DiscoveryCache(settings["discovery cache"])
+    entry['profile']['supports bx'] = False
+    cache.put('port:good port', entry)
+    probe = mocker.patch('sksurgerynditracker.nditracker.probe_serial_ports',
+                         return_value = ('good port', []))
+
+    tracker = NDITracker(settings)
+    assert probe.call_count == 1
+    assert probe.call_args[0][0] == ['good port']
+    mock_ver.assert_not_called()
+    tracker.get_frame()
+    mock_get_tx_frame.assert_called()
+    tracker.close()
+
+def test_tracker_cache_miss(mocker, tmp_path):
+    """
+    When the cached port does not answer, all ports are searched
+    """
+    settings = SETTINGS_POLARIS.copy()
+    settings["discovery cache"] = str(tmp_path / 'ndi_cache.json')
+    patch_polaris(mocker, MockBXFrameSource(), MockNDIDevice())
+    DiscoveryCache(settings["discovery cache"]).put(
+        'port:good port', {'tracker type' : 'polaris',
+                           'profile' : {'tracker type' : 'polaris'}})
+    probe = mocker.patch('sksurgerynditracker.nditracker.probe_serial_ports',
+                         side_effect = [(None, []), ('good port', [])])
+    mock_ver = mocker.patch('ndicapy.ndiVER', side_effect = mockndiVER)
+
+    tracker = NDITracker(settings)
+    assert probe.call_count == 2
+    mock_ver.assert_called()
+    tracker.close()
+
+def test_tracker_evicts_stale(mocker, tmp_path):
+    """
+    Cached devices that no longer answer are removed from the cache
+    """
+    settings = SETTINGS_POLARIS.copy()
+    settings["discovery cache"] = str(tmp_path / 'ndi_cache.json')
+    patch_polaris(mocker, MockBXFrameSource(), MockNDIDevice())
+    DiscoveryCache(settings["discovery cache"]).put(
+        'port:good port', {'tracker type' : 'polaris',
+                           'port' : 'good port'})
+    mocker.patch('sksurgerynditracker.nditracker.probe_serial_ports',
+                 return_value = (None, []))
+    with pytest.raises(IOError):
+        NDITracker(settings)
+    assert DiscoveryCache(settings["discovery cache"]).get(
+        'port:good port') is None
+
+    settings.update({"tracker type" : "vega", "ip address" : "127.0.0.1",
+                     "port" : 8765})
+    DiscoveryCache(settings["discovery cache"]).put(
+        network_key("127.0.0.1", 8765), {'tracker type' : 'vega',
+                                         'port' : 8765})
+    mocker.patch('sksurgerynditracker.nditracker.create_connection',
+                 side_effect = OSError('refused'))
+    with pytest.raises(IOError):
+        NDITracker(settings)
+    assert DiscoveryCache(settings["discovery cache"]).get(
+        network_key("127.0.0.1", 8765)) is None
@@ -0,0 +1,174 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of the emulated network tracker,
+driven through the real ndicapy"""
+
+import pickle
+from time import perf_counter, sleep
+import numpy as np
+import pytest
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.frame_decoding import FRAME_DTYPE, STATUS_VALID, \
+        STATUS_MISSING
+from sksurgerynditracker.ndi_protocol import decode_reply, \
+        encode_command, parse_bx_reply
+from sksurgerynditracker.emulator.device import EmulatedDevice, \
+        EmulatedTool, Stationary, Circular, Hidden
+from sksurgerynditracker.emulator.network import NetworkEmulator
+from sksurgerynditracker.emulator.process import EmulatorProcess
+
+ROMFILES = ["data/8700339.rom", "data/something_else.rom"]
+
+def _device(**options):
+    return EmulatedDevice([EmulatedTool(Stationary((10., 20., -900.))),
+                           EmulatedTool(Hidden(Circular(), 0., 1e9))],
+                          **options)
+
+def _execute(device, command):
+    return decode_reply(device.execute(encode_command(command)))
+
+@pytest.fixture(name = "emulator")
+def fixture_emulator(request):
+    """An emulator process, configured by the test's parameters"""
+    options = dict(getattr(request, 'param', {}))
+    latency = options.pop('latency', 0.0)
+    process = EmulatorProcess(NetworkEmulator(_device(**options),
+                                              latency = latency))
+    process.start()
+    yield process
+    process.stop()
+
+def _tracker(emulator, **settings):
+    host, port = emulator.address
+    configuration = {"tracker type" : "vega", "ip address" : host,
+                     "port" : port, "romfiles" : ROMFILES}
+    configuration.update(settings)
+    return NDITracker(configuration)
+
+def test_device_port_handles():
+    """
+    Port handles go through request, initialise and enable
+    """
+    device = _device()
+    assert _execute(device, 'INIT:') == 'OKAY'
+    assert _execute(device, 'PHRQ:*********1****') == '01'
+    assert _execute(device, 'PHSR:02') == '00'
+    assert _execute(device, 'PVWR:010000' + '00' * 64) == 'OKAY'
+    assert _execute(device, 'PHSR:02') == '0101001'
+    assert _execute(device, 'PENA:01D') == 'ERROR0E'
+    assert _execute(device, 'PINIT:01') == 'OKAY'
+    assert _execute(device, 'PHSR:03') == '0101011'
+    assert _execute(device, 'PENA:01D') == 'OKAY'
+    assert _execute(device, 'PHSR:04') == '0101031'
+    assert _execute(device, 'PINIT:07') == 'ERROR08'
+
+def test_device_command_errors():
+    """
+    Bad CRCs, unknown commands and tracking commands before TSTART
+    are answered with errors
+    """
+    device = _device()
+    assert decode_reply(device.execute(b'INIT:0000\r')) == 'ERROR04'
+    assert _execute(device, 'FLY:') == 'ERROR01'
+    assert _execute(device, 'BX:0801') == 'ERROR0C'
+    assert _execute(device, 'TSTART:') == 'OKAY'
+    assert device.is_tracking()
+
+def test_device_bx_reply():
+    """
+    BX replies hold the enabled tools' newest frame
+    """
+    device = _device(frame_rate = 1000.)
+    for command in ['PHRQ:*********1****', 'PHRQ:*********1****',
+                    'PVWR:010000' + '00' * 64, 'PVWR:020000' + '00' * 64,
+                    'PINIT:01', 'PINIT:02', 'PENA:01D', 'PENA:02D',
+                    'TSTART:']:
+        assert _execute(device, command) in ('OKAY', '01', '02')
+
+    frames = np.zeros(2, dtype = FRAME_DTYPE)
+    frames['port_handle'] = [1, 2]
+    parse_bx_reply(device.execute(encode_command('BX:0801')), frames)
+    assert list(frames['status']) == [STATUS_VALID, STATUS_MISSING]
+    assert np.allclose(frames['translation'][0], [10., 20., -900.])
+    assert frames['frame_number'][0] <= device.frame_number()
+
+def test_device_pickles():
+    """
+    Devices can be sent to another process
+    """
+    device = pickle.loads(pickle.dumps(_device()))
+    assert _execute(device, 'PHRQ:*********1****') == '01'
+
+@pytest.mark.parametrize("settings, capture_string", [
+    ({}, 'BX:0801'),
+    ({"firmware" : ' Polaris Vega 008'}, 'TX:0801')])
+def test_emulated_vega(settings, capture_string):
+    """
+    NDITracker connects to and tracks with the emulator, with binary
+    or text replies as the firmware supports
+    """
+    emulator = EmulatorProcess(NetworkEmulator(_device(**settings)))
+    emulator.start()
+    try:
+        tracker = _tracker(emulator)
+        assert tracker.get_device_profile().capture_string == \
+                capture_string
+        assert tracker.get_tool_descriptions() == ([1, 2], ROMFILES)
+        tracker.start_tracking()
+        (port_handles, _time_stamps, frame_numbers, tracking,
+         quality) = tracker.get_frame()
+        assert port_handles == [1, 2]
+        assert frame_numbers[0] > 0
+        assert np.allclose(tracking[0][0:3, 3], [10., 20., -900.])
+        assert np.all(np.isnan(tracking[1][0:3, :]))
+        assert quality[0] == pytest.approx(0.1)
+        tracker.stop_tracking()
+        tracker.close()
+    finally:
+        emulator.stop()
+
+def test_emulated_vega_streaming(emulator):
+    """
+    Streamed frames arrive at the device's frame rate
+    """
+    tracker = _tracker(emulator, **{"vega streaming" : True})
+    tracker.start_tracking()
+    frame_numbers = [tracker.get_frame()[2][0] for _ in range(4)]
+    assert frame_numbers == sorted(set(frame_numbers))
+    tracker.stop_tracking()
+    tracker.close()
+
+@pytest.mark.parametrize("emulator", [{"latency" : 0.01}], indirect = True)
+def test_emulated_vega_latency(emulator):
+    """
+    Every reply is delayed by the emulator's latency
+    """
+    tracker = _tracker(emulator)
+    tracker.start_tracking()
+    start = perf_counter()
+    for _ in range(5):
+        tracker.get_frame()
+    assert perf_counter() - start >= 5 * 0.01
+    tracker.stop_tracking()
+    tracker.close()
+
+def test_emulated_vega_scheduled(emulator):
+    """
+    With poll scheduling the acquisition thread polls about once per
+    frame, rather than polling for the same frame again
+    """
+    tracker = _tracker(emulator, **{"background acquisition" : True,
+                                    "poll scheduling" : True})
+    assert tracker.get_poll_stats()['polls'] == 0
+    tracker.start_tracking()
+    sleep(0.5)
+    start = tracker.get_poll_stats()
+    sleep(1.0)
+    stats = tracker.get_poll_stats()
+    tracker.stop_tracking()
+    polls = stats['polls'] - start['polls']
+    assert stats['frame rate'] == pytest.approx(60.0, abs = 1.0)
+    assert polls < 1.5 * 60
+    assert stats['duplicates avoided'] - start['duplicates avoided'] > polls
+    tracker.close()
+    assert _tracker(emulator).get_poll_stats() is None
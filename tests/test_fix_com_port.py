@@ -11,3 +11,59 @@ def test_fix_com_port():
     assert cp.fix_com_port_greater_than_9('COM1') == 'COM1'
     assert cp.fix_com_port_greater_than_9('/dev/ttyS31') == '/dev/ttyS31'
     assert cp.fix_com_port_greater_than_9('COM10') == '\\\\.\\COM10'
+
+class _Port:
+    """A fake pyserial ListPortInfo"""
+    def __init__(self, device, vid = None, pid = None,
+                 manufacturer = None, description = 'n/a'):
+        self.device = device
+        self.vid = vid
+        self.pid = pid
+        self.manufacturer = manufacturer
+        self.description = description
+
+def test_rank_serial_ports():
+    """
+    NDI ports come first, then NDI adapters, then ports without USB
+    metadata, then other USB devices. Bluetooth ports are skipped.
+    """
+    ports = [_Port('/dev/ttyS0'),
+             _Port('/dev/ttyACM0', 0x2341, 0x0043, 'Arduino'),
+             _Port('/dev/rfcomm0', description = 'Bluetooth serial'),
+             _Port('/dev/ttyUSB0', 0x0403, 0x6001, 'FTDI'),
+             _Port('/dev/ttyUSB1', 0x0403, 0x6001, 'NDI'),
+             _Port('/dev/ttyUSB2', 0x10C4, 0xEA60, 'Silicon Labs')]
+
+    ranked = cp.rank_serial_ports(ports)
+    assert [port.device for _rank, port in ranked] == \
+            ['/dev/ttyUSB1', '/dev/ttyUSB0', '/dev/ttyUSB2',
+             '/dev/ttyS0', '/dev/ttyACM0']
+    assert [rank for rank, _port in ranked] == \
+            [cp.RANK_NDI, cp.RANK_ADAPTER, cp.RANK_ADAPTER,
+             cp.RANK_UNKNOWN, cp.RANK_OTHER_USB]
+
+def test_rank_allow_and_deny():
+    """
+    Allowed USB ids rank as NDI devices, denied ones are skipped
+    """
+    ports = [_Port('/dev/ttyUSB0', 0x0403, 0x6001),
+             _Port('/dev/ttyUSB1', 0x0403, 0x6015),
+             _Port('/dev/ttyACM0', 0x2341, 0x0043)]
+
+    ranked = cp.rank_serial_ports(ports, allow = ['2341'],
+                                  deny = ['0403:6015'])
+    assert [(rank, port.device) for rank, port in ranked] == \
+            [(cp.RANK_NDI, '/dev/ttyACM0'),
+             (cp.RANK_ADAPTER, '/dev/ttyUSB0')]
+
+def test_rank_no_usb_metadata():
+    """
+    Ports without vid or pid attributes are still probed, in order
+    """
+    class _BarePort:
+        """A port with only a device name"""
+        def __init__(self, device):
+            self.device = device
+
+    ranked = cp.rank_serial_ports([_BarePort('COM1'), _BarePort('COM2')])
+    assert [port.device for _rank, port in ranked] == ['COM1', 'COM2']
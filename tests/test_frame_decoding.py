@@ -0,0 +1,174 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests for decoding tracking replies"""
+
+import numpy as np
+import pytest
+from six import int2byte
+from sksurgerycore.baseclasses.tracker import SKSBaseTracker
+from sksurgerycore.algorithms.tracking_smoothing import quaternion_to_matrix
+from sksurgerynditracker.frame_decoding import FrameDecoder, FrameBuffer, \
+        STATUS_VALID, STATUS_MISSING, STATUS_DISABLED, IDENTITY_MATRIX_POSE, \
+        quaternions_to_matrices, matrices_to_quaternions, unsmoothed_frame, \
+        stack_frame
+
+TOOL_DESCRIPTORS = [
+    {"description" : "tool_a", "port handle" : 1,
+     "c_str port handle" : int2byte(1)},
+    {"description" : "tool_b", "port handle" : 2,
+     "c_str port handle" : int2byte(2)},
+    {"description" : "tool_c", "port handle" : 3,
+     "c_str port handle" : int2byte(3)}]
+
+def mock_get_frame(_device, port_handle):
+    """Returns a different frame number for each tool"""
+    return 100 + int.from_bytes(port_handle, byteorder = 'little')
+
+def mock_get_transform(_device, port_handle):
+    """One valid tool, one missing tool and one disabled tool"""
+    ph_int = int.from_bytes(port_handle, byteorder = 'little')
+    if ph_int == 1:
+        return (1., 0., 0., 0., 10., 20., 30., 0.25)
+    if ph_int == 2:
+        return "MISSING"
+    return "DISABLED"
+
+def test_decode():
+    """
+    Checks that the whole reply is decoded into the structured array
+    """
+    decoder = FrameDecoder(TOOL_DESCRIPTORS)
+    assert decoder.port_handles == [1, 2, 3]
+    assert np.all(decoder.frames['status'] == STATUS_MISSING)
+
+    frames = decoder.decode(True, mock_get_frame, mock_get_transform)
+
+    assert frames is decoder.frames
+    assert np.array_equal(frames['port_handle'], [1, 2, 3])
+    assert np.array_equal(frames['frame_number'], [101, 102, 103])
+    assert np.array_equal(frames['status'],
+                          [STATUS_VALID, STATUS_MISSING, STATUS_DISABLED])
+    assert np.array_equal(frames['quaternion'][0], [1., 0., 0., 0.])
+    assert np.array_equal(frames['translation'][0], [10., 20., 30.])
+    assert frames['error'][0] == 0.25
+    assert np.all(np.isnan(frames['quaternion'][1:]))
+    assert np.all(np.isnan(frames['translation'][1:]))
+    assert np.all(np.isnan(frames['error'][1:]))
+
+def test_decode_no_port_handle():
+    """
+    Tools without port handles, as on a dummy tracker, get -1
+    """
+    decoder = FrameDecoder([{"description" : "rom"}])
+    assert decoder.port_handles == [None]
+    assert decoder.frames['port_handle'][0] == -1
+
+def test_frame_buffer_fill():
+    """
+    Checks that a frame buffer is filled in place from decoded frames
+    """
+    decoder = FrameDecoder(TOOL_DESCRIPTORS)
+    frames = decoder.decode(True, mock_get_frame, mock_get_transform)
+    out = FrameBuffer(3)
+    poses = out.poses
+    out.fill(frames, 12.5)
+
+    assert out.poses is poses
+    assert np.array_equal(out.port_handles, [1, 2, 3])
+    assert np.array_equal(out.time_stamps, [12.5, 12.5, 12.5])
+    assert np.array_equal(out.frame_numbers, [101, 102, 103])
+    assert np.array_equal(out.poses[0], [1., 0., 0., 0., 10., 20., 30.])
+    assert np.all(np.isnan(out.poses[1:]))
+    assert out.tracking_quality[0] == 0.25
+    assert np.array_equal(out.status,
+                          [STATUS_VALID, STATUS_MISSING, STATUS_DISABLED])
+
+def test_quaternions_to_matrices():
+    """
+    Converting every tool at once gives the same matrices as converting
+    each tool, with NaN rotation and translation for missing tools
+    """
+    generator = np.random.default_rng(0)
+    quaternions = generator.normal(size = (5, 4))
+    quaternions /= np.linalg.norm(quaternions, axis = 1)[:, None]
+    translations = generator.normal(size = (5, 3))
+    quaternions[3] = np.nan
+    translations[4, 1] = np.nan
+
+    matrices, visible = quaternions_to_matrices(quaternions, translations)
+    assert matrices.shape == (5, 4, 4)
+    assert np.array_equal(visible, [True, True, True, False, False])
+    for index in range(3):
+        assert np.allclose(matrices[index, 0:3, 0:3],
+                           quaternion_to_matrix(quaternions[index]))
+        assert np.array_equal(matrices[index, 0:3, 3], translations[index])
+    assert np.all(np.isnan(matrices[3:, 0:3, :]))
+    assert np.array_equal(matrices[:, 3, :], [[0., 0., 0., 1.]] * 5)
+
+    matrices, visible = quaternions_to_matrices(
+        quaternions, translations, IDENTITY_MATRIX_POSE)
+    assert np.array_equal(matrices[3:], [np.identity(4)] * 2)
+    assert quaternions_to_matrices(np.empty((0, 4)),
+                                   np.empty((0, 3)))[0].shape == (0, 4, 4)
+
+
+class _SmoothingTracker(SKSBaseTracker):
+    """The base tracker's smoothing buffers, to compare against"""
+    def close(self):
+        pass
+    def get_frame(self):
+        pass
+    def get_tool_descriptions(self):
+        pass
+    def start_tracking(self):
+        pass
+    def stop_tracking(self):
+        pass
+
+
+@pytest.mark.parametrize("use_quaternions", [False, True])
+@pytest.mark.parametrize("stacked", [False, True])
+def test_unsmoothed_frame(use_quaternions, stacked):
+    """
+    Without smoothing, the frame matches one passed through a smoothing
+    buffer of one frame
+    """
+    decoder = FrameDecoder(TOOL_DESCRIPTORS)
+    frames = decoder.decode(True, mock_get_frame, mock_get_transform)
+    frames['quaternion'][0] = [0.5, 0.5, -0.5, 0.5]
+    port_handles = decoder.port_handles
+
+    smoothing = _SmoothingTracker({"use quaternions" : use_quaternions})
+    smoothing.add_frame_to_buffer(port_handles, [12.5] * 3,
+        frames['frame_number'].tolist(), frames['quaternion'],
+        frames['translation'], frames['error'].tolist(),
+        rot_is_quaternion = True)
+    expected = smoothing.get_smooth_frame(port_handles)
+    if stacked:
+        expected = stack_frame(expected, use_quaternions)
+
+    frame = unsmoothed_frame(port_handles, 12.5, frames, use_quaternions,
+                             stacked)
+    assert len(frame) == len(expected)
+    assert frame[0:3] == expected[0:3]
+    assert np.allclose(frame[4], expected[4], equal_nan = True)
+    assert np.allclose(np.asarray(frame[3]), np.asarray(expected[3]),
+                       equal_nan = True)
+    if stacked:
+        assert np.array_equal(frame[5], expected[5])
+
+def test_matrices_to_quaternions():
+    """
+    Converting matrices back gives the quaternions they were made from,
+    with a non negative qw
+    """
+    generator = np.random.default_rng(1)
+    quaternions = generator.normal(size = (100, 4))
+    quaternions /= np.linalg.norm(quaternions, axis = 1)[:, None]
+    quaternions[quaternions[:, 0] < 0] *= -1.0
+    quaternions[0] = [0., 1., 0., 0.]
+    matrices, _visible = quaternions_to_matrices(quaternions,
+                                                 np.zeros((100, 3)))
+    assert np.allclose(matrices_to_quaternions(matrices), quaternions)
+    matrices[1] = np.nan
+    assert np.all(np.isnan(matrices_to_quaternions(matrices)[1]))
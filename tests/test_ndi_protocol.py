@@ -0,0 +1,72 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests for NDI message encoding and decoding"""
+
+import pytest
+import numpy as np
+from sksurgerynditracker.frame_decoding import FRAME_DTYPE, \
+        STATUS_VALID, STATUS_MISSING, STATUS_DISABLED
+from sksurgerynditracker.ndi_protocol import crc16, encode_command, \
+        encode_reply, decode_reply, bx_reply_length, parse_bx_reply, \
+        pack_bx_reply
+
+def _make_frames():
+    """Three tools, one valid, one missing and one disabled"""
+    frames = np.zeros(3, dtype = FRAME_DTYPE)
+    frames['port_handle'] = [1, 2, 3]
+    frames['frame_number'] = [500, 500, 0]
+    frames['status'] = [STATUS_VALID, STATUS_MISSING, STATUS_DISABLED]
+    frames['quaternion'][0] = [1., 0., 0., 0.]
+    frames['translation'][0] = [10.5, -20.25, 300.]
+    frames['error'][0] = 0.125
+    return frames
+
+def test_crc():
+    """
+    Checks the CRC against the values ndicapy uses
+    """
+    assert crc16(b'INIT:') == 0xE3A5
+    assert encode_command('INIT:') == b'INIT:E3A5\r'
+    assert encode_command('VER:0') == b'VER:065EE\r'
+    assert encode_command('USTREAM --id=a') == b'USTREAM --id=a\r'
+    assert encode_reply('OKAY') == b'OKAYA896\r'
+    assert encode_reply('RESET') == b'RESETBE6F\r'
+    assert decode_reply(b'OKAYA896\r') == 'OKAY'
+    with pytest.raises(IOError):
+        decode_reply(b'OKAYA897\r')
+
+def test_bx_round_trip():
+    """
+    Packs a BX reply and decodes it again
+    """
+    frames = _make_frames()
+    reply = pack_bx_reply(frames, system_status = 3)
+    assert bx_reply_length(reply) == len(reply)
+
+    decoded = np.zeros(3, dtype = FRAME_DTYPE)
+    decoded['port_handle'] = [3, 2, 1]
+    decoded, system_status = parse_bx_reply(reply, decoded)
+
+    assert system_status == 3
+    assert np.array_equal(decoded['status'],
+                          [STATUS_DISABLED, STATUS_MISSING, STATUS_VALID])
+    assert np.array_equal(decoded['frame_number'][1:], [500, 500])
+    assert np.array_equal(decoded['quaternion'][2], [1., 0., 0., 0.])
+    assert np.array_equal(decoded['translation'][2], [10.5, -20.25, 300.])
+    assert decoded['error'][2] == 0.125
+    assert np.all(np.isnan(decoded['translation'][0:2]))
+
+def test_bx_errors():
+    """
+    Corrupt and truncated replies raise IOError
+    """
+    reply = bytearray(pack_bx_reply(_make_frames()))
+    frames = _make_frames()
+    with pytest.raises(IOError):
+        parse_bx_reply(bytes(reply[:-1]), frames)
+    reply[10] ^= 0xff
+    with pytest.raises(IOError):
+        parse_bx_reply(bytes(reply), frames)
+    reply[0] = 0
+    with pytest.raises(IOError):
+        bx_reply_length(bytes(reply))
@@ -0,0 +1,140 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of the OpenIGTLink server, on loopback"""
+
+import socket
+import struct
+from time import perf_counter, sleep
+import numpy as np
+import pytest
+from sksurgerynditracker.openigtlink import OpenIGTLinkServer, \
+        MessagePacker, crc64, MESSAGE_POSITION, MESSAGE_TRANSFORM
+
+_HEADER = struct.Struct('>H12s20sQQQ')
+
+def _frame(tools = 2, timestamp = 1700000000.25):
+    poses = []
+    for index in range(tools):
+        pose = np.identity(4)
+        pose[0:3, 0:3] = [[0., -1., 0.], [1., 0., 0.], [0., 0., 1.]]
+        pose[0:3, 3] = [index, 20., -300.]
+        poses.append(pose)
+    return (list(range(1, tools + 1)), [timestamp] * tools,
+            [7.] * tools, poses, [0.1] * tools)
+
+def _parse(data):
+    """Splits bytes into (header fields, body) per message, checking
+    each body's CRC"""
+    messages = []
+    while data:
+        header = tuple(field.rstrip(b'\0') if isinstance(field, bytes)
+                       else field
+                       for field in _HEADER.unpack(data[0:_HEADER.size]))
+        end = _HEADER.size + header[4]
+        body = data[_HEADER.size:end]
+        assert header[5] == crc64(body)
+        messages.append((header, struct.unpack(f'>{len(body) // 4}f', body)))
+        data = data[end:]
+    return messages
+
+def _receive(connection, length):
+    data = b''
+    while len(data) < length:
+        data += connection.recv(length - len(data))
+    return data
+
+def test_crc64():
+    """
+    The CRC64 is ECMA-182, as OpenIGTLink uses
+    """
+    assert crc64(b'123456789') == 0x6C40DF5F0B497347
+    assert crc64(b'') == 0
+
+def test_pack_transform():
+    """
+    Transforms are sent rotation column by column, then translation,
+    with the frame's time stamp
+    """
+    packer = MessagePacker(['Pointer', 'Reference'])
+    frame = _frame()
+    frame[3][1][0:3, :] = np.nan
+    messages = _parse(packer.pack(frame))
+    assert len(messages) == 1
+    header, body = messages[0]
+    assert header[0:3] == (1, b'TRANSFORM', b'Pointer')
+    assert header[3] == (1700000000 << 32) + (1 << 30)
+    assert header[4] == 48
+    assert np.allclose(body, [0., 1., 0., -1., 0., 0., 0., 0., 1.,
+                              0., 20., -300.])
+
+def test_pack_position():
+    """
+    Positions are sent as translation then (qx, qy, qz, qw), from
+    matrices or quaternions
+    """
+    packer = MessagePacker(['Pointer'], MESSAGE_POSITION)
+    expected = [0., 20., -300., 0., 0., np.sqrt(0.5), np.sqrt(0.5)]
+    header, body = _parse(packer.pack(_frame(1)))[0]
+    assert header[1] == b'POSITION'
+    assert np.allclose(body, expected)
+
+    quaternion_frame = _frame(1)[0:3] + (
+        [np.array([[np.sqrt(0.5), 0., 0., np.sqrt(0.5), 0., 20., -300.]])],
+        [0.1])
+    assert np.allclose(_parse(packer.pack(quaternion_frame))[0][1], expected)
+    with pytest.raises(ValueError):
+        MessagePacker(['Pointer'], 'STRING')
+
+def test_server_clients():
+    """
+    Every client gets the messages of every tool, named after the
+    tools' descriptions
+    """
+    server = OpenIGTLinkServer([1, 2], ['data/8700339.rom', None], port = 0)
+    assert server.device_names == ['8700339', 'Tool2']
+    address = server.start()
+    clients = [socket.create_connection(address) for _ in range(2)]
+    try:
+        deadline = perf_counter() + 5.0
+        while server.clients < 2 and perf_counter() < deadline:
+            sleep(0.01)
+        assert server.send_frame(_frame()) == 2
+        for client in clients:
+            messages = _parse(_receive(client, 2 * 106))
+            assert [header[2] for header, _body in messages] == \
+                    [b'8700339', b'Tool2']
+    finally:
+        for client in clients:
+            client.close()
+        server.stop()
+
+def test_server_slow_client():
+    """
+    A client that does not read drops frames without holding up
+    sending, or other clients
+    """
+    server = OpenIGTLinkServer(list(range(64)), port = 0,
+                               message_type = MESSAGE_TRANSFORM,
+                               queue_size = 2)
+    address = server.start()
+    stalled = socket.create_connection(address)
+    reader = socket.create_connection(address)
+    try:
+        deadline = perf_counter() + 5.0
+        while server.clients < 2 and perf_counter() < deadline:
+            sleep(0.01)
+        frame = _frame(64)
+        start = perf_counter()
+        for index in range(2000):
+            server.send_frame(frame[0:1] + ([1000. + index] * 64,) + frame[2:])
+        assert perf_counter() - start < 5.0
+        assert server.frames_dropped > 0
+
+        newest = 0
+        while newest < 1000 + 1999:
+            header = _HEADER.unpack(_receive(reader, 64 * 106)[-106:-48])
+            newest = header[3] >> 32
+    finally:
+        stalled.close()
+        reader.close()
+        server.stop()
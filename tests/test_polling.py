@@ -0,0 +1,88 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of getting frames with a FramePoller,
+using a mocked ndicapy"""
+
+import ndicapy
+from sksurgerynditracker.frame_decoding import FrameDecoder
+from sksurgerynditracker.clock_model import ClockModel
+from sksurgerynditracker.polling import FramePoller
+from sksurgerynditracker.reply_format import ReplyFormat
+
+from tests.test_frame_decoding import TOOL_DESCRIPTORS, mock_get_frame, \
+        mock_get_transform
+
+class ListRecorder:
+    """Records frames into a list, or fails to once broken"""
+    def __init__(self):
+        self.path = 'list'
+        self.frames = []
+        self.closed = False
+        self.broken = False
+
+    def record(self, timestamp, frames):
+        """Records a copy of the frames"""
+        if self.broken:
+            raise IOError('Recording to list failed')
+        self.frames.append((timestamp, frames.copy()))
+
+    def close(self):
+        """Notes that the recorder was closed"""
+        self.closed = True
+        if self.broken:
+            raise IOError('Recording to list failed')
+
+def test_poll_device(mocker):
+    """
+    Polling a device sends the capture command of the reply format,
+    decodes the reply, time stamps it with the clock model and
+    records it
+    """
+    command = mocker.patch('ndicapy.ndiCommand')
+    mocker.patch('ndicapy.ndiGetTXFrame', side_effect = mock_get_frame)
+    mocker.patch('ndicapy.ndiGetTXTransform',
+                 side_effect = mock_get_transform)
+    recorder = ListRecorder()
+    poller = FramePoller('device', FrameDecoder(TOOL_DESCRIPTORS),
+                         ReplyFormat('TX:0801'), clock = ClockModel(),
+                         recorder = recorder)
+    timestamp, frames = poller.poll(tracking = True)
+    command.assert_called_once_with('device', 'TX:0801')
+    assert frames['frame_number'].tolist() == [101, 102, 103]
+    assert poller.clock.frames == 1
+    assert recorder.frames[0][0] == timestamp
+    poller.close()
+    assert recorder.closed
+    assert poller.recorder is None
+
+def test_poll_no_device(mocker):
+    """
+    Without a device the decoder's frames are returned, and the reply
+    format is only calibrated when asked to
+    """
+    command = mocker.patch('ndicapy.ndiCommand')
+    decoder = FrameDecoder(TOOL_DESCRIPTORS)
+    poller = FramePoller(None, decoder, ReplyFormat('BX:0801'))
+    _timestamp, frames = poller.poll(tracking = True)
+    assert frames is decoder.frames
+    assert not command.called
+    assert not poller.reply.needs_calibrating()
+    assert poller.reply.get_frame is ndicapy.ndiGetBXFrame
+    assert ReplyFormat('BX:0801', 5).needs_calibrating()
+
+def test_poll_recording_fails(caplog):
+    """
+    When recording fails it is logged and stopped, and polling carries
+    on
+    """
+    recorder = ListRecorder()
+    poller = FramePoller(None, FrameDecoder(TOOL_DESCRIPTORS),
+                         ReplyFormat('BX:0801'), recorder = recorder)
+    poller.poll(tracking = True)
+    recorder.broken = True
+    poller.poll(tracking = True)
+    assert recorder.closed
+    assert poller.recorder is None
+    assert 'Recording to list failed' in caplog.text
+    poller.poll(tracking = True)
+    assert len(recorder.frames) == 1
@@ -0,0 +1,84 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of concurrent serial port probing"""
+
+from threading import Thread
+from time import sleep, perf_counter
+import ndicapy
+from sksurgerynditracker.serial_utils.port_probing import probe_serial_ports
+
+def slow_probe(port_name):
+    """A probe that hangs on some ports and is slow to fail on others"""
+    if port_name.startswith('hang'):
+        sleep(30)
+    if port_name.startswith('good'):
+        return ndicapy.NDI_OKAY
+    sleep(0.5)
+    return ndicapy.NDI_PROBE_FAIL
+
+def failing_probe(_port_name):
+    """A probe that raises"""
+    raise IOError('probe failed')
+
+def test_probe_finds_good_port():
+    """
+    The good port is found without waiting for the hung ports
+    """
+    start = perf_counter()
+    name, timings = probe_serial_ports(['hang 1', 'hang 2', 'good'],
+                                       timeout = 20, workers = 3,
+                                       probe = slow_probe)
+    assert name == 'good'
+    assert perf_counter() - start < 10
+    assert timings[0][0:2] == ('good', ndicapy.NDI_OKAY)
+
+def test_probe_timeout():
+    """
+    Hung probes are terminated after the timeout, and slow failures
+    run concurrently
+    """
+    start = perf_counter()
+    name, timings = probe_serial_ports(['hang', 'bad 1', 'bad 2', 'bad 3'],
+                                       timeout = 2, workers = 4,
+                                       probe = slow_probe)
+    assert name is None
+    assert perf_counter() - start < 10
+    results = {port_name : result for port_name, result, _seconds
+               in timings}
+    assert results == {'hang' : None,
+                       'bad 1' : ndicapy.NDI_PROBE_FAIL,
+                       'bad 2' : ndicapy.NDI_PROBE_FAIL,
+                       'bad 3' : ndicapy.NDI_PROBE_FAIL}
+    hang_seconds = [seconds for port_name, _result, seconds in timings
+                    if port_name == 'hang'][0]
+    assert hang_seconds >= 2
+
+def test_probe_raises():
+    """
+    A probe that raises counts as a failure
+    """
+    name, timings = probe_serial_ports(['port'], probe = failing_probe)
+    assert name is None
+    assert timings[0][0:2] == ('port', None)
+
+def test_probe_sequential():
+    """
+    By default ports are probed in turn, stopping at the first good one
+    """
+    name, timings = probe_serial_ports(['bad', 'good', 'never'],
+                                       probe = slow_probe)
+    assert name == 'good'
+    assert [timing[0:2] for timing in timings] == \
+            [('bad', ndicapy.NDI_PROBE_FAIL), ('good', ndicapy.NDI_OKAY)]
+
+def test_probe_from_thread():
+    """
+    Probes from threads other than the main thread are not run in
+    child processes, so the probe need not be picklable
+    """
+    results = []
+    thread = Thread(target = lambda: results.append(probe_serial_ports(
+        ['port'], workers = 4, probe = lambda _name: ndicapy.NDI_OKAY)))
+    thread.start()
+    thread.join()
+    assert results[0][0] == 'port'
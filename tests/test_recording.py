@@ -0,0 +1,187 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of session recording"""
+
+import numpy as np
+import pytest
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.frame_decoding import FRAME_DTYPE, STATUS_VALID, \
+        STATUS_MISSING
+from sksurgerynditracker.recording import SessionRecorder, SessionReader, \
+        RECORD_DTYPE, DATA_ALIGNMENT, read_session_header
+
+from tests.polaris_mocks import SETTINGS_POLARIS, patch_polaris, \
+        MockNDIDevice, MockBXFrameSource
+
+def _read_records(path, tools):
+    with open(path, 'rb') as session_file:
+        header, offset = read_session_header(session_file)
+    records = np.fromfile(path, dtype = RECORD_DTYPE, offset = offset)
+    return header, offset, records.reshape(-1, tools)
+
+def test_record_frames(tmp_path):
+    """
+    Frames are written as fixed size records after the header, in
+    chunks and on close
+    """
+    path = str(tmp_path / 'session.ndi')
+    recorder = SessionRecorder(path, [10, 11], ['pointer', 'reference'],
+                               chunk_frames = 4)
+    recorder.start()
+
+    frames = np.zeros(2, dtype = FRAME_DTYPE)
+    frames['port_handle'] = [10, 11]
+    frames['status'] = [STATUS_VALID, STATUS_MISSING]
+    frames['quaternion'] = [1., 0., 0., 0.]
+    for frame_number in range(10):
+        frames['frame_number'] = frame_number
+        frames['translation'][0] = [frame_number, 2., 3.]
+        frames['error'] = 0.1
+        recorder.record(100. + frame_number, frames)
+    recorder.close()
+    assert recorder.frames_recorded == 10
+
+    header, offset, records = _read_records(path, 2)
+    assert offset % DATA_ALIGNMENT == 0
+    assert header['port handles'] == [10, 11]
+    assert header['descriptions'] == ['pointer', 'reference']
+    assert records.shape == (10, 2)
+    assert np.array_equal(records['frame_number'][:, 0], np.arange(10))
+    assert np.array_equal(records['timestamp'][:, 1], 100. + np.arange(10))
+    assert np.array_equal(records['pose'][9, 0], [1., 0., 0., 0., 9., 2., 3.])
+    assert np.array_equal(records['status'][0], [STATUS_VALID,
+                                                 STATUS_MISSING])
+    assert np.all(records['quality'] == 0.1)
+
+def test_record_queue_full(tmp_path):
+    """
+    Frames that don't fit in the queue are dropped and counted
+    """
+    path = str(tmp_path / 'session.ndi')
+    recorder = SessionRecorder(path, [10], ['pointer'], queue_size = 2)
+    frames = np.zeros(1, dtype = FRAME_DTYPE)
+    for _ in range(5):
+        recorder.record(100., frames)
+    assert recorder.frames_dropped == 3
+    recorder.start()
+    recorder.close()
+    assert recorder.frames_recorded == 2
+
+def test_not_a_session(tmp_path):
+    """
+    Reading the header of another file raises ValueError
+    """
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'0123456789abcdef')
+    with open(path, 'rb') as session_file:
+        with pytest.raises(ValueError):
+            read_session_header(session_file)
+
+def test_tracker_records(mocker, tmp_path):
+    """
+    Every frame acquired by the tracker is recorded
+    """
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+    settings = SETTINGS_POLARIS.copy()
+    settings["recording file"] = str(tmp_path / 'session.ndi')
+
+    tracker = NDITracker(settings)
+    bxsource.setdevice(ndidevice)
+    tracker.start_tracking()
+    for _ in range(5):
+        tracker.get_frame()
+    tracker.close()
+
+    header, _offset, records = _read_records(settings["recording file"], 2)
+    assert header['metadata']['tracker type'] == 'polaris'
+    assert header['descriptions'] == ['data/something_else.rom',
+                                      'data/8700339.rom']
+    assert records.shape == (5, 2)
+    assert np.array_equal(records['frame_number'][:, 0], np.arange(1, 6))
+    assert np.allclose(records['pose'][4, 0, 4:7], [50., -100., 25.])
+
+def test_tracker_record_fails(mocker, tmp_path):
+    """
+    When writing the recording fails the tracker stops recording and
+    carries on tracking
+    """
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+    settings = SETTINGS_POLARIS.copy()
+    settings["recording file"] = str(tmp_path / 'session.ndi')
+
+    tracker = NDITracker(settings)
+    bxsource.setdevice(ndidevice)
+    tracker.start_tracking()
+    tracker.get_frame()
+    recorder = tracker._poller.recorder # pylint: disable=protected-access
+    recorder._error = OSError('disk full') # pylint: disable=protected-access
+    for _ in range(3):
+        tracker.get_frame()
+    assert tracker._poller.recorder is None # pylint: disable=protected-access
+    tracker.close()
+
+def _record_frames(path, frames, tools = 2):
+    recorder = SessionRecorder(path, list(range(tools)),
+                               [f'tool {tool}' for tool in range(tools)],
+                               chunk_frames = 64)
+    recorder.start()
+    decoded = np.zeros(tools, dtype = FRAME_DTYPE)
+    decoded['status'] = STATUS_VALID
+    for frame in range(frames):
+        decoded['frame_number'] = 10 + 3 * frame
+        decoded['translation'][:, 0] = frame
+        recorder.record(0.5 * frame, decoded)
+    recorder.close()
+
+def test_reader_views(tmp_path):
+    """
+    The reader exposes the file as views, shaped by frame and tool
+    """
+    path = str(tmp_path / 'session.ndi')
+    _record_frames(path, 100, tools = 3)
+
+    reader = SessionReader(path)
+    assert len(reader) == 100
+    assert reader.descriptions == ['tool 0', 'tool 1', 'tool 2']
+    assert reader.poses.shape == (100, 3, 7)
+    assert reader.frame_numbers.shape == (100, 3)
+    assert reader.timestamps.shape == (100,)
+    assert not reader.poses.flags['OWNDATA']
+    assert np.array_equal(reader.poses[:, 2, 4], np.arange(100))
+    assert reader.timestamps[99] == 49.5
+
+@pytest.mark.parametrize("stride", [1, 7, 1024])
+def test_reader_seek(tmp_path, stride):
+    """
+    Frames are found by time and by frame number, whatever the spacing
+    of the index
+    """
+    path = str(tmp_path / 'session.ndi')
+    _record_frames(path, 50)
+    reader = SessionReader(path, index_stride = stride)
+
+    assert reader.find_time(-1.) == 0
+    assert reader.find_time(0.) == 0
+    assert reader.find_time(10.) == 20
+    assert reader.find_time(10.1) == 21
+    assert reader.find_time(100.) == 50
+    assert reader.find_frame_number(10) == 0
+    assert reader.find_frame_number(40) == 10
+    assert reader.find_frame_number(41) == 11
+    assert reader.find_frame_number(1000) == 50
+    assert np.array_equal(reader.between_times(5., 7.)['timestamp'][:, 0],
+                          [5., 5.5, 6., 6.5])
+
+def test_reader_partial_frame(tmp_path):
+    """
+    A frame cut short, e.g. by a crash while recording, is ignored
+    """
+    path = tmp_path / 'session.ndi'
+    _record_frames(str(path), 5)
+    with open(path, 'ab') as session_file:
+        session_file.write(np.zeros(1, dtype = RECORD_DTYPE).tobytes())
+    assert len(SessionReader(str(path))) == 5
@@ -0,0 +1,119 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of the replay tracker"""
+
+from time import perf_counter
+import numpy as np
+import pytest
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.frame_decoding import FRAME_DTYPE, STATUS_VALID, \
+        STATUS_MISSING
+from sksurgerynditracker.recording import SessionRecorder
+
+def _record_session(path, frames = 10, period = 0.02,
+                    zero_first_frame = False):
+    """Records a session with two tools, the second always missing,
+    and a gap in the frame numbers. With zero_first_frame the first
+    tool's frame numbers are 0, as for a tool not seen yet"""
+    recorder = SessionRecorder(path, [1, 2], ['pointer', 'reference'])
+    recorder.start()
+    decoded = np.zeros(2, dtype = FRAME_DTYPE)
+    decoded['port_handle'] = [1, 2]
+    decoded['status'] = [STATUS_VALID, STATUS_MISSING]
+    decoded['quaternion'] = [1., 0., 0., 0.]
+    decoded['quaternion'][1] = np.nan
+    decoded['translation'][1] = np.nan
+    decoded['error'] = [0.2, np.nan]
+    for index in range(frames):
+        decoded['frame_number'] = 100 + 2 * index
+        if zero_first_frame:
+            decoded['frame_number'][0] = 0
+        decoded['translation'][0] = [index, 0., 0.]
+        recorder.record(1000. + index * period, decoded)
+    recorder.close()
+    return path
+
+def _settings(path, **options):
+    settings = {"tracker type" : "replay", "replay file" : path}
+    for key, value in options.items():
+        settings[key.replace('_', ' ')] = value
+    return settings
+
+def test_replay_fast(tmp_path):
+    """
+    A recorded session is played back through get frame
+    """
+    path = _record_session(str(tmp_path / 'session.ndi'))
+    tracker = NDITracker(_settings(path, replay_pacing = 'fast'))
+    assert tracker.get_tool_descriptions() == ([1, 2],
+                                               ['pointer', 'reference'])
+    tracker.start_tracking()
+
+    for index in range(10):
+        (port_handles, time_stamps, frame_numbers, tracking,
+                quality) = tracker.get_frame()
+        assert port_handles == [1, 2]
+        assert time_stamps[0] == pytest.approx(1000. + index * 0.02)
+        assert frame_numbers == [100 + 2 * index] * 2
+        assert np.allclose(tracking[0][0:3, 3], [index, 0., 0.])
+        assert np.all(np.isnan(tracking[1][0:3, :]))
+        assert quality[0] == pytest.approx(0.2)
+
+    with pytest.raises(IOError):
+        tracker.get_frame()
+    tracker.stop_tracking()
+    tracker.close()
+
+def test_replay_loop(tmp_path):
+    """
+    A looping session starts again from the first frame
+    """
+    path = _record_session(str(tmp_path / 'session.ndi'), frames = 3)
+    tracker = NDITracker(_settings(path, replay_pacing = 'fast',
+                                   replay_loop = True))
+    frame_numbers = [tracker.get_frame()[2][0] for _ in range(5)]
+    assert frame_numbers == [100, 102, 104, 100, 102]
+    tracker.close()
+
+@pytest.mark.parametrize("pacing, options, expected", [
+    ('realtime', {}, 9 * 0.02),
+    ('frame number', {"replay frame rate" : 100.}, 18 * 0.01)])
+def test_replay_pacing(tmp_path, pacing, options, expected):
+    """
+    Frames are played with their recorded timing, or by frame number
+    """
+    path = _record_session(str(tmp_path / 'session.ndi'))
+    settings = _settings(path, replay_pacing = pacing)
+    settings.update(options)
+    tracker = NDITracker(settings)
+    start = perf_counter()
+    for _ in range(10):
+        tracker.get_frame()
+    assert perf_counter() - start >= expected * 0.9
+    tracker.close()
+
+def test_replay_first_missing(tmp_path):
+    """
+    Frame number pacing uses the newest frame number of each frame, not
+    that of the first tool, which is 0 while it is not seen
+    """
+    path = _record_session(str(tmp_path / 'session.ndi'),
+                           zero_first_frame = True)
+    settings = _settings(path, replay_pacing = 'frame number',
+                         replay_frame_rate = 100.)
+    tracker = NDITracker(settings)
+    start = perf_counter()
+    for _ in range(10):
+        tracker.get_frame()
+    assert perf_counter() - start >= 18 * 0.01 * 0.9
+    tracker.close()
+
+def test_replay_configuration(tmp_path):
+    """
+    Replay needs a session file and a known pacing
+    """
+    with pytest.raises(KeyError):
+        NDITracker({"tracker type" : "replay"})
+    path = _record_session(str(tmp_path / 'session.ndi'))
+    with pytest.raises(ValueError):
+        NDITracker(_settings(path, replay_pacing = 'slow'))
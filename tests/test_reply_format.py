@@ -0,0 +1,191 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of reply format calibration,
+using a mocked ndicapy"""
+
+from time import sleep
+import pytest
+import numpy as np
+import ndicapy
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.frame_decoding import FRAME_DTYPE, STATUS_VALID, \
+        STATUS_MISSING
+from sksurgerynditracker.reply_format import ReplyFormat, \
+        frames_consistent
+
+from tests.polaris_mocks import SETTINGS_POLARIS, patch_polaris, \
+        MockNDIDevice, MockBXFrameSource
+
+SETTINGS_POLARIS_CALIBRATE = SETTINGS_POLARIS.copy()
+SETTINGS_POLARIS_CALIBRATE["calibrate reply format"] = True
+
+class TXSource:
+    """
+    TX replies following a moving mock polaris's BX replies, holding
+    the frame of the last BX reply
+    """
+    def __init__(self, bxsource, delay = 0.0, offset = 0.0):
+        """
+        :param delay: the time in seconds each transform takes
+        :param offset: added to the x of every translation, so that TX
+            disagrees with BX
+        """
+        self.bxsource = bxsource
+        self.delay = delay
+        self.offset = offset
+
+    def get_frame(self, _device, _port_handle):
+        """Mock of ndiGetTXFrame"""
+        return self.bxsource.bx_frame_count
+
+    def get_transform(self, _device, port_handle):
+        """Mock of ndiGetTXTransform"""
+        sleep(self.delay)
+        position = np.zeros(3)
+        if int.from_bytes(port_handle, byteorder = 'little') == 0:
+            position = self.bxsource.velocity * self.bxsource.bx_frame_count
+        position[0] += self.offset
+        return tuple(np.concatenate((self.bxsource.rotation, position,
+                                     self.bxsource.quality)))
+
+def _tracker(mocker, delay = 0.002, offset = 0.0):
+    """Connects to a moving mock polaris, with TX replies taking delay
+    seconds per tool"""
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+    txsource = TXSource(bxsource, delay, offset)
+    mocker.patch('ndicapy.ndiGetTXFrame', side_effect = txsource.get_frame)
+    mocker.patch('ndicapy.ndiGetTXTransform',
+                 side_effect = txsource.get_transform)
+    tracker = NDITracker(SETTINGS_POLARIS_CALIBRATE)
+    bxsource.setdevice(ndidevice)
+    return tracker
+
+def test_calibrate_picks_bx(mocker):
+    """
+    When both formats agree the faster, BX, is used, with tools moving
+    between frames
+    """
+    tracker = _tracker(mocker)
+    spy = mocker.spy(ndicapy, 'ndiCommand')
+    tracker.start_tracking()
+
+    calibration = tracker.get_reply_calibration()
+    assert calibration['consistent']
+    assert calibration['BX'] < calibration['TX']
+    assert calibration['capture string'] == 'BX:0801'
+    assert tracker.get_device_profile().supports_bx
+    assert tracker.get_device_profile().reply_format == 'BX'
+    commands = [args[0][1] for args in spy.call_args_list]
+    assert commands.count('BX:0801') == 5
+    assert commands.count('TX:0801') == 5
+
+    tracker.get_frame()
+    assert spy.call_args_list[-1][0][1] == 'BX:0801'
+    tracker.stop_tracking()
+    tracker.start_tracking()
+    assert spy.call_args_list[-1][0][1] == 'TSTART:'
+    tracker.close()
+
+def test_calibrate_inconsistent(mocker):
+    """
+    When BX and TX disagree on the same frame TX is used, without the
+    profile recording that BX can't be used
+    """
+    tracker = _tracker(mocker, delay = 0.0, offset = 100.)
+    tracker.start_tracking()
+    calibration = tracker.get_reply_calibration()
+    assert calibration['consistent'] is False
+    assert calibration['capture string'] == 'TX:0801'
+    assert tracker.get_device_profile().supports_bx
+    assert tracker.get_device_profile().reply_format is None
+    tracker.close()
+
+def test_calibrate_picks_tx(mocker):
+    """
+    When both formats agree and TX is faster, TX is used and the
+    profile captures with it from then on
+    """
+    tracker = _tracker(mocker, delay = 0.0)
+    mocker.patch('ndicapy.ndiGetBXTransform',
+                 side_effect = lambda *_args: sleep(0.002) or 'MISSING')
+    mocker.patch('ndicapy.ndiGetTXTransform', return_value = 'MISSING')
+    tracker.start_tracking()
+    calibration = tracker.get_reply_calibration()
+    assert calibration['consistent']
+    assert calibration['capture string'] == 'TX:0801'
+    profile = tracker.get_device_profile()
+    assert profile.supports_bx
+    assert profile.capture_string == 'TX:0801'
+    tracker.close()
+
+def test_calibrate_frames_differ(mocker):
+    """
+    Replies holding different frames are not compared, and the choice
+    is not recorded in the profile
+    """
+    tracker = _tracker(mocker, offset = 100.)
+    mocker.patch('ndicapy.ndiGetTXFrame', return_value = 0)
+    tracker.start_tracking()
+    calibration = tracker.get_reply_calibration()
+    assert calibration['consistent'] is None
+    assert calibration['capture string'] == 'BX:0801'
+    assert tracker.get_device_profile().reply_format is None
+    tracker.close()
+
+def test_calibrate_bx_fails(mocker):
+    """
+    When BX replies can't be decoded TX is used
+    """
+    tracker = _tracker(mocker)
+    mocker.patch('ndicapy.ndiGetBXFrame', side_effect = ValueError)
+    tracker.start_tracking()
+    calibration = tracker.get_reply_calibration()
+    assert calibration['BX'] is None
+    assert calibration['capture string'] == 'TX:0801'
+    assert not tracker.get_device_profile().supports_bx
+    tracker.close()
+
+def test_calibrate_both_fail(mocker):
+    """
+    When neither format can be decoded starting tracking fails
+    """
+    tracker = _tracker(mocker)
+    mocker.patch('ndicapy.ndiGetBXFrame', side_effect = ValueError)
+    mocker.patch('ndicapy.ndiGetTXFrame', side_effect = ValueError)
+    with pytest.raises(IOError):
+        tracker.start_tracking()
+
+def test_frames_consistent():
+    """
+    Frames agree when the same tools are visible, in the same place
+    """
+    first = np.zeros(2, dtype = FRAME_DTYPE)
+    first['status'] = [STATUS_VALID, STATUS_MISSING]
+    first['quaternion'][0] = [1., 0., 0., 0.]
+    first['translation'][1] = np.nan
+    second = first.copy()
+    second['quaternion'][0] = [-1., 0., 0., 0.]
+    second['translation'][0] = [0.5, 0., 0.]
+    assert frames_consistent(first, second)
+
+    second['translation'][0] = [2., 0., 0.]
+    assert not frames_consistent(first, second)
+    second['translation'][0] = [0., 0., 0.]
+    second['status'][1] = STATUS_VALID
+    assert not frames_consistent(first, second)
+
+def test_reply_format_readers():
+    """
+    A reply format reads replies with the ndicapy functions of its
+    capture command, and only needs calibrating when asked to
+    """
+    reply = ReplyFormat('TX:0801')
+    assert reply.get_frame is ndicapy.ndiGetTXFrame
+    assert reply.get_transform is ndicapy.ndiGetTXTransform
+    assert not reply.needs_calibrating()
+    reply.set_capture_string('BX:0801')
+    assert reply.capture_string == 'BX:0801'
+    assert reply.get_frame is ndicapy.ndiGetBXFrame
+    assert ReplyFormat('BX:0801', 5).needs_calibrating()
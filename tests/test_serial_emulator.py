@@ -0,0 +1,114 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of the emulated serial tracker,
+driven through the real ndicapy"""
+
+import os
+from time import perf_counter, sleep
+import numpy as np
+import pytest
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.ndi_protocol import decode_reply, encode_command
+from sksurgerynditracker.emulator.device import EmulatedDevice, \
+        EmulatedTool, Stationary
+from sksurgerynditracker.emulator.process import EmulatorProcess
+
+termios = pytest.importorskip('termios')
+#pylint: disable=wrong-import-position
+from sksurgerynditracker.emulator.serial_port import SerialEmulator
+
+def _aurora():
+    return EmulatedDevice([EmulatedTool(Stationary((1., 2., -300.)),
+                                        wired = True),
+                           EmulatedTool(wired = True)],
+                          frame_rate = 40., firmware = ' AURORA Rev 009')
+
+@pytest.fixture(name = "emulator")
+def fixture_emulator():
+    """An emulated Aurora, on a pseudo terminal in another process"""
+    process = EmulatorProcess(SerialEmulator(_aurora()))
+    process.start()
+    yield process
+    process.stop()
+
+def _open_host_end(name, baud_rate):
+    """Opens the pseudo terminal as a host would, in raw mode"""
+    host = os.open(name, os.O_RDWR | os.O_NOCTTY)
+    attributes = termios.tcgetattr(host)
+    attributes[0:4] = [0, 0, attributes[2], 0]
+    attributes[4] = attributes[5] = baud_rate
+    termios.tcsetattr(host, termios.TCSANOW, attributes)
+    return host
+
+def _read_reply(host):
+    reply = b''
+    while not reply.endswith(b'\r'):
+        reply += os.read(host, 1024)
+    return decode_reply(reply)
+
+def test_serial_aurora(emulator):
+    """
+    NDITracker probes, connects to and tracks the wired tools of an
+    emulated Aurora, with replies taking as long as at 115200 baud
+    """
+    tracker = NDITracker({"tracker type" : "aurora",
+                          "serial port" : emulator.address})
+    assert tracker.get_tool_descriptions() == ([1, 2], [0, 1])
+    tracker.start_tracking()
+    start = perf_counter()
+    (port_handles, _time_stamps, _frame_numbers, tracking,
+     _quality) = tracker.get_frame()
+    elapsed = perf_counter() - start
+    assert port_handles == [1, 2]
+    assert np.allclose(tracking[0][0:3, 3], [1., 2., -300.])
+    reply_bytes = 6 + 1 + 2 * 42 + 2 + 2
+    assert elapsed >= reply_bytes * 10 / 115200
+    tracker.stop_tracking()
+    tracker.close()
+
+def test_serial_hot_plug(emulator):
+    """
+    Tools plugged in are found on connecting, tools unplugged while
+    tracking go missing
+    """
+    assert emulator.call('plug', EmulatedTool(wired = True)) == 3
+    tracker = NDITracker({"tracker type" : "aurora",
+                          "serial port" : emulator.address})
+    assert tracker.get_tool_descriptions()[0] == [1, 2, 3]
+    tracker.start_tracking()
+    emulator.call('unplug', 1)
+    tracking = tracker.get_frame()[3]
+    assert np.all(np.isnan(tracking[0][0:3, :]))
+    assert not np.any(np.isnan(tracking[1]))
+    tracker.stop_tracking()
+    tracker.close()
+    with pytest.raises(KeyError):
+        emulator.call('unplug', 9)
+
+def test_serial_baud_rate():
+    """
+    The device changes baud rate on COMM, and ignores commands sent
+    at any other rate
+    """
+    emulator = SerialEmulator(_aurora())
+    host = _open_host_end(emulator.start(), termios.B9600)
+    try:
+        os.write(host, encode_command('COMM:50000'))
+        assert _read_reply(host) == 'OKAY'
+        assert emulator.device.baud_rate == 115200
+        assert emulator.byte_time() == pytest.approx(10 / 115200)
+
+        os.write(host, encode_command('INIT:'))
+        deadline = perf_counter() + 5.0
+        while emulator.commands_ignored == 0 and perf_counter() < deadline:
+            sleep(0.01)
+        assert emulator.commands_ignored == 1
+
+        attributes = termios.tcgetattr(host)
+        attributes[4] = attributes[5] = termios.B115200
+        termios.tcsetattr(host, termios.TCSADRAIN, attributes)
+        os.write(host, encode_command('INIT:'))
+        assert _read_reply(host) == 'OKAY'
+    finally:
+        os.close(host)
+        emulator.stop()
@@ -0,0 +1,154 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of publishing frames in shared memory"""
+
+import os
+import multiprocessing
+from time import perf_counter
+from multiprocessing import shared_memory
+import numpy as np
+import pytest
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.shared_memory import SharedFramePublisher, \
+        SharedFrameSubscriber
+
+from tests.polaris_mocks import SETTINGS_POLARIS, \
+        SETTINGS_POLARIS_QUAT_STACKED, patch_polaris, \
+        MockNDIDevice, MockBXFrameSource
+
+def _name(suffix):
+    return f'sksndi_test_{os.getpid()}_{suffix}'
+
+def _frame(frame_number):
+    pose = np.identity(4)
+    pose[0:3, 3] = [frame_number, 2., 3.]
+    missing = np.identity(4)
+    missing[0:3, :] = np.nan
+    return ([1, 2], [100. + frame_number] * 2, [float(frame_number)] * 2,
+            [pose, missing], [0.1, np.nan])
+
+@pytest.mark.parametrize("settings", [SETTINGS_POLARIS,
+                                      SETTINGS_POLARIS_QUAT_STACKED])
+def test_publish_tracker_frames(mocker, settings):
+    """
+    A subscriber reads the frames from a tracker as they were published
+    """
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+    tracker = NDITracker(settings)
+    bxsource.setdevice(ndidevice)
+    stacked = settings.get("stacked output", False)
+
+    publisher = SharedFramePublisher(_name('tracker'),
+                                     tracker.get_tool_descriptions()[0],
+                                     tracker.use_quaternions, stacked)
+    try:
+        subscriber = SharedFrameSubscriber(_name('tracker'))
+        assert subscriber.get() == (None, 0)
+        frame = tracker.get_frame()
+        publisher.publish(frame)
+
+        read, sequence = subscriber.get()
+        assert sequence == 1
+        assert read[0:3] == frame[0:3]
+        assert np.array_equal(np.asarray(read[3]), np.asarray(frame[3]))
+        assert read[4] == frame[4]
+        assert len(read) == len(frame)
+        if stacked:
+            assert np.array_equal(read[5], frame[5])
+        subscriber.close()
+    finally:
+        publisher.close()
+    tracker.close()
+
+def test_subscriber_next_frame():
+    """
+    Waiting gets the next frame, skipping frames that were overwritten
+    """
+    publisher = SharedFramePublisher(_name('next'), [1, 2], slots = 3)
+    subscriber = SharedFrameSubscriber(_name('next'), poll_interval = 0.001)
+    with pytest.raises(TimeoutError):
+        subscriber.wait_for_frame(0, timeout = 0.01)
+    publisher.publish(_frame(1))
+    frame, sequence = subscriber.wait_for_frame(0)
+    assert sequence == 1
+    assert frame[2] == [1., 1.]
+    assert np.all(np.isnan(frame[3][1][0:3, :]))
+    assert np.isnan(frame[4][1])
+
+    for frame_number in range(2, 7):
+        publisher.publish(_frame(frame_number))
+    frame, sequence = subscriber.wait_for_frame(1)
+    assert sequence == 4
+    assert frame[3][0][0, 3] == 4.
+    assert subscriber.get()[1] == 6
+    with pytest.raises(ValueError):
+        publisher.publish(([1], [0.], [0.], [np.identity(4)], [0.]))
+    subscriber.close()
+    publisher.close()
+
+def test_subscriber_odd_sequence():
+    """
+    A slot left half written does not stall the subscriber
+    """
+    publisher = SharedFramePublisher(_name('odd'), [1, 2], slots = 2)
+    subscriber = SharedFrameSubscriber(_name('odd'), poll_interval = 0.001)
+    publisher.publish(_frame(1))
+    #frame 2 published while its slot is still being written
+    ring = publisher._ring #pylint: disable=protected-access
+    ring.sequence[1] = 3
+    ring.header['published'] = 2
+    start = perf_counter()
+    with pytest.raises(TimeoutError):
+        subscriber.wait_for_frame(1, timeout = 0.05)
+    assert subscriber.get()[0] is None
+    assert perf_counter() - start < 1.
+    frame, sequence = subscriber.wait_for_frame(0)
+    assert sequence == 1
+    assert frame[3][0][0, 3] == 1.
+    subscriber.close()
+    publisher.close()
+
+def test_subscriber_not_a_ring():
+    """
+    Subscribing to shared memory that is not a frame ring fails
+    """
+    memory = shared_memory.SharedMemory(_name('other'), create = True,
+                                        size = 256)
+    try:
+        with pytest.raises(ValueError):
+            SharedFrameSubscriber(_name('other'))
+    finally:
+        memory.close()
+        memory.unlink()
+    with pytest.raises(FileNotFoundError):
+        SharedFrameSubscriber(_name('other'))
+
+def _subscribe(name, frames, results):
+    """Reads frames in another process, sending back their numbers"""
+    subscriber = SharedFrameSubscriber(name)
+    sequence = 0
+    for _ in range(frames):
+        frame, sequence = subscriber.wait_for_frame(sequence, timeout = 10.)
+        results.put((sequence, frame[2][0], frame[3][0][0, 3]))
+    subscriber.close()
+
+def test_subscriber_process():
+    """
+    Another process reads every frame published
+    """
+    publisher = SharedFramePublisher(_name('process'), [1, 2], slots = 64)
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target = _subscribe,
+                                      args = (_name('process'), 20, results))
+    process.start()
+    try:
+        for frame_number in range(1, 21):
+            publisher.publish(_frame(frame_number))
+        received = [results.get(timeout = 10.) for _ in range(20)]
+        assert received == [(number, float(number), float(number))
+                            for number in range(1, 21)]
+    finally:
+        process.join(10.)
+        publisher.close()
@@ -0,0 +1,204 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of background acquisition,
+using a mocked ndicapy"""
+
+from time import perf_counter, sleep
+import pytest
+import numpy as np
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.acquisition import LatestFrameSlot, \
+        AcquisitionThread, BackgroundAcquisition, PollScheduler
+from sksurgerynditracker.frame_decoding import FrameBuffer
+
+from tests.polaris_mocks import SETTINGS_POLARIS, patch_polaris, \
+        MockNDIDevice, MockBXFrameSource
+
+SETTINGS_POLARIS_BACKGROUND = SETTINGS_POLARIS.copy()
+SETTINGS_POLARIS_BACKGROUND["background acquisition"] = True
+
+def test_background_acquisition(mocker):
+    """
+    Checks that get frame returns frames published by the background
+    thread, and that the thread stops with tracking
+    """
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+
+    tracker = NDITracker(SETTINGS_POLARIS_BACKGROUND)
+    bxsource.setdevice(ndidevice)
+
+    tracker.start_tracking()
+
+    (port_handles, time_stamps, frame_numbers, tracking,
+                tracking_quality) = tracker.get_frame()
+
+    assert len(port_handles) == 2
+    assert len(time_stamps) == 2
+    assert frame_numbers[0] >= 1
+    assert frame_numbers[0] == frame_numbers[1]
+    expected_position = np.array([10., -20., 5.]) * frame_numbers[0]
+    assert np.allclose(expected_position, tracking[0][0:3, 3])
+    assert tracking_quality.count(1.) == 2
+
+    frame, age = tracker.get_latest_frame()
+    assert len(frame) == 5
+    assert age >= 0.0
+
+    tracker.stop_tracking()
+    frames_at_stop = bxsource.bx_frame_count
+    sleep(0.01)
+    assert bxsource.bx_frame_count == frames_at_stop
+
+    #with the thread stopped get frame polls the device again
+    (_port_handles, _time_stamps, frame_numbers, _tracking,
+                _tracking_quality) = tracker.get_frame()
+    assert frame_numbers.count(frames_at_stop + 1) == 2
+
+    tracker.close()
+
+def test_background_error(mocker):
+    """
+    Checks that errors on the acquisition thread are raised by get frame
+    """
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+    mocker.patch('ndicapy.ndiGetBXFrame', side_effect = IOError('lost'))
+
+    tracker = NDITracker(SETTINGS_POLARIS_BACKGROUND)
+    tracker.start_tracking()
+
+    with pytest.raises(IOError, match = 'lost'):
+        tracker.get_frame()
+
+    tracker.stop_tracking()
+    tracker.close()
+
+def test_latest_frame_slot():
+    """
+    Tests the latest frame slot on its own
+    """
+    slot = LatestFrameSlot()
+    frame, age, sequence = slot.get()
+    assert frame is None
+    assert age is None
+    assert sequence == 0
+
+    with pytest.raises(TimeoutError):
+        slot.wait_for_frame(0, timeout = 0.01)
+
+    slot.publish('first')
+    slot.publish('second')
+    frame, age, sequence = slot.wait_for_frame(0)
+    assert frame == 'second'
+    assert age >= 0.0
+    assert sequence == 2
+
+    slot.fail(ValueError('broken'))
+    with pytest.raises(ValueError):
+        slot.get()
+
+def test_acquisition_collaborator():
+    """
+    Background acquisition publishes to its listeners while running,
+    and does nothing unless enabled
+    """
+    calls = []
+    acquisition = BackgroundAcquisition()
+    acquisition.listeners.append(lambda: calls.append(1))
+    acquisition.start(lambda: 'frame')
+    assert acquisition.is_running()
+    frame, age = acquisition.read()
+    acquisition.stop()
+    assert frame == 'frame'
+    assert age >= 0.0
+    assert calls
+    assert not acquisition.is_running()
+
+    disabled = BackgroundAcquisition(enabled = False)
+    disabled.start(lambda: 'frame')
+    assert not disabled.is_running()
+
+def test_failing_listener():
+    """
+    A listener that raises is logged, without stopping the publisher
+    or the other listeners
+    """
+    calls = []
+    def broken():
+        raise RuntimeError('listener broken')
+    slot = LatestFrameSlot([broken, lambda: calls.append(1)])
+    slot.publish('first')
+    slot.publish('second')
+    assert calls == [1, 1]
+    assert slot.get()[0] == 'second'
+
+def test_background_frame_into(mocker):
+    """
+    Checks that get frame into copies the newest frame from the
+    background thread
+    """
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+
+    tracker = NDITracker(SETTINGS_POLARIS_BACKGROUND)
+    bxsource.setdevice(ndidevice)
+    tracker.start_tracking()
+
+    out = tracker.get_frame_into(FrameBuffer(2))
+    assert out.frame_numbers[0] >= 1
+    assert np.allclose(out.poses[0, 4:7],
+                       np.array([10., -20., 5.]) * out.frame_numbers[0])
+
+    tracker.stop_tracking()
+    tracker.close()
+
+def _simulated_device(frame_rate, round_trip):
+    """A device numbering its frames at frame_rate, polled with the
+    given round trip time"""
+    epoch = perf_counter()
+    def poll():
+        sleep(round_trip)
+        return int((perf_counter() - epoch) * frame_rate)
+    return poll
+
+def test_poll_scheduler():
+    """
+    Scheduled polls land just after each new frame, polling each frame
+    about once without missing frames
+    """
+    scheduler = PollScheduler(lambda frame_number: frame_number, 100.0)
+    slot = LatestFrameSlot()
+    frame_numbers = []
+    slot.publish = frame_numbers.append
+    thread = AcquisitionThread(_simulated_device(100.0, 0.001), slot,
+                               scheduler)
+    thread.start()
+    sleep(1.0)
+    thread.stop()
+
+    new_frames = len(set(frame_numbers))
+    assert new_frames >= 0.9 * (frame_numbers[-1] - frame_numbers[0])
+    assert scheduler.polls == len(frame_numbers)
+    assert scheduler.polls < 2 * new_frames + 10
+    assert scheduler.duplicates_avoided > scheduler.polls
+    stats = scheduler.stats()
+    assert stats['frame rate'] == pytest.approx(100.0, abs = 2.0)
+    assert 0.001 <= stats['round trip'] < 0.01
+
+    assert PollScheduler(lambda frame_number: frame_number).delay() == 0.0
+
+def test_poll_scheduling_config():
+    """
+    Poll scheduling can only be configured with background acquisition
+    """
+    settings = {"tracker type" : "dummy", "poll scheduling" : True}
+    with pytest.raises(ValueError):
+        NDITracker(settings)
+    settings["background acquisition"] = True
+    tracker = NDITracker(settings)
+    assert tracker.get_poll_stats()['polls'] == 0
+    assert NDITracker({"tracker type" : "dummy"}).get_poll_stats() is None
@@ -2,14 +2,16 @@
 
 """scikit-surgerynditracker tests using a mocked ndicapy"""
 
+import pytest
 import numpy as np
 from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.frame_decoding import FrameBuffer
 
 from tests.polaris_mocks import SETTINGS_POLARIS, SETTINGS_POLARIS_QUAT, \
         SETTINGS_POLARIS_SMOOTH, SETTINGS_POLARIS_QUAT_SMOOTH, \
         mockndiProbe, \
         mockndiOpen, mockndiGetError, mockComports, \
-        mockndiGetPHSRHandle, mockndiVER, \
+        mockndiGetPHSRHandle, mockndiVER, patch_polaris, \
         MockNDIDevice, MockBXFrameSource
 
 def test_getframe_polaris_mock(mocker):
@@ -313,3 +315,36 @@ def test_getframe_missing_smooth(mocker):
     assert np.all(np.isnan(tracking_quality))
 
     del tracker
+
+def test_getframe_into(mocker):
+    """
+    Checks that get frame into writes into the caller's arrays
+    """
+    tracker = None
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+
+    tracker = NDITracker(SETTINGS_POLARIS_SMOOTH)
+
+    bxsource.setdevice(ndidevice)
+
+    out = FrameBuffer(2)
+    poses = out.poses
+    for frame in range(1, 3):
+        assert tracker.get_frame_into(out) is out
+        assert out.poses is poses
+        assert np.array_equal(out.port_handles, [0, 1])
+        assert np.array_equal(out.frame_numbers, [frame, frame])
+        assert out.time_stamps[0] == out.time_stamps[1]
+        #get frame into is not smoothed
+        assert np.array_equal(out.poses[0],
+                              [1., 0., 0., 0., 10. * frame, -20. * frame,
+                               5. * frame])
+        assert np.array_equal(out.poses[1], [1., 0., 0., 0., 0., 0., 0.])
+        assert np.array_equal(out.tracking_quality, [1., 1.])
+
+    with pytest.raises(ValueError):
+        tracker.get_frame_into(FrameBuffer(3))
+
+    del tracker
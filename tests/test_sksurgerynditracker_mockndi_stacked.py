@@ -0,0 +1,74 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of stacked output, using a mocked ndicapy"""
+
+import numpy as np
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.frame_decoding import stack_tracking
+
+from tests.polaris_mocks import SETTINGS_POLARIS_STACKED, \
+        SETTINGS_POLARIS_QUAT_STACKED, patch_polaris, \
+        MockNDIDevice, MockBXFrameSource
+
+def test_getframe_stacked(mocker):
+    """
+    Checks that stacked output returns one (n_tools, 4, 4) array
+    """
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+
+    tracker = NDITracker(SETTINGS_POLARIS_STACKED)
+    bxsource.setdevice(ndidevice)
+
+    (port_handles, time_stamps, frame_numbers, tracking,
+                tracking_quality, visible) = tracker.get_frame()
+
+    assert len(port_handles) == 2
+    assert len(time_stamps) == 2
+    assert frame_numbers.count(1) == 2
+    assert tracking.shape == (2, 4, 4)
+    assert tracking.flags['C_CONTIGUOUS']
+    expected_tracking = np.array([[[1., 0., 0., 10.],
+                                   [0., 1., 0., -20.],
+                                   [0., 0., 1., 5.],
+                                   [0., 0., 0., 1.]],
+                                  np.identity(4)])
+    assert np.array_equal(expected_tracking, tracking)
+    assert tracking_quality.count(1.) == 2
+    assert np.array_equal(visible, [True, True])
+
+    del tracker
+
+def test_getframe_stacked_missing(mocker):
+    """
+    Checks that stacked quaternion output masks missing tools
+    """
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+    mocker.patch('ndicapy.ndiGetBXTransform',
+            bxsource.mockndiGetBXTransformMissing)
+
+    tracker = NDITracker(SETTINGS_POLARIS_QUAT_STACKED)
+    bxsource.setdevice(ndidevice)
+
+    (_port_handles, _time_stamps, _frame_numbers, tracking,
+                _tracking_quality, visible) = tracker.get_frame()
+
+    assert tracking.shape == (2, 7)
+    assert not np.any(np.isnan(tracking))
+    assert np.array_equal(visible, [False, False])
+    assert np.array_equal(tracking[0], [1., 0., 0., 0., 0., 0., 0.])
+
+    del tracker
+
+def test_stack_no_tools():
+    """
+    Stacking an empty frame gives empty arrays of the right shape
+    """
+    stacked, visible = stack_tracking([])
+    assert stacked.shape == (0, 4, 4)
+    assert visible.shape == (0,)
+    stacked, visible = stack_tracking([], use_quaternions = True)
+    assert stacked.shape == (0, 7)
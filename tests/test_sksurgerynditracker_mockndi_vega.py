@@ -1,6 +1,7 @@
 # coding=utf-8
 
 """scikit-surgerynditracker tests using a mocked ndicapy"""
+import socket
 import pytest
 import ndicapy
 from mock import call
@@ -49,6 +50,7 @@ def test_connect_vega_mock(mocker):
     reqs: 03, 04
     """
     tracker = None
+    mocker.patch('sksurgerynditracker.nditracker.create_connection')
     mocker.patch('ndicapy.ndiOpenNetwork', mockndiOpenNetwork)
     mocker.patch('ndicapy.ndiCommand')
     mocker.patch('ndicapy.ndiGetError', mockndiGetError)
@@ -79,6 +81,7 @@ def test_connect_vega_mock_nodevice(mocker):
     reqs: 03, 04
     """
     tracker = None
+    mocker.patch('sksurgerynditracker.nditracker.create_connection')
     mocker.patch('ndicapy.ndiOpenNetwork', mockndiOpenNetwork_nodevice)
     mocker.patch('ndicapy.ndiCommand')
 
@@ -87,3 +90,39 @@ def test_connect_vega_mock_nodevice(mocker):
 
         tracker = NDITracker(SETTINGS_VEGA)
         del tracker
+
+def test_vega_reachable(mocker):
+    """
+    The device is checked with a TCP connection, and the time taken
+    to connect is available
+    """
+    server = socket.create_server(('127.0.0.1', 0))
+    settings = SETTINGS_VEGA.copy()
+    settings["port"] = server.getsockname()[1]
+    mocker.patch('ndicapy.ndiOpenNetwork', mockndiOpenNetwork)
+    mocker.patch('ndicapy.ndiCommand')
+    mocker.patch('ndicapy.ndiGetError', mockndiGetError)
+    mocker.patch('ndicapy.ndiGetPHSRNumberOfHandles',
+            mockndiGetPHSRNumberOfHandles)
+    mocker.patch('ndicapy.ndiGetPHRQHandle', mockndiGetPHRQHandle)
+    mocker.patch('ndicapy.ndiPVWRFromFile')
+    mocker.patch('ndicapy.ndiVER', mockndiVER)
+
+    tracker = NDITracker(settings)
+    assert tracker.get_connect_latency() >= 0.0
+    server.close()
+
+def test_vega_unreachable(mocker):
+    """
+    Nothing listening on the port raises IOError without trying
+    to open the device
+    """
+    server = socket.create_server(('127.0.0.1', 0))
+    settings = SETTINGS_VEGA.copy()
+    settings["port"] = server.getsockname()[1]
+    server.close()
+    open_network = mocker.patch('ndicapy.ndiOpenNetwork')
+
+    with pytest.raises(IOError, match = 'Could not find a device'):
+        NDITracker(settings)
+    open_network.assert_not_called()
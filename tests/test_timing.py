@@ -0,0 +1,101 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of get frame timing statistics"""
+
+import pytest
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.timing import TimingHistogram, StageTimer, STAGES
+
+from tests.polaris_mocks import SETTINGS_POLARIS, SETTINGS_POLARIS_SMOOTH, \
+        patch_polaris, MockNDIDevice, MockBXFrameSource
+
+def test_histogram_bins():
+    """
+    Durations are counted in power of two bins
+    """
+    histogram = TimingHistogram(bins = 8)
+    for nanoseconds in [0, 1, 2, 3, 4, 1000]:
+        histogram.add(nanoseconds)
+    assert histogram.counts == [1, 1, 2, 1, 0, 0, 0, 1]
+    assert histogram.count == 6
+    assert histogram.minimum == 0
+    assert histogram.maximum == 1000
+
+    stats = histogram.stats()
+    assert stats['mean'] == pytest.approx(1010e-9 / 6)
+    assert stats['p50'] == pytest.approx(4e-9)
+    assert stats['p99'] == pytest.approx(1000e-9)
+    assert stats['histogram'][0] == (1e-9, 1)
+
+    histogram.reset()
+    assert histogram.count == 0
+    assert histogram.stats()['p50'] is None
+
+def test_stage_timer_laps():
+    """
+    Each lap is counted against its stage
+    """
+    timer = StageTimer()
+    mark = timer.start()
+    for stage in STAGES:
+        mark = timer.lap(stage, mark)
+    stats = timer.stats()
+    assert list(stats) == list(STAGES)
+    assert all(stats[stage]['count'] == 1 for stage in STAGES)
+
+def test_tracker_timing_stats(mocker):
+    """
+    With timing stats enabled each stage of get frame is timed
+    """
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+    settings = SETTINGS_POLARIS_SMOOTH.copy()
+    settings["timing stats"] = True
+    tracker = NDITracker(settings)
+    bxsource.setdevice(ndidevice)
+    tracker.start_tracking()
+    for _ in range(5):
+        tracker.get_frame()
+
+    stats = tracker.get_timing_stats(reset = True)
+    for stage in STAGES:
+        assert stats[stage]['count'] == 5
+        assert stats[stage]['max'] >= stats[stage]['min'] > 0
+    assert tracker.get_timing_stats()['decode']['count'] == 0
+    tracker.stop_tracking()
+    tracker.close()
+
+def test_tracker_timing_unsmoothed(mocker):
+    """
+    Without smoothing no time is spent adding to the smoothing buffers,
+    and the conversion of every tool is timed as smoothing
+    """
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+    settings = SETTINGS_POLARIS.copy()
+    settings["timing stats"] = True
+    tracker = NDITracker(settings)
+    bxsource.setdevice(ndidevice)
+    tracker.start_tracking()
+    tracker.get_frame()
+    stats = tracker.get_timing_stats()
+    assert stats['add_frame_to_buffer']['count'] == 0
+    assert stats['get_smooth_frame']['count'] == 1
+    tracker.stop_tracking()
+    tracker.close()
+
+def test_tracker_timing_disabled(mocker):
+    """
+    Timing is off by default
+    """
+    bxsource = MockBXFrameSource()
+    ndidevice = MockNDIDevice()
+    patch_polaris(mocker, bxsource, ndidevice)
+    tracker = NDITracker(SETTINGS_POLARIS)
+    bxsource.setdevice(ndidevice)
+    tracker.start_tracking()
+    tracker.get_frame()
+    assert tracker.get_timing_stats() is None
+    tracker.close()
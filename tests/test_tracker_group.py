@@ -0,0 +1,194 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of tracking with a group of trackers"""
+
+from time import perf_counter, sleep
+import numpy as np
+import pytest
+from sksurgerynditracker.tracker_group import TrackerGroup, \
+        ALIGNMENT_NEAREST, ALIGNMENT_INTERPOLATE
+from sksurgerynditracker.frame_decoding import stack_frame
+from sksurgerynditracker.emulator.device import EmulatedDevice, \
+        EmulatedTool, Stationary
+from sksurgerynditracker.emulator.network import NetworkEmulator
+from sksurgerynditracker.emulator.process import EmulatorProcess
+
+class ScriptedTracker:
+    """
+    Stands in for an NDITracker with one tool, moving along x at
+    1 mm per frame, returning frames taken at the given time stamps
+    """
+    def __init__(self, time_stamps, use_quaternions = False,
+                 stacked = False, delay = 0.0):
+        self.time_stamps = list(time_stamps)
+        self.use_quaternions = use_quaternions
+        self.stacked = stacked
+        self.delay = delay
+        self.frame_number = 0
+        self.closed = False
+
+    def get_frame(self):
+        """The next frame, after the delay"""
+        sleep(self.delay)
+        time_stamp = self.time_stamps.pop(0)
+        self.frame_number += 1
+        if self.use_quaternions:
+            pose = np.array([[1., 0., 0., 0., self.frame_number, 0., 0.]])
+        else:
+            pose = np.identity(4)
+            pose[0, 3] = self.frame_number
+        frame = ([1], [time_stamp], [float(self.frame_number)], [pose],
+                 [0.1])
+        if self.stacked:
+            return stack_frame(frame, self.use_quaternions)
+        return frame
+
+    def get_tool_descriptions(self):
+        """One tool"""
+        return [1], ['tool']
+
+    def start_tracking(self):
+        """Nothing to start"""
+
+    def stop_tracking(self):
+        """Nothing to stop"""
+
+    def close(self):
+        """Marks the tracker closed"""
+        self.closed = True
+
+def test_group_merges_frames():
+    """
+    The group's frame holds every tracker's tools, keyed by name
+    """
+    trackers = {"vega" : ScriptedTracker([1.0]),
+                "aurora" : ScriptedTracker([2.0])}
+    group = TrackerGroup(trackers)
+    assert group.get_tool_descriptions() == ([("vega", 1), ("aurora", 1)],
+                                             ['tool', 'tool'])
+    group.start_tracking()
+    (port_handles, time_stamps, frame_numbers, tracking,
+     quality) = group.get_frame()
+    assert port_handles == [("vega", 1), ("aurora", 1)]
+    assert time_stamps == [1.0, 2.0]
+    assert frame_numbers == [1.0, 1.0]
+    assert np.array_equal(tracking[0][0:3, 3], [1., 0., 0.])
+    assert quality == [0.1, 0.1]
+    group.stop_tracking()
+    group.close()
+    assert all(tracker.closed for tracker in trackers.values())
+
+def test_group_polls_concurrently():
+    """
+    A frame from the group takes as long as the slowest tracker
+    """
+    group = TrackerGroup({name : ScriptedTracker([0.0], delay = 0.2)
+                          for name in ("a", "b", "c")})
+    start = perf_counter()
+    group.get_frame()
+    assert perf_counter() - start < 0.4
+    group.close()
+
+def test_group_nearest_alignment():
+    """
+    With nearest alignment each tracker's frame nearest the oldest of
+    the newest frames is used
+    """
+    group = TrackerGroup({"fast" : ScriptedTracker([1.00, 1.02, 1.06]),
+                          "slow" : ScriptedTracker([1.00, 1.03, 1.03])},
+                         alignment = ALIGNMENT_NEAREST)
+    for _ in range(3):
+        frame = group.get_frame()
+    assert frame[1] == [1.02, 1.03]
+    assert frame[2] == [2.0, 2.0]
+
+@pytest.mark.parametrize("use_quaternions", [False, True])
+def test_group_interpolation(use_quaternions):
+    """
+    With interpolated alignment every tracker's pose is interpolated
+    to the common time stamp
+    """
+    group = TrackerGroup(
+        {"fast" : ScriptedTracker([1.00, 1.02, 1.06], use_quaternions),
+         "slow" : ScriptedTracker([1.00, 1.03, 1.03], use_quaternions)},
+        alignment = ALIGNMENT_INTERPOLATE)
+    for _ in range(3):
+        _port_handles, time_stamps, frame_numbers, tracking, _quality = \
+                group.get_frame()
+    assert time_stamps == pytest.approx([1.03, 1.03])
+    assert frame_numbers == pytest.approx([2.25, 2.0])
+    if use_quaternions:
+        assert tracking[0][0, 4] == pytest.approx(2.25)
+        assert np.allclose(tracking[0][0, 0:4], [1., 0., 0., 0.])
+    else:
+        assert tracking[0][0, 3] == pytest.approx(2.25)
+        assert np.allclose(tracking[0][0:3, 0:3], np.identity(3))
+        assert np.array_equal(tracking[0][3], [0., 0., 0., 1.])
+
+def test_group_stacked_output():
+    """
+    Stacked output from every tracker is merged into one array
+    """
+    group = TrackerGroup({"a" : ScriptedTracker([1.0], stacked = True),
+                          "b" : ScriptedTracker([1.0], stacked = True)})
+    frame = group.get_frame()
+    assert frame[3].shape == (2, 4, 4)
+    assert np.array_equal(frame[5], [True, True])
+
+    group = TrackerGroup({"a" : ScriptedTracker([1.0], stacked = True),
+                          "b" : ScriptedTracker([1.0])})
+    with pytest.raises(ValueError):
+        group.get_frame()
+
+def test_group_bad_configuration():
+    """
+    Groups need trackers that agree on quaternions, and a known alignment
+    """
+    with pytest.raises(ValueError):
+        TrackerGroup({})
+    with pytest.raises(ValueError):
+        TrackerGroup({"a" : ScriptedTracker([])}, alignment = 'latest')
+    trackers = {"a" : ScriptedTracker([]),
+                "b" : ScriptedTracker([], use_quaternions = True)}
+    with pytest.raises(ValueError):
+        TrackerGroup(trackers)
+    assert trackers["a"].closed
+
+def test_group_failed_connection():
+    """
+    When a tracker fails to connect, the others are closed
+    """
+    tracker = ScriptedTracker([])
+    with pytest.raises(KeyError):
+        TrackerGroup({"a" : tracker, "b" : {}})
+    assert tracker.closed
+
+def test_group_emulated_vegas():
+    """
+    A group connects to and tracks with two emulated Vegas at once
+    """
+    emulators = [EmulatorProcess(NetworkEmulator(EmulatedDevice(
+        [EmulatedTool(Stationary((10. * index, 0., -900.)))],
+        frame_rate = frame_rate)))
+                 for index, frame_rate in enumerate((60., 40.))]
+    for emulator in emulators:
+        emulator.start()
+    try:
+        group = TrackerGroup(
+            {name : {"tracker type" : "vega",
+                     "ip address" : emulator.address[0],
+                     "port" : emulator.address[1],
+                     "romfiles" : ["data/8700339.rom"]}
+             for name, emulator in zip(("left", "right"), emulators)},
+            alignment = ALIGNMENT_INTERPOLATE)
+        group.start_tracking()
+        for _ in range(3):
+            (port_handles, _time_stamps, _frame_numbers, tracking,
+             _quality) = group.get_frame()
+        assert port_handles == [("left", 1), ("right", 1)]
+        assert np.allclose(tracking[1][0:3, 3], [10., 0., -900.])
+        group.stop_tracking()
+        group.close()
+    finally:
+        for emulator in emulators:
+            emulator.stop()
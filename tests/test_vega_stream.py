@@ -0,0 +1,200 @@
+# coding=utf-8
+
+"""scikit-surgerynditracker tests of Vega streaming, using a fake Vega
+that streams over a local socket"""
+
+import socket
+import struct
+import threading
+from time import sleep
+
+import pytest
+import numpy as np
+import ndicapy
+from sksurgerynditracker.nditracker import NDITracker
+from sksurgerynditracker.vega_stream import VegaStream
+from sksurgerynditracker.frame_decoding import FRAME_DTYPE, STATUS_VALID
+from sksurgerynditracker.ndi_protocol import BX_START_SEQUENCE, crc16, \
+        encode_reply, pack_bx_reply
+
+class FakeStreamingVega:
+    """
+    Listens on a local port, accepts one STREAM command and pushes
+    a fixed number of BX replies, optionally followed by a corrupt one,
+    then waits for USTREAM
+    """
+    def __init__(self, port_handles, replies = 5, corrupt = False):
+        self._server = socket.create_server(('127.0.0.1', 0))
+        self.port = self._server.getsockname()[1]
+        self.commands = []
+        self.sent = threading.Event()
+        self._frames = np.zeros(len(port_handles), dtype = FRAME_DTYPE)
+        self._frames['port_handle'] = port_handles
+        self._frames['status'] = STATUS_VALID
+        self._frames['quaternion'] = [1., 0., 0., 0.]
+        self._frames['error'] = 0.5
+        self._replies = replies
+        self._corrupt = corrupt
+        self._thread = threading.Thread(target = self._serve, daemon = True)
+        self._thread.start()
+
+    def _serve(self):
+        connection, _address = self._server.accept()
+        with connection:
+            self.commands.append(self._read_command(connection))
+            connection.sendall(encode_reply('OKAY'))
+            for frame_number in range(1, self._replies + 1):
+                self._frames['frame_number'] = frame_number
+                self._frames['translation'] = [frame_number, 0., 0.]
+                connection.sendall(pack_bx_reply(self._frames))
+            if self._corrupt:
+                connection.sendall(_corrupt_bx_reply())
+            self.sent.set()
+            self.commands.append(self._read_command(connection))
+            connection.sendall(encode_reply('OKAY'))
+        self._server.close()
+
+    @staticmethod
+    def _read_command(connection):
+        command = b''
+        while not command.endswith(b'\r'):
+            command += connection.recv(1)
+        return command.decode('ascii')
+
+def _corrupt_bx_reply():
+    """A BX reply with a valid header and CRC, whose one tool's transform
+    is cut short"""
+    body = bytes([1, 1, STATUS_VALID, 0, 0, 0, 0])
+    header = struct.pack('<2sH', BX_START_SEQUENCE, len(body))
+    header += struct.pack('<H', crc16(header))
+    return header + body + struct.pack('<H', crc16(body))
+
+def _template(port_handles):
+    frames = np.zeros(len(port_handles), dtype = FRAME_DTYPE)
+    frames['port_handle'] = port_handles
+    return frames
+
+def test_stream_in_order():
+    """
+    Frames are taken from the queue in the order they were streamed
+    """
+    vega = FakeStreamingVega([10, 11], replies = 3)
+    stream = VegaStream('127.0.0.1', vega.port, _template([10, 11]))
+    stream.start()
+
+    for frame_number in range(1, 4):
+        timestamp, frames = stream.get(timeout = 5)
+        assert timestamp > 0
+        assert np.array_equal(frames['frame_number'],
+                              [frame_number, frame_number])
+        assert np.array_equal(frames['translation'][:, 0],
+                              [frame_number, frame_number])
+        assert np.all(frames['status'] == STATUS_VALID)
+
+    with pytest.raises(TimeoutError):
+        stream.get(timeout = 0.05)
+
+    stream.stop()
+    assert vega.commands[0] == \
+            'STREAM --cmd="BX 0801" --id=sksurgerynditracker\r'
+    assert vega.commands[1] == 'USTREAM --id=sksurgerynditracker\r'
+
+def test_stream_bounded_queue():
+    """
+    When the queue is full the oldest frames are dropped, and get newest
+    returns only the last frame
+    """
+    vega = FakeStreamingVega([1], replies = 10)
+    stream = VegaStream('127.0.0.1', vega.port, _template([1]),
+                        queue_size = 4)
+    stream.start()
+    assert vega.sent.wait(5)
+    while stream.frames_received < 10:
+        sleep(0.01)
+
+    assert stream.frames_dropped == 6
+    _timestamp, frames = stream.get_newest(timeout = 5)
+    assert frames['frame_number'][0] == 10
+    with pytest.raises(TimeoutError):
+        stream.get_newest(timeout = 0.05)
+    stream.stop()
+
+def test_stream_decode_error():
+    """
+    A reply that can't be decoded stops the stream, and getting a frame
+    raises the decoding error
+    """
+    vega = FakeStreamingVega([1], replies = 1, corrupt = True)
+    stream = VegaStream('127.0.0.1', vega.port, _template([1]))
+    stream.start()
+    _timestamp, frames = stream.get(timeout = 5)
+    assert frames['frame_number'][0] == 1
+    with pytest.raises(struct.error):
+        stream.get_newest(timeout = 5)
+    stream.stop()
+
+def _streaming_settings(port):
+    return {"tracker type" : "vega",
+            "ip address" : "127.0.0.1",
+            "port" : port,
+            "romfiles" : ["data/8700339.rom"],
+            "vega streaming" : True}
+
+def _patch_vega(mocker, version = 'Mock for Testing'):
+    """Patches ndicapy so an NDITracker connects to a mock vega"""
+    mocker.patch('sksurgerynditracker.nditracker.create_connection')
+    mocker.patch('ndicapy.ndiOpenNetwork', return_value = True)
+    mocker.patch('ndicapy.ndiCloseNetwork')
+    mocker.patch('ndicapy.ndiCommand')
+    mocker.patch('ndicapy.ndiGetError', return_value = ndicapy.NDI_OKAY)
+    mocker.patch('ndicapy.ndiGetPHSRNumberOfHandles', return_value = 0)
+    mocker.patch('ndicapy.ndiGetPHRQHandle', return_value = 0)
+    mocker.patch('ndicapy.ndiPVWRFromFile')
+    mocker.patch('ndicapy.ndiVER', return_value = version)
+
+def test_tracker_streaming(mocker):
+    """
+    A vega tracker configured for streaming reads its frames from the
+    stream while tracking
+    """
+    vega = FakeStreamingVega([0], replies = 5)
+    _patch_vega(mocker)
+    get_bx_frame = mocker.patch('ndicapy.ndiGetBXFrame')
+
+    tracker = NDITracker(_streaming_settings(vega.port))
+    tracker.start_tracking()
+    assert vega.sent.wait(5)
+    assert vega.commands[0] == \
+            'STREAM --cmd="BX 0801" --id=sksurgerynditracker\r'
+
+    (port_handles, _time_stamps, frame_numbers, tracking,
+            tracking_quality) = tracker.get_frame()
+
+    assert port_handles == [0]
+    assert frame_numbers[0] == 5
+    assert tracking[0][0, 3] == 5.
+    assert tracking_quality[0] == 0.5
+    get_bx_frame.assert_not_called()
+
+    tracker.stop_tracking()
+    tracker.close()
+
+def test_streaming_not_vega():
+    """
+    Streaming can only be configured for a Vega
+    """
+    with pytest.raises(ValueError):
+        NDITracker({"tracker type" : "dummy", "vega streaming" : True})
+
+def test_streaming_tx_only(mocker):
+    """
+    Streaming needs BX replies, so fails on firmware that only has TX
+    replies, and can not be combined with reply format calibration
+    """
+    _patch_vega(mocker, 'Freeze Tag: Polaris Vega 008\n')
+    settings = _streaming_settings(8765)
+    with pytest.raises(ValueError):
+        NDITracker(settings)
+    settings["calibrate reply format"] = True
+    with pytest.raises(ValueError):
+        NDITracker(settings)